@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+安全溯源异步写入引擎
+- 在 asyncio 中并发提交事件，同一事件的图谱写入和日志写入并发执行
+- 写入经 SecurityTracer 完成，与同步路径共用存储抽象（写入别名、文档 ID 策略）、熔断重试、spool 和运行指标
+- 阻塞的驱动调用在线程池中执行，兼容 requirements.txt 固定的 neo4j 4.4 同步驱动，无需 aiohttp
+- 通过信号量限制在途事件数，线程池大小决定同时占用的连接数
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+from loguru import logger
+
+from security_trace import SecurityTracer
+
+class AsyncSecurityTracer:
+    def __init__(self, tracer=None, max_in_flight=200, workers=None, **tracer_kwargs):
+        """
+        :param tracer: 复用的 SecurityTracer，None 表示按 tracer_kwargs 新建（关闭时一并关闭）
+        :param max_in_flight: 同时处理中的最大事件数，超过时 submit 等待
+        :param workers: 执行阻塞写入的线程数，缺省使用 ThreadPoolExecutor 的默认值 min(32, CPU 数 + 4)；
+                        线程只用于包装阻塞调用，吞吐由批量写入和连接池决定，无需与连接池一样大
+        :param tracer_kwargs: 传给 SecurityTracer 的参数（如 edge_mode、metrics、graph_store、event_store）
+        """
+        self._owns_tracer = tracer is None
+        self.tracer = tracer if tracer is not None else SecurityTracer(**tracer_kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="async-tracer")
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+        self._closing = False
+        self.processed = 0
+        self.failed = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def create_attack_path(self, event):
+        """
+        在图存储中创建攻击路径关系
+        :param event: 事件字典，字段要求同 SecurityTracer.create_attack_paths
+        """
+        await self._run(self.tracer.create_attack_paths, [event])
+
+    async def log_security_event(self, event_data):
+        """
+        记录安全事件到事件存储
+        :param event_data: 事件字典
+        """
+        await self._run(self.tracer.log_security_event, event_data)
+
+    async def process_event(self, event):
+        """
+        并发写入图谱和日志，两者都完成后返回
+        :param event: 事件字典
+        """
+        await asyncio.gather(
+            self.create_attack_path(event),
+            self.log_security_event(dict(event))
+        )
+
+    async def submit(self, event):
+        """
+        提交事件后台处理；在途事件数达到上限时等待空位（背压）
+        :param event: 事件字典
+        """
+        if self._closing:
+            raise RuntimeError("AsyncSecurityTracer 正在关闭，不再接受新事件")
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process_slot(event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process_slot(self, event):
+        try:
+            await self.process_event(event)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"处理事件时出错: {str(e)}")
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        """等待所有在途事件处理完成"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    async def close(self):
+        """停止接收新事件，排空在途事件后关闭线程池（以及自建的 SecurityTracer）"""
+        if self._closing:
+            return
+        self._closing = True
+        try:
+            await self.drain()
+        finally:
+            self._executor.shutdown(wait=True)
+            if self._owns_tracer:
+                self.tracer.close()
+
+async def replay(events, **kwargs):
+    """
+    并发写入一批事件
+    :param events: 事件可迭代对象
+    :param kwargs: 传给 AsyncSecurityTracer 的参数
+    :return: 成功和失败的事件数
+    """
+    async with AsyncSecurityTracer(**kwargs) as tracer:
+        for event in events:
+            await tracer.submit(event)
+    return {"processed": tracer.processed, "failed": tracer.failed}
+
+def main():
+    try:
+        with open('data/advanced_attack_events.json', 'r') as f:
+            events = json.load(f)
+    except FileNotFoundError:
+        print("高级攻击事件数据文件未找到")
+        return
+    print("异步写入汇总:", asyncio.run(replay(events)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+进程内攻击图缓存
+- IP 和攻击类型都编码为整数，边数据保存在 array 中（源、目标、时间戳、类型编码）
+- 与 create_attack_path 使用相同的事件增量更新
+- 本地回答反向可达和 k 跳路径查询，Neo4j 仍是权威数据源
+- 按时间窗口和边数上限淘汰旧边，内存有界
+- 写入（create_attack_paths 可能在多个线程中调用）、淘汰和查询由同一把可重入锁串行化
+"""
+
+from array import array
+from collections import defaultdict
+import datetime
+import functools
+import threading
+import time
+
+def to_epoch(timestamp):
+    """将 ISO 时间字符串、datetime 或数字转换为秒级时间戳"""
+    if timestamp is None:
+        return time.time()
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.timestamp()
+    return datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+def _to_iso(epoch):
+    return datetime.datetime.fromtimestamp(epoch).isoformat()
+
+def _synchronized(method):
+    """在实例锁内执行方法：evict 会整体替换数组和索引，读者不能看到重建到一半的状态"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class AttackGraphCache:
+    def __init__(self, window_seconds=24 * 3600, max_edges=1_000_000, authoritative_since=None,
+                 bucket_seconds=None):
+        """
+        :param window_seconds: 保留最近多长时间的边（秒），按最新边的时间计算
+        :param max_edges: 边数上限，超过时先按时间窗口淘汰，仍超出则淘汰最旧的边
+        :param authoritative_since: 从该时间（秒级时间戳）起缓存包含全部边，默认取创建时间
+        :param bucket_seconds: 设置后按 (攻击源, 目标, 攻击类型, 时间桶) 合并平行边，边的时间取桶内最早时间，
+                               与图存储的 aggregate 边模式一致；None 表示每个事件一条边
+        """
+        self.window_seconds = window_seconds
+        self.max_edges = max_edges
+        self.bucket_seconds = bucket_seconds
+        self.authoritative_since = time.time() if authoritative_since is None else authoritative_since
+        self._type_ids = {}
+        self._type_names = []
+        # 早于时间窗口、未加入缓存的迟到边数
+        self.late_edges = 0
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._ip_ids = {}
+        self._ips = []
+        self._src = array("i")
+        self._dst = array("i")
+        self._ts = array("d")
+        self._type = array("H")
+        # 入边索引：目标节点编号 -> 边编号数组，用于从目标反向扩展
+        self._incoming = defaultdict(lambda: array("i"))
+        # 合并模式下 (源, 目标, 类型编码, 时间桶) -> 边编号
+        self._edge_keys = {}
+        self._latest = float("-inf")
+        self._earliest = float("inf")
+
+    @_synchronized
+    def __len__(self):
+        return len(self._src)
+
+    def _intern_ip(self, ip):
+        node = self._ip_ids.get(ip)
+        if node is None:
+            node = self._ip_ids[ip] = len(self._ips)
+            self._ips.append(ip)
+        return node
+
+    def _intern_type(self, attack_type):
+        code = self._type_ids.get(attack_type)
+        if code is None:
+            code = self._type_ids[attack_type] = len(self._type_names)
+            self._type_names.append(attack_type)
+        return code
+
+    def _append(self, src, dst, ts, code, bucket=None):
+        if bucket is None and self.bucket_seconds:
+            bucket = int(ts // self.bucket_seconds)
+        if bucket is not None:
+            key = (src, dst, code, bucket)
+            edge = self._edge_keys.get(key)
+            if edge is not None:
+                # 同一时间桶内的平行边合并为一条，时间取最早（同 first_seen）
+                if ts < self._ts[edge]:
+                    self._ts[edge] = ts
+                    self._earliest = min(self._earliest, ts)
+                return
+            self._edge_keys[key] = len(self._src)
+        edge = len(self._src)
+        self._src.append(src)
+        self._dst.append(dst)
+        self._ts.append(ts)
+        self._type.append(code)
+        self._incoming[dst].append(edge)
+        if ts > self._latest:
+            self._latest = ts
+        if ts < self._earliest:
+            self._earliest = ts
+
+    @_synchronized
+    def add_edge(self, source_ip, target_ip, attack_type, timestamp=None, bucket=None):
+        """
+        增量加入一条攻击边
+        早于时间窗口（最新边时间 - window_seconds）的迟到边不加入缓存，只计入 late_edges，
+        并把 authoritative_since 推到窗口起点，之后覆盖该时间的查询回落到图存储
+        :param timestamp: ISO 时间字符串、datetime 或秒级时间戳，缺省为当前时间
+        :param bucket: 合并用的时间桶标识，给定时与同桶的平行边合并；缺省按 bucket_seconds 计算
+        :return: 是否加入缓存（合并到已有边也返回 True）
+        """
+        ts = to_epoch(timestamp)
+        window_start = self._latest - self.window_seconds
+        if ts < window_start:
+            # 迟到边加入后会在下次压缩时立即淘汰；乱序回放时每条迟到边都会触发一次全量重建
+            self.late_edges += 1
+            self.authoritative_since = max(self.authoritative_since, window_start)
+            return False
+        self._append(self._intern_ip(source_ip), self._intern_ip(target_ip), ts, self._intern_type(attack_type), bucket)
+        # 时间跨度超出窗口 10% 以上或边数超限时压缩一次：压缩后跨度不超过窗口、边数不超过上限的 90%，
+        # 下次压缩前至少还要加入 10% 的新边，重建代价可摊还
+        if (len(self._src) > self.max_edges
+                or self._latest - self._earliest > self.window_seconds * 1.1):
+            self.evict()
+        return True
+
+    @_synchronized
+    def add_events(self, events):
+        """
+        批量加入事件，字段要求同 SecurityTracer.create_attack_paths；
+        也接受聚合边（时间取 first_seen）
+        """
+        for event in events:
+            self.add_edge(event["source_ip"], event["target_ip"],
+                          event.get("attack_type") or event.get("event_type"),
+                          event.get("timestamp") or event.get("@timestamp") or event.get("first_seen"))
+
+    @_synchronized
+    def evict(self, now=None):
+        """
+        淘汰时间窗口之外的边；仍超过边数上限时淘汰最旧的边
+        通过重建数组和索引完成压缩，摊还到每条边的代价为 O(1)
+        :param now: 窗口的参考时间，默认取最新边的时间
+        :return: 淘汰的边数
+        """
+        reference = self._latest if now is None else now
+        cutoff = reference - self.window_seconds
+        keep = [edge for edge in range(len(self._src)) if self._ts[edge] >= cutoff]
+        # 保留到上限的 90%，避免每次新增都触发压缩
+        limit = int(self.max_edges * 0.9)
+        if len(keep) > limit:
+            keep.sort(key=self._ts.__getitem__)
+            cutoff = self._ts[keep[len(keep) - limit]]
+            keep = sorted(keep[len(keep) - limit:])
+        evicted = len(self._src) - len(keep)
+        if evicted:
+            ips, src, dst, ts, types = self._ips, self._src, self._dst, self._ts, self._type
+            buckets = {edge: key[3] for key, edge in self._edge_keys.items()}
+            self._reset()
+            for edge in keep:
+                self._append(self._intern_ip(ips[src[edge]]), self._intern_ip(ips[dst[edge]]),
+                             ts[edge], types[edge], buckets.get(edge))
+            self.authoritative_since = max(self.authoritative_since, cutoff)
+        return evicted
+
+    def covers(self, since):
+        """
+        判断缓存是否包含 since 之后的全部边
+        :param since: ISO 时间字符串或秒级时间戳
+        """
+        return since is not None and to_epoch(since) >= self.authoritative_since
+
+    def _edge_allowed(self, edge, type_codes, since, until):
+        if type_codes is not None and self._type[edge] not in type_codes:
+            return False
+        ts = self._ts[edge]
+        return (since is None or ts >= since) and (until is None or ts <= until)
+
+    @_synchronized
+    def reverse_reachable(self, target_ip, max_hops=5, since=None, until=None, attack_types=None):
+        """
+        反向可达查询：找出 max_hops 跳内能到达目标的所有攻击源
+        :return: {IP: 最少跳数}
+        """
+        target = self._ip_ids.get(target_ip)
+        if target is None:
+            return {}
+        type_codes = self._type_codes(attack_types)
+        since = None if since is None else to_epoch(since)
+        until = None if until is None else to_epoch(until)
+        depth = {target: 0}
+        frontier = [target]
+        for hop in range(1, max_hops + 1):
+            next_frontier = []
+            for node in frontier:
+                for edge in self._incoming.get(node, ()):
+                    source = self._src[edge]
+                    if source not in depth and self._edge_allowed(edge, type_codes, since, until):
+                        depth[source] = hop
+                        next_frontier.append(source)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return {self._ips[node]: hops for node, hops in depth.items() if node != target}
+
+    def _type_codes(self, attack_types):
+        if not attack_types:
+            return None
+        return {self._type_ids[name] for name in attack_types if name in self._type_ids}
+
+    @_synchronized
+    def trace_paths(self, target_ip, max_hops=5, mode="all", time_ordered=False, attack_types=None,
+                    since=None, until=None, limit=100, distinct_hops=False):
+        """
+        本地 k 跳路径查询，参数和返回结构与 SecurityTracer.trace_attack_path 相同
+        按跳数逐层从目标反向扩展，路径数达到 limit 即停止
+        关系中的时间戳统一输出为本地时间的 ISO 字符串
+        """
+        if mode not in ("all", "shortest"):
+            raise ValueError(f"不支持的追踪模式: {mode}")
+        target = self._ip_ids.get(target_ip)
+        if target is None:
+            return []
+        type_codes = self._type_codes(attack_types)
+        since = None if since is None else to_epoch(since)
+        until = None if until is None else to_epoch(until)
+
+        paths = []
+        reached = {target}
+        # 部分路径：(节点序列, 边序列)，均为从当前起点到目标的顺序
+        frontier = [((target,), ())]
+        for _ in range(max_hops):
+            next_frontier = []
+            for nodes, edges in frontier:
+                head = nodes[0]
+                later_ts = self._ts[edges[0]] if edges else None
+                candidates = {}
+                for edge in self._incoming.get(head, ()):
+                    source = self._src[edge]
+                    if source in nodes or not self._edge_allowed(edge, type_codes, since, until):
+                        continue
+                    if mode == "shortest" and source in reached:
+                        continue
+                    if time_ordered and later_ts is not None and self._ts[edge] > later_ts:
+                        continue
+                    if distinct_hops:
+                        # 平行边只保留时间最晚的一条，为更早的跳数留出最大的时间余量
+                        best = candidates.get(source)
+                        if best is None or self._ts[edge] > self._ts[best]:
+                            candidates[source] = edge
+                    else:
+                        candidates.setdefault(source, []).append(edge)
+                for source, chosen in candidates.items():
+                    for edge in (chosen,) if distinct_hops else chosen:
+                        path = ((source,) + nodes, (edge,) + edges)
+                        paths.append(path)
+                        if len(paths) >= limit:
+                            return [self._render(*path) for path in paths]
+                        next_frontier.append(path)
+                    if mode == "shortest":
+                        reached.add(source)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return [self._render(*path) for path in paths]
+
+    def iter_edges(self, since=None):
+        """
+        按加入顺序遍历缓存中的边
+        :param since: 只返回该时间之后的边（ISO 时间字符串或秒级时间戳）
+        :return: 生成器，产出 {"source_ip", "target_ip", "attack_type", "timestamp"}
+        """
+        since = None if since is None else to_epoch(since)
+        # 在锁内取快照，迭代期间不持有锁，也不受并发淘汰影响
+        with self._lock:
+            ips, src, dst, ts, types = self._ips, self._src, self._dst, self._ts, self._type
+            count = len(src)
+        for edge in range(count):
+            if since is None or ts[edge] >= since:
+                yield {
+                    "source_ip": ips[src[edge]],
+                    "target_ip": ips[dst[edge]],
+                    "attack_type": self._type_names[types[edge]],
+                    "timestamp": _to_iso(ts[edge])
+                }
+
+    def _render(self, nodes, edges):
+        return {
+            "nodes": [{"ip": self._ips[node]} for node in nodes],
+            "relationships": [
+                {"type": self._type_names[self._type[edge]], "timestamp": _to_iso(self._ts[edge])}
+                for edge in edges
+            ]
+        }
+
+    @_synchronized
+    def stats(self):
+        """缓存规模统计"""
+        return {
+            "nodes": len(self._ips),
+            "edges": len(self._src),
+            "attack_types": len(self._type_names),
+            "authoritative_since": _to_iso(self.authoritative_since),
+            "late_edges": self.late_edges,
+            "edge_bytes": sum(a.itemsize * len(a) for a in (self._src, self._dst, self._ts, self._type))
+        }
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+SecurityTracer 基准测试
+- 按生成器的攻击活动模型构造不同形状的合成攻击图：
+  star（DDoS 星型）、chain（横向移动长链）、mesh（稠密网状）
+- 随图规模增长测量写入吞吐和查询延迟百分位
+- 后端可插拔：memory（SecurityTracer + 内存存储，离线运行）、live（真实 Neo4j/Elasticsearch）
+- 结果输出为 JSON，便于在不同提交之间对比
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import random
+import subprocess
+import time
+
+from generate_test_events import ATTACK_TYPES, SEVERITY_LEVELS, TARGET_SERVERS, build_attack_sources
+from security_trace import SecurityTracer
+
+# 合成事件时间的起点，与分片生成模式保持一致
+BENCHMARK_START = datetime.datetime(2024, 1, 1)
+
+# live 后端的事件写入别名：与 security-events-* 查询匹配，每个用例开始前删除其滚动索引
+BENCHMARK_EVENTS_ALIAS = "security-events-benchmark"
+
+# 多跳攻击链依次使用的攻击类型
+CHAIN_ATTACK_TYPES = ["PHISHING", "LATERAL_MOVEMENT", "PRIVILEGE_ESCALATION", "LATERAL_MOVEMENT",
+                      "DATA_EXFILTRATION"]
+
+def _event(source_ip, target_ip, attack_type, severity, seconds):
+    timestamp = (BENCHMARK_START + datetime.timedelta(seconds=seconds)).isoformat()
+    return {
+        "@timestamp": timestamp,
+        "timestamp": timestamp,
+        "event_type": attack_type,
+        "source_ip": source_ip,
+        "target_ip": target_ip,
+        "severity": severity,
+        "details": f"基准测试 {attack_type} 事件"
+    }
+
+def _target_hosts():
+    return [ip for servers in TARGET_SERVERS.values() for ip in servers]
+
+def build_star(edges, rng):
+    """
+    DDoS 星型：大量攻击源持续攻击少数 Web/认证服务器
+    :return: (事件列表, 查询目标列表)
+    """
+    targets = TARGET_SERVERS["web_servers"][:2] + TARGET_SERVERS["auth_servers"][:1]
+    sources = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+               for _ in range(max(1, edges // 20))]
+    events = [_event(rng.choice(sources), rng.choice(targets), "DDoS",
+                     rng.choice(["HIGH", "CRITICAL"]), i) for i in range(edges)]
+    return events, targets
+
+def build_chain(edges, rng, length=8):
+    """
+    横向移动长链：每个攻击活动从外部攻击源出发，依次攻陷 length 台内部主机
+    :return: (事件列表, 查询目标列表)
+    """
+    sources = build_attack_sources(rng)
+    hosts = _target_hosts()
+    events = []
+    tails = []
+    clock = 0
+    while len(events) < edges:
+        chain = [rng.choice(sources)] + [f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+                                         for _ in range(length - 1)] + [rng.choice(hosts)]
+        for hop, (source_ip, target_ip) in enumerate(zip(chain, chain[1:])):
+            attack_type = CHAIN_ATTACK_TYPES[min(hop, len(CHAIN_ATTACK_TYPES) - 1)]
+            events.append(_event(source_ip, target_ip, attack_type, rng.choice(SEVERITY_LEVELS), clock))
+            clock += 1
+            if len(events) >= edges:
+                break
+        tails.append(chain[-1])
+    return events, sorted(set(tails))
+
+def build_mesh(edges, rng, hosts=200):
+    """
+    稠密网状：固定数量的主机之间随机互相攻击，包含大量环路
+    :return: (事件列表, 查询目标列表)
+    """
+    nodes = [f"172.16.{i // 250}.{i % 250 + 1}" for i in range(hosts)]
+    events = []
+    for i in range(edges):
+        source_ip, target_ip = rng.sample(nodes, 2)
+        events.append(_event(source_ip, target_ip, rng.choice(ATTACK_TYPES), rng.choice(SEVERITY_LEVELS), i))
+    return events, nodes
+
+SHAPES = {
+    "star": build_star,
+    "chain": build_chain,
+    "mesh": build_mesh
+}
+
+class TracerBackend:
+    """基准测试用到的 SecurityTracer 接口，由子类决定追踪器使用的存储"""
+
+    def __init__(self):
+        self.tracer = self._create_tracer()
+
+    def _create_tracer(self):
+        raise NotImplementedError
+
+    def create_attack_paths(self, events, batch_size=500, max_linger=1.0):
+        return self.tracer.create_attack_paths(events, batch_size=batch_size, max_linger=max_linger)
+
+    def log_security_events(self, events, **kwargs):
+        summary = self.tracer.log_security_events(events, **kwargs)
+        self.tracer.event_store.refresh()
+        return summary
+
+    def trace_attack_path(self, target_ip, **kwargs):
+        return self.tracer.trace_attack_path(target_ip, **kwargs)
+
+    def get_related_events(self, ip_address, time_range="1d"):
+        # 合成事件的时间在过去，查询范围需要覆盖到基准起点
+        return self.tracer.get_related_events(ip_address, time_range="36500d")
+
+    def close(self):
+        self.tracer.close()
+
+class InMemoryTracerBackend(TracerBackend):
+    """
+    内存后端：SecurityTracer 使用内存图存储和事件存储，无需任何外部服务
+    图谱查询由入边邻接索引回答，相关事件由按源 IP 的倒排索引回答
+    """
+
+    def _create_tracer(self):
+        return SecurityTracer.in_memory()
+
+    def reset(self):
+        self.tracer.close()
+        self.tracer = self._create_tracer()
+
+class LiveTracerBackend(TracerBackend):
+    """
+    真实后端：写入并查询 Neo4j/Elasticsearch
+    事件写入单独的别名 BENCHMARK_EVENTS_ALIAS；每个用例开始前清空图谱中的 Server 节点并删除该别名下的索引，
+    各用例的相关事件查询都从空索引开始，结果可以相互比较
+    """
+
+    def _create_tracer(self):
+        tracer = SecurityTracer()
+        tracer.ensure_schema()
+        tracer.ensure_event_indices(BENCHMARK_EVENTS_ALIAS)
+        return tracer
+
+    def reset(self):
+        with self.tracer.neo4j_driver.session() as session:
+            session.run("MATCH (n:Server) CALL { WITH n DETACH DELETE n } IN TRANSACTIONS").consume()
+        self.tracer.event_store.client.indices.delete(index=f"{BENCHMARK_EVENTS_ALIAS}-rollover-*",
+                                                      ignore_unavailable=True)
+        # 重建 SecurityTracer：重新创建写入别名，并丢弃上一个用例的图缓存和查询结果缓存
+        self.tracer.close()
+        self.tracer = self._create_tracer()
+
+BACKENDS = {
+    "memory": InMemoryTracerBackend,
+    "live": LiveTracerBackend
+}
+
+def percentiles(samples_ms):
+    """返回毫秒延迟样本的 p50/p95/p99/max"""
+    if not samples_ms:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples_ms)
+
+    def pick(pct):
+        return round(ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))], 3)
+
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "max": round(ordered[-1], 3)}
+
+def _time_queries(fn, targets, queries, rng):
+    samples = []
+    for _ in range(queries):
+        target = rng.choice(targets)
+        started = time.perf_counter()
+        fn(target)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+def run_case(backend, shape, edges, queries, batch_size, max_hops, seed):
+    """
+    构造一个规模的合成图并测量写入和查询
+    :return: 单个用例的结果字典
+    """
+    rng = random.Random(f"{seed}:{shape}:{edges}")
+    events, targets = SHAPES[shape](edges, rng)
+    backend.reset()
+
+    started = time.perf_counter()
+    backend.create_attack_paths(iter(events), batch_size=batch_size)
+    graph_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    backend.log_security_events(dict(event) for event in events)
+    log_elapsed = time.perf_counter() - started
+
+    sources = sorted({event["source_ip"] for event in events})
+    return {
+        "shape": shape,
+        "edges": len(events),
+        "ingest": {
+            "create_attack_paths_eps": round(len(events) / graph_elapsed, 1) if graph_elapsed > 0 else None,
+            "log_security_events_eps": round(len(events) / log_elapsed, 1) if log_elapsed > 0 else None
+        },
+        "query_ms": {
+            "trace_attack_path": _time_queries(
+                lambda ip: backend.trace_attack_path(ip, max_hops=max_hops), targets, queries, rng),
+            "trace_attack_path_shortest": _time_queries(
+                lambda ip: backend.trace_attack_path(ip, max_hops=max_hops, mode="shortest"), targets, queries, rng),
+            "get_related_events": _time_queries(backend.get_related_events, sources, queries, rng)
+        }
+    }
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(backend_name="memory", shapes=("star", "chain", "mesh"), sizes=(1000, 10000, 100000),
+                  queries=200, batch_size=500, max_hops=5, seed=42):
+    """
+    :return: 完整基准测试报告（包含环境信息和每个用例的结果）
+    """
+    backend = BACKENDS[backend_name]()
+    try:
+        results = [run_case(backend, shape, size, queries, batch_size, max_hops, seed)
+                   for shape in shapes for size in sizes]
+    finally:
+        backend.close()
+    return {
+        "backend": backend_name,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "created_at": datetime.datetime.now().isoformat(),
+        "params": {"queries": queries, "batch_size": batch_size, "max_hops": max_hops, "seed": seed},
+        "results": results
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SecurityTracer 基准测试")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="memory")
+    parser.add_argument("--shapes", default="star,chain,mesh", help="逗号分隔的图形状")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="逗号分隔的边数")
+    parser.add_argument("--queries", type=int, default=200, help="每类查询的次数")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-hops", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="结果 JSON 文件，缺省输出到标准输出")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmark(
+        args.backend,
+        [shape.strip() for shape in args.shapes.split(",") if shape.strip()],
+        [int(size) for size in args.sizes.split(",") if size.strip()],
+        args.queries, args.batch_size, args.max_hops, args.seed
+    )
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
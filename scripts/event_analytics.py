@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+安全事件聚合分析
+- 在 Elasticsearch 端执行 date_histogram × terms 聚合，不再拉取原始文档到客户端计数
+- 高基数分组（如 source_ip）通过 composite 聚合按 after_key 分页
+- 结果为紧凑的列式结构 {列名: [值, ...]}，安装 NumPy 时可直接返回数组
+- 模板生效前创建的旧索引中分组字段为动态映射的 text，自动回退到其 .keyword 子字段
+- 任一分片失败时抛出异常，不返回不完整的计数
+"""
+
+import os
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 为可选依赖，只在 as_numpy=True 时需要
+    np = None
+
+# 聚合分页配置
+ANALYTICS_PAGE_SIZE = int(os.getenv("ANALYTICS_PAGE_SIZE", "1000"))  # composite 聚合每页桶数
+
+EVENTS_INDEX_PATTERN = "security-events-*"
+
+# 可分组的字段及其在索引中的聚合字段（索引模板中为 keyword/ip 类型，见 SecurityTracer.ensure_event_indices）
+AGGREGATION_FIELDS = {
+    "event_type": "event_type",
+    "severity": "severity",
+    "source_ip": "source_ip",
+    "target_ip": "target_ip"
+}
+
+# 旧索引回退用的 runtime 字段：有 .keyword 子字段（动态映射的 text）时取子字段，否则取 keyword/ip 字段本身
+_FALLBACK_SCRIPT = (
+    "def field = doc.containsKey(params.keyword) ? params.keyword : params.field;"
+    " if (doc.containsKey(field)) { for (def value : doc[field]) { emit(value.toString()); } }"
+)
+
+def aggregation_field(name):
+    """分组字段名对应的聚合字段，不支持的字段抛出 ValueError"""
+    if name not in AGGREGATION_FIELDS:
+        raise ValueError(f"不支持的聚合字段: {name}")
+    return AGGREGATION_FIELDS[name]
+
+def _resolve_fields(es_client, index, names):
+    """
+    确定各分组字段实际使用的聚合字段
+    通过 field_caps 找出在部分索引中被映射为 text 的字段，改用合并两种映射的 runtime 字段；
+    所有索引都已是 keyword/ip 映射时直接使用字段本身，不引入脚本开销
+    :param names: 分组或过滤用到的字段名
+    :return: ({字段名: 聚合字段}, runtime_mappings)
+    """
+    fields = {name: aggregation_field(name) for name in names}
+    if not fields:
+        return fields, {}
+    caps = es_client.field_caps(index=index, fields=",".join(fields.values()),
+                                ignore_unavailable=True, allow_no_indices=True).get("fields", {})
+    runtime = {}
+    for name, field in fields.items():
+        if "text" in caps.get(field, {}):
+            fields[name] = f"{field}_agg"
+            runtime[fields[name]] = {
+                "type": "keyword",
+                "script": {"source": _FALLBACK_SCRIPT, "params": {"field": field, "keyword": f"{field}.keyword"}}
+            }
+    return fields, runtime
+
+def _search(es_client, index, body, filter_path):
+    """
+    执行聚合查询，任一分片失败（如字段映射冲突）时抛出 RuntimeError，避免静默返回部分计数
+    """
+    response = es_client.search(index=index, body=body, filter_path=f"{filter_path},_shards.failed,_shards.failures")
+    shards = response.get("_shards", {})
+    if shards.get("failed"):
+        reasons = {failure.get("reason", {}).get("reason", str(failure)) for failure in shards.get("failures", [])}
+        raise RuntimeError(f"{shards['failed']} 个分片查询失败，聚合结果不完整: {'; '.join(sorted(reasons))}")
+    return response
+
+def _events_filter(time_range, filters, fields=None):
+    """
+    构造聚合的过滤条件
+    :param time_range: 时间范围（如 '1h'）
+    :param filters: {字段: 值或值列表}，字段须在 AGGREGATION_FIELDS 中
+    :param fields: _resolve_fields 返回的 {字段名: 聚合字段}，缺省直接使用 AGGREGATION_FIELDS
+    """
+    clauses = [{"range": {"@timestamp": {"gte": f"now-{time_range}", "lte": "now"}}}]
+    for name, value in (filters or {}).items():
+        field = (fields or {}).get(name) or aggregation_field(name)
+        if isinstance(value, (list, tuple, set)):
+            clauses.append({"terms": {field: list(value)}})
+        else:
+            clauses.append({"term": {field: value}})
+    return {"bool": {"filter": clauses}}
+
+def new_columns(names, as_numpy):
+    """创建空的列式结果 {列名: []}，as_numpy=True 但未安装 NumPy 时抛出 RuntimeError"""
+    if as_numpy and np is None:
+        raise RuntimeError("as_numpy=True 需要安装 numpy")
+    return {name: [] for name in names}
+
+def columns_to_numpy(columns):
+    """将列式结果转换为 NumPy 数组：timestamp 为 datetime64[ms]，count 为 int64，其余为 object"""
+    arrays = {}
+    for name, values in columns.items():
+        if name == "timestamp":
+            arrays[name] = np.array(values, dtype="datetime64[ms]")
+        elif name == "count":
+            arrays[name] = np.array(values, dtype=np.int64)
+        else:
+            arrays[name] = np.array(values, dtype=object)
+    return arrays
+
+def iter_composite_buckets(es_client, sources, query, page_size=ANALYTICS_PAGE_SIZE, index=EVENTS_INDEX_PATTERN,
+                           runtime_mappings=None):
+    """
+    按 after_key 分页遍历 composite 聚合的全部桶
+    :param sources: composite 聚合的 sources 列表
+    :param runtime_mappings: sources 或 query 引用的 runtime 字段
+    :return: 生成器，逐个产出桶（包含 key 和 doc_count）
+    """
+    body = {
+        "size": 0,
+        "track_total_hits": False,
+        "query": query,
+        "aggs": {"groups": {"composite": {"size": page_size, "sources": sources}}}
+    }
+    if runtime_mappings:
+        body["runtime_mappings"] = runtime_mappings
+    while True:
+        # filter_path 只返回桶、分页位置和分片失败信息，省去响应中的其余元数据
+        response = _search(es_client, index, body, "aggregations.groups.buckets,aggregations.groups.after_key")
+        groups = response.get("aggregations", {}).get("groups", {})
+        buckets = groups.get("buckets", [])
+        yield from buckets
+        after_key = groups.get("after_key")
+        if not buckets or after_key is None or len(buckets) < page_size:
+            return
+        body["aggs"]["groups"]["composite"]["after"] = after_key
+
+def event_histogram(es_client, interval="1m", group_by=("event_type",), time_range="1h", filters=None,
+                    page_size=ANALYTICS_PAGE_SIZE, as_numpy=False, index=EVENTS_INDEX_PATTERN):
+    """
+    按时间桶和分组字段统计事件数
+    :param interval: 时间桶大小（fixed_interval，如 '1m'、'1h'），None 表示不按时间分桶
+    :param group_by: 分组字段序列，取自 event_type/severity/source_ip/target_ip
+    :param time_range: 时间范围（如 '1h'）
+    :param filters: {字段: 值或值列表} 过滤条件
+    :param page_size: composite 聚合每页桶数
+    :param as_numpy: 为 True 时返回 NumPy 数组（timestamp 为 datetime64[ms]）
+    :return: 列式结果 {"timestamp": [毫秒时间戳], 分组字段: [...], "count": [...]}，
+             按时间桶、分组字段升序排列
+    """
+    group_by = list(group_by or ())
+    if interval is None and not group_by:
+        raise ValueError("interval 和 group_by 不能同时为空")
+    fields, runtime = _resolve_fields(es_client, index, list(dict.fromkeys(group_by + list(filters or {}))))
+    sources = []
+    if interval is not None:
+        sources.append({"timestamp": {"date_histogram": {"field": "@timestamp", "fixed_interval": interval}}})
+    for name in group_by:
+        sources.append({name: {"terms": {"field": fields[name]}}})
+    names = [next(iter(source)) for source in sources]
+    columns = new_columns(names + ["count"], as_numpy)
+    for bucket in iter_composite_buckets(es_client, sources, _events_filter(time_range, filters, fields),
+                                         page_size, index, runtime):
+        for name in names:
+            columns[name].append(bucket["key"][name])
+        columns["count"].append(bucket["doc_count"])
+    return columns_to_numpy(columns) if as_numpy else columns
+
+def top_values(es_client, field="source_ip", size=10, time_range="1h", filters=None, as_numpy=False,
+               index=EVENTS_INDEX_PATTERN):
+    """
+    统计事件数最多的若干个字段值（如 Top 攻击源）
+    terms 聚合在分片上取近似 Top N；需要精确完整的分布时使用 event_histogram(interval=None)
+    :param field: 统计字段，取自 event_type/severity/source_ip/target_ip
+    :param size: 返回的值个数
+    :return: 列式结果 {字段: [...], "count": [...]}，按事件数降序排列
+    """
+    fields, runtime = _resolve_fields(es_client, index, list(dict.fromkeys([field] + list(filters or {}))))
+    body = {
+        "size": 0,
+        "track_total_hits": False,
+        "query": _events_filter(time_range, filters, fields),
+        "aggs": {"top": {"terms": {"field": fields[field], "size": size}}}
+    }
+    if runtime:
+        body["runtime_mappings"] = runtime
+    response = _search(es_client, index, body, "aggregations.top.buckets")
+    columns = new_columns([field, "count"], as_numpy)
+    for bucket in response.get("aggregations", {}).get("top", {}).get("buckets", []):
+        columns[field].append(bucket["key"])
+        columns["count"].append(bucket["doc_count"])
+    return columns_to_numpy(columns) if as_numpy else columns
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+本地持久化事件队列（spool）
+- 事件以追加方式写入内存映射的定长段文件，写入只是一次内存拷贝，不等待后端
+- 每条记录为 [长度(4 字节) | CRC32(4 字节) | JSON]，先写数据后写头部，崩溃后按 CRC 截断到最后一条完整记录
+- 消费进度保存在 checkpoint 文件中（写临时文件后原子替换），已消费完的段文件随即删除
+- SpoolDrainer 在后台按批读取并写入后端，失败时按带抖动的指数退避等待，后端恢复后继续回放
+
+投递语义为至少一次：批次写入后端成功、提交 checkpoint 之前进程退出时，该批次会被再次投递
+数据本身有问题的记录（缺少字段、被后端以 4xx 拒绝）写入 dead_letter.ndjson 后跳过，不阻塞后续记录
+"""
+
+import datetime
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))  # 单个段文件大小
+SPOOL_FLUSH_INTERVAL = float(os.getenv("SPOOL_FLUSH_INTERVAL", "1.0"))  # 段文件刷盘间隔（秒）
+
+_HEADER = struct.Struct("<II")
+_CHECKPOINT = "checkpoint.json"
+DEAD_LETTER_FILE = "dead_letter.ndjson"
+
+def _segment_name(seq):
+    return f"{seq:012d}.seg"
+
+def _scan(buffer, offset, limit):
+    """
+    从 offset 开始逐条校验记录
+    :return: 生成器，产出 (记录起点, 记录终点, 数据)
+    """
+    while offset + _HEADER.size <= limit:
+        length, crc = _HEADER.unpack_from(buffer, offset)
+        end = offset + _HEADER.size + length
+        if length == 0 or end > limit:
+            return
+        payload = bytes(buffer[offset + _HEADER.size:end])
+        if zlib.crc32(payload) != crc:
+            return
+        yield offset, end, payload
+        offset = end
+
+def is_transient(error):
+    """
+    默认的错误分类：数据本身有问题的错误重试也不会成功，其余视为后端暂时不可用
+    - KeyError/ValueError/TypeError：记录缺少字段或格式错误
+    - HTTP 4xx（408/429 除外）：请求被后端拒绝，如映射冲突
+    - Neo4j ClientError（Neo.ClientError.*）：语句或参数错误
+    """
+    if isinstance(error, (KeyError, ValueError, TypeError)):
+        return False
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+        return False
+    code = getattr(error, "code", None)
+    if isinstance(code, str) and code.startswith("Neo.ClientError."):
+        return False
+    return True
+
+class EventSpool:
+    def __init__(self, directory, segment_bytes=SPOOL_SEGMENT_BYTES, flush_interval=SPOOL_FLUSH_INTERVAL):
+        """
+        :param directory: 段文件和 checkpoint 所在目录，不存在时创建
+        :param segment_bytes: 单个段文件大小，单条记录不能超过该大小
+        :param flush_interval: 写入后最长多久将段文件刷到磁盘（秒），0 表示每次写入都刷盘
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._read_seq, self._read_offset = self._load_checkpoint()
+        segments = self._segments()
+        self._write_seq = segments[-1] if segments else self._read_seq
+        self._write_file, self._write_map = self._open_segment(self._write_seq)
+        # 恢复写入位置：最后一条完整记录之后
+        self._write_offset = 0
+        for _, end, _ in _scan(self._write_map, 0, self.segment_bytes):
+            self._write_offset = end
+        self._last_flush = time.monotonic()
+        self.appended = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _segments(self):
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".seg"))
+
+    def _load_checkpoint(self):
+        try:
+            with open(self._path(_CHECKPOINT), "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            return checkpoint["segment"], checkpoint["offset"]
+        except FileNotFoundError:
+            segments = self._segments()
+            return (segments[0] if segments else 0), 0
+
+    def _open_segment(self, seq):
+        path = self._path(_segment_name(seq))
+        f = open(path, "r+b" if os.path.exists(path) else "w+b")
+        if os.fstat(f.fileno()).st_size < self.segment_bytes:
+            f.truncate(self.segment_bytes)
+        return f, mmap.mmap(f.fileno(), self.segment_bytes)
+
+    def append(self, payload):
+        """
+        追加一条记录（只拷贝到内存映射，由操作系统和定期 flush 落盘）
+        :param payload: 字节串
+        """
+        size = _HEADER.size + len(payload)
+        if size > self.segment_bytes:
+            raise ValueError(f"记录大小 {size} 超过段文件大小 {self.segment_bytes}")
+        with self._lock:
+            if self._write_offset + size > self.segment_bytes:
+                self._roll()
+            offset = self._write_offset
+            # 先写数据再写头部：头部完整时数据一定已写入
+            self._write_map[offset + _HEADER.size:offset + size] = payload
+            self._write_map[offset:offset + _HEADER.size] = _HEADER.pack(len(payload), zlib.crc32(payload))
+            self._write_offset = offset + size
+            self.appended += 1
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._write_map.flush()
+                self._last_flush = now
+
+    def append_event(self, event):
+        """追加一个事件字典"""
+        self.append(json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def _roll(self):
+        self._write_map.flush()
+        self._write_map.close()
+        self._write_file.close()
+        self._write_seq += 1
+        self._write_offset = 0
+        self._write_file, self._write_map = self._open_segment(self._write_seq)
+
+    def read_batch(self, max_records=1000):
+        """
+        从 checkpoint 位置读取一批记录，不移动 checkpoint
+        :return: (事件列表, 读取之后的位置)，处理成功后将位置传给 commit()
+        """
+        records = []
+        with self._lock:
+            seq, offset = self._read_seq, self._read_offset
+            while len(records) < max_records:
+                if seq == self._write_seq:
+                    for _, end, payload in _scan(self._write_map, offset, self._write_offset):
+                        records.append(payload)
+                        offset = end
+                        if len(records) >= max_records:
+                            break
+                    break
+                # 已写满的旧段：读完后进入下一段
+                with open(self._path(_segment_name(seq)), "rb") as f:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+                        exhausted = True
+                        for _, end, payload in _scan(segment, offset, len(segment)):
+                            records.append(payload)
+                            offset = end
+                            if len(records) >= max_records:
+                                exhausted = False
+                                break
+                if exhausted:
+                    seq, offset = seq + 1, 0
+        return [json.loads(record) for record in records], (seq, offset)
+
+    def commit(self, position):
+        """
+        提交消费位置并删除已消费完的段文件
+        :param position: read_batch 返回的位置
+        """
+        seq, offset = position
+        with self._lock:
+            consumed = self._read_seq
+            self._read_seq, self._read_offset = seq, offset
+            tmp = self._path(_CHECKPOINT + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"segment": seq, "offset": offset}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._path(_CHECKPOINT))
+            for old in range(consumed, seq):
+                try:
+                    os.remove(self._path(_segment_name(old)))
+                except FileNotFoundError:
+                    pass
+
+    def dead_letter(self, event, error):
+        """
+        将无法写入后端的记录追加到 dead_letter.ndjson（每行包含失败时间、原因和原始事件）
+        :param error: 异常或原因描述
+        """
+        reason = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+        record = {"failed_at": datetime.datetime.now().isoformat(), "error": reason, "event": event}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self._path(DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def backlog_bytes(self):
+        """尚未消费的数据量（字节，按段大小估算）"""
+        with self._lock:
+            return ((self._write_seq - self._read_seq) * self.segment_bytes
+                    + self._write_offset - self._read_offset)
+
+    def flush(self):
+        with self._lock:
+            self._write_map.flush()
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._write_map.flush()
+            self._write_map.close()
+            self._write_file.close()
+
+class SpoolDrainer:
+    """
+    后台回放线程：按批读取 spool 写入后端，成功后提交 checkpoint
+    暂时性错误整批退避重试；其余错误逐条重放该批次，把出错的记录转入 dead letter 后继续
+    """
+
+    def __init__(self, spool, sink, batch_size=1000, idle_interval=0.2, max_backoff=30.0, name="spool-drainer",
+                 is_transient=is_transient):
+        """
+        :param spool: EventSpool
+        :param sink: 写入函数，参数为事件列表；抛出暂时性异常表示本批次需要稍后重试，
+                     可返回被后端永久拒绝的 (事件, 原因) 列表，这些记录转入 dead letter
+        :param batch_size: 每批最多事件数
+        :param idle_interval: 队列为空时的轮询间隔（秒）
+        :param max_backoff: 写入失败后的最长退避时间（秒）
+        :param is_transient: 判断异常是否为暂时性错误（后端不可用、限流等）
+        """
+        self.spool = spool
+        self.sink = sink
+        self.is_transient = is_transient
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.drained = 0
+        self.dead_lettered = 0
+        self.failures = 0
+        self.last_error = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _drain_once(self):
+        """
+        回放一批
+        :return: 回放的事件数，0 表示队列为空
+        """
+        events, position = self.spool.read_batch(self.batch_size)
+        if not events:
+            return 0
+        try:
+            rejected = list(self.sink(events) or ())
+        except Exception as e:
+            if self.is_transient(e):
+                raise
+            rejected = self._isolate(events)
+        for event, error in rejected:
+            self.spool.dead_letter(event, error)
+            logger.warning(f"spool 记录无法写入，已转入 dead letter: {error}")
+        self.spool.commit(position)
+        self.drained += len(events) - len(rejected)
+        self.dead_lettered += len(rejected)
+        return len(events)
+
+    def _isolate(self, events):
+        """
+        逐条重放出错的批次，找出无法写入的记录（之前已写入的记录会再次投递，与至少一次语义一致）
+        :return: (事件, 异常) 列表
+        """
+        rejected = []
+        for event in events:
+            try:
+                rejected.extend(self.sink([event]) or ())
+            except Exception as e:
+                if self.is_transient(e):
+                    raise
+                rejected.append((event, e))
+        return rejected
+
+    def _run(self):
+        failures = 0
+        while not self._stopping.is_set():
+            try:
+                drained = self._drain_once()
+            except Exception as e:
+                failures += 1
+                self.failures += 1
+                self.last_error = str(e)
+                delay = random.uniform(0, min(self.max_backoff, 0.5 * 2 ** failures))
+                logger.warning(f"spool 回放失败，{delay:.1f} 秒后重试: {str(e)}")
+                self._stopping.wait(delay)
+                continue
+            failures = 0
+            if not drained:
+                self._stopping.wait(self.idle_interval)
+
+    def stop(self, timeout=10):
+        """
+        停止后台线程，并在 timeout 内尽量回放剩余事件；未回放的事件保留在磁盘上，下次启动继续
+        :return: 是否已全部回放
+        """
+        self._stopping.set()
+        self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                if not self._drain_once():
+                    return True
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"spool 剩余事件回放失败，保留在 {self.spool.directory}: {str(e)}")
+        return False
+
+    def stats(self):
+        return {
+            "drained": self.drained,
+            "dead_lettered": self.dead_lettered,
+            "failures": self.failures,
+            "backlog_bytes": self.spool.backlog_bytes(),
+            "last_error": self.last_error
+        }
@@ -6,14 +6,27 @@
 - 通过 TCP 发送到 Logstash
 """
 
+import argparse
+import gzip
+import heapq
+import multiprocessing
 import socket
 import json
 import random
+import threading
 import time
+import uuid
 from datetime import datetime, timedelta
 import logging
 import os
 from dotenv import load_dotenv
+from event_spool import EventSpool, SpoolDrainer
+from resilience import backoff_delay
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
 
 # 加载环境变量
 load_dotenv()
@@ -26,6 +39,15 @@ logger = logging.getLogger(__name__)
 LOGSTASH_HOST = os.getenv("LOGSTASH_HOST", "localhost")
 LOGSTASH_PORT = int(os.getenv("LOGSTASH_TCP_PORT", "1514"))
 
+# 本地 spool 目录：发送失败或 Logstash 不可用时事件先落盘，由后台线程在恢复后补发；未设置时直接发送
+GENERATOR_SPOOL_DIR = os.getenv("GENERATOR_SPOOL_DIR") or None
+
+# 运行指标（由 --metrics-port / --metrics-log-interval 启用，None 表示不采集）
+metrics = None
+
+# 本地持久化队列（由 main 按 --spool-dir 开启，None 表示直接发送）
+spool = None
+
 # 模拟数据配置
 ATTACK_TYPES = [
     "SQL_INJECTION",
@@ -44,6 +66,15 @@ ATTACK_TYPES = [
 
 SEVERITY_LEVELS = ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# 单次随机事件的请求方法和响应码
+_RANDOM_METHODS = ["GET", "POST", "PUT", "DELETE"]
+_RANDOM_RESPONSES = [200, 301, 400, 401, 403, 404, 500]
+
+# 分片生成模式下模拟时钟的默认起始时间（固定值，保证多次运行结果一致）
+SHARD_START_TIME = "2024-01-01T00:00:00"
+
 # 定义受攻击的服务器范围
 TARGET_SERVERS = {
     "web_servers": [f"192.168.1.{i}" for i in range(10, 15)],
@@ -53,183 +84,809 @@ TARGET_SERVERS = {
     "file_servers": [f"192.168.5.{i}" for i in range(50, 52)]
 }
 
-# 定义攻击源IP范围
-ATTACK_SOURCES = [
-    # 模拟内部攻击
-    *[f"192.168.{random.randint(10, 50)}.{random.randint(100, 200)}" for _ in range(5)],
-    # 模拟外部攻击
-    *[f"{random.randint(1, 223)}.{random.randint(1, 254)}.{random.randint(1, 254)}.{random.randint(1, 254)}" for _ in range(15)]
-]
-
-# 定义持续性攻击的状态
-ongoing_attacks = []
-
-def generate_ip():
-    """生成随机 IP 地址"""
-    return random.choice(ATTACK_SOURCES)
+def build_attack_sources(rng=random):
+    """
+    生成攻击源 IP 列表
+    :param rng: 随机数生成器（random 模块或 random.Random 实例）
+    """
+    return [
+        # 模拟内部攻击
+        *[f"192.168.{rng.randint(10, 50)}.{rng.randint(100, 200)}" for _ in range(5)],
+        # 模拟外部攻击
+        *[f"{rng.randint(1, 223)}.{rng.randint(1, 254)}.{rng.randint(1, 254)}.{rng.randint(1, 254)}" for _ in range(15)]
+    ]
 
-def get_target_ip():
-    """获取目标IP，控制在特定范围内"""
-    server_type = random.choice(list(TARGET_SERVERS.keys()))
-    return random.choice(TARGET_SERVERS[server_type])
+# 定义攻击源IP范围
+ATTACK_SOURCES = build_attack_sources()
 
-def start_new_attack():
-    """开始一个新的持续性攻击"""
-    attack_type = random.choice(ATTACK_TYPES)
-    severity = random.choice(SEVERITY_LEVELS)
+def plan_attack(rng, attack_sources):
+    """
+    随机规划一次持续性攻击
+    :return: (攻击类型, 严重程度, 持续分钟数, 攻击源, 目标列表, 事件间隔秒数)
+    """
+    attack_type = rng.choice(ATTACK_TYPES)
+    severity = rng.choice(SEVERITY_LEVELS)
     # 更严重的攻击持续时间更长
     if severity == "CRITICAL":
-        duration = random.randint(10, 30)  # 分钟
+        duration = rng.randint(10, 30)  # 分钟
     elif severity == "HIGH":
-        duration = random.randint(5, 15)
+        duration = rng.randint(5, 15)
     else:
-        duration = random.randint(1, 10)
+        duration = rng.randint(1, 10)
         
-    source_ip = generate_ip()
+    source_ip = rng.choice(attack_sources)
     
     # 确定攻击目标范围
     if attack_type in ["DDoS", "BRUTE_FORCE"]:
         # 这些攻击类型通常针对单一目标
-        target_type = random.choice(["web_servers", "auth_servers"])
-        targets = [random.choice(TARGET_SERVERS[target_type])]
+        target_type = rng.choice(["web_servers", "auth_servers"])
+        targets = [rng.choice(TARGET_SERVERS[target_type])]
     elif attack_type in ["LATERAL_MOVEMENT", "RANSOMWARE"]:
         # 这些攻击类型通常跨多个服务器
         targets = []
-        for server_type in random.sample(list(TARGET_SERVERS.keys()), random.randint(2, 3)):
-            targets.extend(random.sample(TARGET_SERVERS[server_type], 
-                                         min(random.randint(1, 3), len(TARGET_SERVERS[server_type]))))
+        for server_type in rng.sample(list(TARGET_SERVERS.keys()), rng.randint(2, 3)):
+            targets.extend(rng.sample(TARGET_SERVERS[server_type], 
+                                      min(rng.randint(1, 3), len(TARGET_SERVERS[server_type]))))
     else:
         # 其他攻击类型随机选择1-2个目标
-        target_type = random.choice(list(TARGET_SERVERS.keys()))
-        targets = random.sample(TARGET_SERVERS[target_type], 
-                               min(random.randint(1, 2), len(TARGET_SERVERS[target_type])))
+        target_type = rng.choice(list(TARGET_SERVERS.keys()))
+        targets = rng.sample(TARGET_SERVERS[target_type], 
+                             min(rng.randint(1, 2), len(TARGET_SERVERS[target_type])))
     
     # 事件频率 - 严重程度越高，事件越频繁
     if severity == "CRITICAL":
-        frequency = random.uniform(0.5, 1.5)  # 每0.5-1.5秒一个事件
+        frequency = rng.uniform(0.5, 1.5)  # 每0.5-1.5秒一个事件
     elif severity == "HIGH":
-        frequency = random.uniform(1, 3)
+        frequency = rng.uniform(1, 3)
     else:
-        frequency = random.uniform(2, 5)
-    
-    attack = {
-        "type": attack_type,
-        "severity": severity,
-        "source_ip": source_ip,
-        "targets": targets,
-        "started_at": datetime.now(),
-        "end_at": datetime.now() + timedelta(minutes=duration),
-        "frequency": frequency,
-        "last_event": datetime.now() - timedelta(seconds=frequency)  # 确保第一次检查时立即生成事件
-    }
-    
-    ongoing_attacks.append(attack)
-    logger.info(f"开始新的攻击: {attack_type} 从 {source_ip} 到 {len(targets)} 个目标，持续 {duration} 分钟")
-    return attack
+        frequency = rng.uniform(2, 5)
+    return attack_type, severity, duration, source_ip, targets, frequency
+
+def new_run_id():
+    """生成一次运行的标识，随 attack_id 写入事件，区分不同运行中编号相同的攻击活动"""
+    return uuid.uuid4().hex[:12]
+
+def attack_details(attack_type, rng=random):
+    """
+    根据攻击类型生成持续性攻击事件的详细信息
+    :return: (details, request_method, response_code)
+    """
+    if attack_type == "SQL_INJECTION":
+        return "检测到SQL注入尝试: 'OR 1=1--'", "POST", rng.choice([200, 400, 500])
+    if attack_type == "XSS":
+        return "检测到跨站脚本攻击: '<script>alert(document.cookie)</script>'", "GET", rng.choice([200, 400])
+    if attack_type == "DDoS":
+        details = f"DDoS攻击检测: SYN洪水，每秒{rng.randint(1000, 10000)}个请求"
+        return details, "GET", rng.choice([503, 504, 429])
+    if attack_type == "BRUTE_FORCE":
+        details = f"检测到暴力破解尝试: 用户'{rng.choice(['admin', 'root', 'administrator'])}'，尝试次数: {rng.randint(5, 50)}"
+        return details, "POST", 401
+    if attack_type == "RANSOMWARE":
+        details = f"检测到勒索软件活动: 尝试加密文件，受影响路径: /var/data/{rng.choice(['uploads', 'backups', 'customer'])}"
+        return details, "PUT", rng.choice([200, 403])
+    if attack_type == "LATERAL_MOVEMENT":
+        return "检测到横向移动: 未授权SSH连接尝试", "CONNECT", rng.choice([403, 200])
+    return f"模拟{attack_type}攻击事件: 可疑活动", rng.choice(["GET", "POST", "PUT"]), rng.choice([200, 400, 401, 403, 500])
+
+class SimulatedClock:
+    """模拟时钟：时间只在 advance() 时按固定步长前进，保证生成结果可复现"""
+
+    def __init__(self, start, step_ms):
+        self.current = start
+        self.step = timedelta(milliseconds=step_ms)
+
+    def now(self):
+        return self.current
+
+    def advance(self):
+        self.current += self.step
+
+class AttackSimulator:
+    """
+    攻击活动模拟器
+    - 持有独立的随机数生成器、攻击源列表和持续性攻击状态
+    - 多个实例之间互不影响，可在不同进程中并行生成
+    """
+
+    def __init__(self, rng=random, attack_sources=None, now=datetime.now, attack_id_base=0, run_id=None):
+        """
+        :param rng: 随机数生成器，传入 random.Random(seed) 可复现生成结果
+        :param attack_sources: 攻击源 IP 列表，缺省时由 rng 生成
+        :param now: 当前时间函数，默认使用系统时间
+        :param attack_id_base: 攻击 ID 起始值，分片之间使用不同起始值避免冲突
+        :param run_id: 运行标识，缺省时随机生成；需要复现结果时传入固定值
+        """
+        self.rng = rng
+        self.run_id = run_id or new_run_id()
+        self.attack_sources = attack_sources if attack_sources is not None else build_attack_sources(rng)
+        self.now = now
+        # 定义持续性攻击的状态
+        self.ongoing_attacks = []
+        self._next_attack_id = attack_id_base
+
+    def generate_ip(self):
+        """生成随机 IP 地址"""
+        return self.rng.choice(self.attack_sources)
+
+    def get_target_ip(self):
+        """获取目标IP，控制在特定范围内"""
+        server_type = self.rng.choice(list(TARGET_SERVERS.keys()))
+        return self.rng.choice(TARGET_SERVERS[server_type])
+
+    def start_new_attack(self):
+        """开始一个新的持续性攻击"""
+        attack_type, severity, duration, source_ip, targets, frequency = plan_attack(self.rng, self.attack_sources)
+        now = self.now()
+        attack = {
+            "id": self._next_attack_id,
+            "type": attack_type,
+            "severity": severity,
+            "source_ip": source_ip,
+            "targets": targets,
+            "started_at": now,
+            "end_at": now + timedelta(minutes=duration),
+            "frequency": frequency,
+            "last_event": now - timedelta(seconds=frequency)  # 确保第一次检查时立即生成事件
+        }
+        self._next_attack_id += 1
+        
+        self.ongoing_attacks.append(attack)
+        logger.info(f"开始新的攻击: {attack_type} 从 {source_ip} 到 {len(targets)} 个目标，持续 {duration} 分钟")
+        return attack
+
+    def update_attacks(self):
+        """更新持续性攻击状态，移除过期的攻击"""
+        current_time = self.now()
+        
+        # 移除过期的攻击（原地更新，保持列表引用不变）
+        self.ongoing_attacks[:] = [attack for attack in self.ongoing_attacks if attack["end_at"] > current_time]
+        
+        # 随机决定是否开始新的攻击
+        if len(self.ongoing_attacks) < 3 and self.rng.random() < 0.2:  # 20%概率开始新攻击
+            self.start_new_attack()
+
+    def generate_event(self):
+        """生成单个安全事件"""
+        rng = self.rng
+        self.update_attacks()
+        current_time = self.now()
+        
+        # 如果有持续性攻击，90%的概率从中生成事件
+        if self.ongoing_attacks and rng.random() < 0.9:
+            # 检查哪些攻击需要生成新事件
+            for attack in self.ongoing_attacks:
+                time_since_last = (current_time - attack["last_event"]).total_seconds()
+                if time_since_last >= attack["frequency"]:
+                    attack["last_event"] = current_time
+                    target_ip = rng.choice(attack["targets"])
+                    
+                    details, method, response = attack_details(attack["type"], rng)
+                    
+                    event = {
+                        "@timestamp": current_time.isoformat(),
+                        "event_type": attack["type"],
+                        "source_ip": attack["source_ip"],
+                        "target_ip": target_ip,
+                        "severity": attack["severity"],
+                        "details": details,
+                        "user_agent": USER_AGENT,
+                        "request_method": method,
+                        "response_code": response,
+                        "attack_id": attack["id"],  # 用于关联同一次攻击的多个事件
+                        "run_id": self.run_id,
+                        "attack_duration": f"{(current_time - attack['started_at']).total_seconds():.0f}秒"
+                    }
+                    return event
+        
+        # 如果没有生成持续性攻击的事件，则生成随机的单次事件
+        event = {
+            "@timestamp": current_time.isoformat(),
+            "event_type": rng.choice(ATTACK_TYPES),
+            "source_ip": self.generate_ip(),
+            "target_ip": self.get_target_ip(),
+            "severity": rng.choice(SEVERITY_LEVELS),
+            "details": f"模拟{rng.choice(ATTACK_TYPES)}攻击事件",
+            "user_agent": USER_AGENT,
+            "request_method": rng.choice(_RANDOM_METHODS),
+            "response_code": rng.choice(_RANDOM_RESPONSES)
+        }
+        return event
+
+# 默认模拟器：使用全局 random 和系统时间，供交互模式和压测模式使用
+_default_simulator = AttackSimulator(attack_sources=ATTACK_SOURCES)
+
+# 定义持续性攻击的状态
+ongoing_attacks = _default_simulator.ongoing_attacks
+
+def generate_ip():
+    """生成随机 IP 地址"""
+    return _default_simulator.generate_ip()
+
+def get_target_ip():
+    """获取目标IP，控制在特定范围内"""
+    return _default_simulator.get_target_ip()
+
+def start_new_attack():
+    """开始一个新的持续性攻击"""
+    return _default_simulator.start_new_attack()
 
 def update_attacks():
     """更新持续性攻击状态，移除过期的攻击"""
-    global ongoing_attacks
-    current_time = datetime.now()
-    
-    # 移除过期的攻击
-    ongoing_attacks = [attack for attack in ongoing_attacks if attack["end_at"] > current_time]
-    
-    # 随机决定是否开始新的攻击
-    if len(ongoing_attacks) < 3 and random.random() < 0.2:  # 20%概率开始新攻击
-        start_new_attack()
+    _default_simulator.update_attacks()
 
 def generate_event():
     """生成单个安全事件"""
-    update_attacks()
-    current_time = datetime.now()
-    
-    # 如果有持续性攻击，90%的概率从中生成事件
-    if ongoing_attacks and random.random() < 0.9:
-        # 检查哪些攻击需要生成新事件
-        for attack in ongoing_attacks:
-            time_since_last = (current_time - attack["last_event"]).total_seconds()
-            if time_since_last >= attack["frequency"]:
-                attack["last_event"] = current_time
-                target_ip = random.choice(attack["targets"])
-                
-                # 根据攻击类型生成详细信息
-                if attack["type"] == "SQL_INJECTION":
-                    details = f"检测到SQL注入尝试: 'OR 1=1--'"
-                    method = "POST"
-                    response = random.choice([200, 400, 500])
-                elif attack["type"] == "XSS":
-                    details = f"检测到跨站脚本攻击: '<script>alert(document.cookie)</script>'"
-                    method = "GET"
-                    response = random.choice([200, 400])
-                elif attack["type"] == "DDoS":
-                    details = f"DDoS攻击检测: SYN洪水，每秒{random.randint(1000, 10000)}个请求"
-                    method = "GET"
-                    response = random.choice([503, 504, 429])
-                elif attack["type"] == "BRUTE_FORCE":
-                    details = f"检测到暴力破解尝试: 用户'{random.choice(['admin', 'root', 'administrator'])}'，尝试次数: {random.randint(5, 50)}"
-                    method = "POST"
-                    response = 401
-                elif attack["type"] == "RANSOMWARE":
-                    details = f"检测到勒索软件活动: 尝试加密文件，受影响路径: /var/data/{random.choice(['uploads', 'backups', 'customer'])}"
-                    method = "PUT"
-                    response = random.choice([200, 403])
-                elif attack["type"] == "LATERAL_MOVEMENT":
-                    details = f"检测到横向移动: 未授权SSH连接尝试"
-                    method = "CONNECT"
-                    response = random.choice([403, 200])
-                else:
-                    details = f"模拟{attack['type']}攻击事件: 可疑活动"
-                    method = random.choice(["GET", "POST", "PUT"])
-                    response = random.choice([200, 400, 401, 403, 500])
-                
-                event = {
-                    "@timestamp": current_time.isoformat(),
-                    "event_type": attack["type"],
-                    "source_ip": attack["source_ip"],
-                    "target_ip": target_ip,
-                    "severity": attack["severity"],
-                    "details": details,
-                    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                    "request_method": method,
-                    "response_code": response,
-                    "attack_id": id(attack),  # 用于关联同一次攻击的多个事件
-                    "attack_duration": f"{(current_time - attack['started_at']).total_seconds():.0f}秒"
-                }
-                return event
-    
-    # 如果没有生成持续性攻击的事件，则生成随机的单次事件
-    event = {
-        "@timestamp": datetime.now().isoformat(),
-        "event_type": random.choice(ATTACK_TYPES),
-        "source_ip": generate_ip(),
-        "target_ip": get_target_ip(),
-        "severity": random.choice(SEVERITY_LEVELS),
-        "details": f"模拟{random.choice(ATTACK_TYPES)}攻击事件",
-        "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "request_method": random.choice(["GET", "POST", "PUT", "DELETE"]),
-        "response_code": random.choice([200, 301, 400, 401, 403, 404, 500])
+    return _default_simulator.generate_event()
+
+def _json_bytes(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False).encode()
+
+class EventCodec:
+    """
+    事件编码器：字段（键 + 值）预编码为字节片段并缓存，事件按片段拼接，不再逐事件序列化整个字典
+    输出换行分隔的 JSON，对应 Logstash tcp 输入的 json_lines 编码（LOGSTASH_TCP_PORT）；
+    换行即事件边界，批量 sendall 时 TCP 分段不影响 Logstash 解码
+    """
+
+    def __init__(self):
+        self._fragments = {}
+
+    def field(self, key, value):
+        """编码一个字段（不缓存，用于时间戳等每个事件都不同的值）"""
+        return _json_bytes(key) + b":" + _json_bytes(value)
+
+    def fragment(self, key, value):
+        """编码一个取值有限的字段，结果按 (键, 值) 缓存"""
+        fragment = self._fragments.get((key, value))
+        if fragment is None:
+            fragment = self._fragments[(key, value)] = self.field(key, value)
+        return fragment
+
+    def string_affixes(self, key):
+        """
+        字符串字段的编码前后缀，字段编码为 前缀 + UTF-8 值 + 后缀（值不含需要转义的字符）
+        """
+        return _json_bytes(key) + b':"', b'"'
+
+    def join(self, fragments):
+        """将字段片段拼接为一个完整事件"""
+        return b"{" + b",".join(fragments) + b"}\n"
+
+    def encode(self, event):
+        """编码一个事件字典"""
+        return self.join([self.field(key, value) for key, value in event.items()])
+
+class _Campaign:
+    __slots__ = ("id", "type", "severity", "source_ip", "targets", "started_at", "end_at", "frequency",
+                 "fragments", "target_fragments")
+
+    def __init__(self, attack_id, attack_type, severity, source_ip, targets, started_at, end_at, frequency):
+        self.id = attack_id
+        self.type = attack_type
+        self.severity = severity
+        self.source_ip = source_ip
+        self.targets = targets
+        self.started_at = started_at
+        self.end_at = end_at
+        self.frequency = frequency
+        self.fragments = None  # 预编码的 (event_type, source_ip, severity, attack_id) 片段
+        self.target_fragments = None
+
+class FastAttackSimulator:
+    """
+    高吞吐攻击活动模拟器，事件分布与 AttackSimulator 相同（同一种子下的随机序列不同），用于压测
+    - 攻击活动为 __slots__ 对象，按下次应产生事件的时间放入堆，每个事件只查看堆顶，不再遍历全部活动
+    - 时间使用 epoch 秒，时间戳字符串的秒级前缀按秒缓存
+    - 取值有限的字段在初始化（或攻击开始）时预编码为片段，按下标取用，逐事件只编码时间戳
+    """
+
+    def __init__(self, rng=random, attack_sources=None, now=time.time, attack_id_base=0, codec=None, run_id=None):
+        """
+        :param rng: 随机数生成器
+        :param attack_sources: 攻击源 IP 列表，缺省时由 rng 生成
+        :param now: 当前时间函数，返回 epoch 秒
+        :param attack_id_base: 攻击 ID 起始值，多个实例之间使用不同起始值避免冲突
+        :param codec: EventCodec，缺省新建一个
+        :param run_id: 运行标识，缺省时随机生成
+        """
+        self.rng = rng
+        self.run_id = run_id or new_run_id()
+        self.attack_sources = attack_sources if attack_sources is not None else build_attack_sources(rng)
+        self.now = now
+        self.codec = codec = codec or EventCodec()
+        self._next_attack_id = attack_id_base
+        # 堆元素为 (下次产生事件的时间, 序号, 攻击活动)
+        self._heap = []
+        self._sequence = 0
+        self._next_expiry = float("inf")
+        self._target_groups = list(TARGET_SERVERS.values())
+        self._ts_second = None
+        self._ts_prefix = None
+        # 时间戳（YYYY-MM-DDTHH:MM:SS.ffffff）不含需要转义的字符，逐事件只拼接前后缀
+        self._ts_head, self._ts_tail = codec.string_affixes("@timestamp")
+        # 单次随机事件各字段的预编码片段，与取值表按下标对应
+        fragment = codec.fragment
+        self._type_fragments = [fragment("event_type", value) for value in ATTACK_TYPES]
+        self._source_fragments = [fragment("source_ip", value) for value in self.attack_sources]
+        self._target_fragments = [[fragment("target_ip", value) for value in group] for group in self._target_groups]
+        self._severity_fragments = [fragment("severity", value) for value in SEVERITY_LEVELS]
+        self._details_fragments = [fragment("details", f"模拟{value}攻击事件") for value in ATTACK_TYPES]
+        self._user_agent_fragment = fragment("user_agent", USER_AGENT)
+        self._run_id_fragment = fragment("run_id", self.run_id)
+        self._method_fragments = [fragment("request_method", value) for value in _RANDOM_METHODS]
+        self._response_fragments = [fragment("response_code", value) for value in _RANDOM_RESPONSES]
+
+    @property
+    def ongoing_attacks(self):
+        return [campaign for _, _, campaign in self._heap]
+
+    def _timestamp(self, now):
+        """与 datetime.isoformat() 相同格式的本地时间字符串（始终包含微秒）"""
+        second = int(now)
+        if second != self._ts_second:
+            self._ts_second = second
+            self._ts_prefix = datetime.fromtimestamp(second).isoformat()
+        return f"{self._ts_prefix}.{int((now - second) * 1000000):06d}"
+
+    def start_new_attack(self, now=None):
+        """开始一个新的持续性攻击"""
+        now = self.now() if now is None else now
+        attack_type, severity, duration, source_ip, targets, frequency = plan_attack(self.rng, self.attack_sources)
+        campaign = _Campaign(self._next_attack_id, attack_type, severity, source_ip, targets,
+                             now, now + duration * 60, frequency)
+        fragment = self.codec.fragment
+        campaign.fragments = (fragment("event_type", attack_type), fragment("source_ip", source_ip),
+                              fragment("severity", severity), self.codec.field("attack_id", campaign.id))
+        campaign.target_fragments = [fragment("target_ip", target) for target in targets]
+        self._next_attack_id += 1
+        # 第一次检查时立即生成事件
+        heapq.heappush(self._heap, (now, self._sequence, campaign))
+        self._sequence += 1
+        self._next_expiry = min(self._next_expiry, campaign.end_at)
+        logger.info(f"开始新的攻击: {attack_type} 从 {source_ip} 到 {len(targets)} 个目标，持续 {duration} 分钟")
+        return campaign
+
+    def _next(self):
+        """
+        推进攻击状态并抽取下一个事件
+        :return: (当前时间, 攻击活动, 抽样结果)；攻击活动为 None 时抽样结果为各字段取值表的下标，
+                 否则为 (目标下标, details, request_method, response_code)
+        """
+        rng = self.rng
+        random_ = rng.random
+        now = self.now()
+        heap = self._heap
+        # 移除过期的攻击：只在最早的攻击到期时重建堆
+        if now >= self._next_expiry:
+            heap[:] = [entry for entry in heap if entry[2].end_at > now]
+            heapq.heapify(heap)
+            self._next_expiry = min((entry[2].end_at for entry in heap), default=float("inf"))
+        if len(heap) < 3 and random_() < 0.2:  # 20%概率开始新攻击
+            self.start_new_attack(now)
+        # 持续性攻击到期时 90% 的概率从中生成事件
+        if heap and heap[0][0] <= now and random_() < 0.9:
+            campaign = heap[0][2]
+            heapq.heapreplace(heap, (now + campaign.frequency, self._sequence, campaign))
+            self._sequence += 1
+            details, method, response = attack_details(campaign.type, rng)
+            return now, campaign, (int(random_() * len(campaign.targets)), details, method, response)
+        group = int(random_() * len(self._target_groups))
+        return now, None, (
+            int(random_() * len(ATTACK_TYPES)),
+            int(random_() * len(self.attack_sources)),
+            group,
+            int(random_() * len(self._target_groups[group])),
+            int(random_() * len(SEVERITY_LEVELS)),
+            int(random_() * len(ATTACK_TYPES)),
+            int(random_() * len(_RANDOM_METHODS)),
+            int(random_() * len(_RANDOM_RESPONSES))
+        )
+
+    def generate_event(self):
+        """生成单个安全事件字典，字段同 AttackSimulator.generate_event"""
+        now, campaign, picks = self._next()
+        if campaign is not None:
+            target, details, method, response = picks
+            return {
+                "@timestamp": self._timestamp(now),
+                "event_type": campaign.type,
+                "source_ip": campaign.source_ip,
+                "target_ip": campaign.targets[target],
+                "severity": campaign.severity,
+                "details": details,
+                "user_agent": USER_AGENT,
+                "request_method": method,
+                "response_code": response,
+                "attack_id": campaign.id,
+                "run_id": self.run_id,
+                "attack_duration": f"{now - campaign.started_at:.0f}秒"
+            }
+        event_type, source, group, target, severity, detail_type, method, response = picks
+        return {
+            "@timestamp": self._timestamp(now),
+            "event_type": ATTACK_TYPES[event_type],
+            "source_ip": self.attack_sources[source],
+            "target_ip": self._target_groups[group][target],
+            "severity": SEVERITY_LEVELS[severity],
+            "details": f"模拟{ATTACK_TYPES[detail_type]}攻击事件",
+            "user_agent": USER_AGENT,
+            "request_method": _RANDOM_METHODS[method],
+            "response_code": _RANDOM_RESPONSES[response]
+        }
+
+    def generate_encoded(self):
+        """生成单个已编码的安全事件，字段和顺序同 generate_event"""
+        now, campaign, picks = self._next()
+        timestamp = self._ts_head + self._timestamp(now).encode() + self._ts_tail
+        if campaign is not None:
+            target, details, method, response = picks
+            fragment = self.codec.fragment
+            event_type, source_ip, severity, attack_id = campaign.fragments
+            return self.codec.join((
+                timestamp, event_type, source_ip, campaign.target_fragments[target], severity,
+                fragment("details", details), self._user_agent_fragment, fragment("request_method", method),
+                fragment("response_code", response), attack_id, self._run_id_fragment,
+                fragment("attack_duration", f"{now - campaign.started_at:.0f}秒")
+            ))
+        event_type, source, group, target, severity, detail_type, method, response = picks
+        return self.codec.join((
+            timestamp, self._type_fragments[event_type], self._source_fragments[source],
+            self._target_fragments[group][target], self._severity_fragments[severity],
+            self._details_fragments[detail_type], self._user_agent_fragment,
+            self._method_fragments[method], self._response_fragments[response]
+        ))
+
+    def generate_batch(self, count):
+        """生成 count 个已编码事件，拼接为一次发送的字节串"""
+        generate = self.generate_encoded
+        return b"".join([generate() for _ in range(count)])
+
+def shard_seed(master_seed, shard):
+    """由主种子和分片序号派生分片种子（字符串种子在不同进程和运行之间稳定）"""
+    return f"{master_seed}:{shard}"
+
+def open_ndjson(path, mode="r", compress_level=6):
+    """按文件后缀打开 NDJSON 文件，.gz 后缀使用 gzip 压缩"""
+    if path.endswith(".gz"):
+        if "w" in mode:
+            return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=compress_level)
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+class NdjsonWriter:
+    """
+    有界内存的 NDJSON 写入器
+    事件编码后暂存在缓冲区，缓冲区超过 buffer_bytes 时一次性写出，内存占用与数据集大小无关
+    """
+
+    def __init__(self, path, buffer_bytes=1 << 20, compress_level=6):
+        """
+        :param path: 输出文件路径，.gz 后缀时写入 gzip 压缩的 NDJSON
+        :param buffer_bytes: 缓冲区上限（按字符数近似）
+        :param compress_level: gzip 压缩级别
+        """
+        self.path = path
+        self.buffer_bytes = buffer_bytes
+        self.count = 0
+        self._file = open_ndjson(path, "w", compress_level)
+        self._buffer = []
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_line(self, line):
+        """写入一行已编码的 JSON（不含换行符）"""
+        self._buffer.append(line)
+        self._buffered += len(line) + 1
+        self.count += 1
+        if self._buffered >= self.buffer_bytes:
+            self.flush()
+
+    def write(self, event):
+        """写入一个事件字典"""
+        self.write_line(json.dumps(event, ensure_ascii=False))
+
+    def flush(self):
+        if self._buffer:
+            self._buffer.append("")
+            self._file.write("\n".join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+def generate_shard(shard, master_seed, events, path, start=None, step_ms=50, compress_level=6, run_id=None):
+    """
+    在独立进程中生成一个分片的事件并写入 NDJSON 文件
+    :param shard: 分片序号
+    :param master_seed: 主种子
+    :param events: 本分片生成的事件数
+    :param path: 输出文件路径
+    :param start: 模拟时钟起始时间（ISO 格式），所有分片相同
+    :param step_ms: 每个事件推进的模拟时间（毫秒）
+    :param compress_level: .gz 输出文件的压缩级别
+    :param run_id: 运行标识，所有分片相同，缺省由主种子决定（相同种子的结果完全一致）
+    :return: (分片序号, 输出路径, 事件数)
+    """
+    logger.setLevel(logging.WARNING)
+    clock = SimulatedClock(datetime.fromisoformat(start or SHARD_START_TIME), step_ms)
+    simulator = AttackSimulator(
+        rng=random.Random(shard_seed(master_seed, shard)),
+        # 攻击源只由主种子决定，所有分片共享同一批攻击者
+        attack_sources=build_attack_sources(random.Random(master_seed)),
+        now=clock.now,
+        attack_id_base=shard << 32,
+        run_id=run_id or f"seed-{master_seed}"
+    )
+    with NdjsonWriter(path, compress_level=compress_level) as writer:
+        for _ in range(events):
+            writer.write(simulator.generate_event())
+            clock.advance()
+    return shard, path, events
+
+def _iter_shard_lines(shard, path):
+    """逐行读取分片文件，产出 (时间戳, 分片序号, 行)，用于有序归并"""
+    with open_ndjson(path) as f:
+        for line in f:
+            yield json.loads(line)["@timestamp"], shard, line.rstrip("\n")
+
+def merge_shard_files(paths, output, compress_level=6):
+    """
+    按时间戳将多个分片文件归并为一个有序流（逐行归并，内存占用与分片数成正比）
+    时间戳相同的事件按分片序号排序，保证归并结果可复现
+    """
+    with NdjsonWriter(output, compress_level=compress_level) as writer:
+        for _, _, line in heapq.merge(*[_iter_shard_lines(shard, path) for shard, path in enumerate(paths)]):
+            writer.write_line(line)
+    return writer.count
+
+def run_sharded(shards, master_seed, total_events, output=None, output_dir=None, start=None, step_ms=50,
+                compress=None, compress_level=6, run_id=None):
+    """
+    多进程分片生成：每个进程持有独立的攻击活动状态，按主种子确定性派生各自种子
+    :param shards: 分片（进程）数
+    :param master_seed: 主种子
+    :param total_events: 总事件数，平均分配到各分片
+    :param output: 归并后的单个输出文件；为 None 时保留分片文件；只有一个分片时直接写入该文件，不经过分片文件
+    :param output_dir: 分片文件目录
+    :param compress: 是否写入 gzip 压缩的 NDJSON，缺省时由 output 是否以 .gz 结尾决定
+    :param compress_level: 最终输出的 gzip 压缩级别
+    :param run_id: 写入事件的运行标识，缺省为 seed-<主种子>
+    :return: 生成汇总
+    """
+    run_id = run_id or f"seed-{master_seed}"
+    if compress is None:
+        compress = bool(output and output.endswith(".gz"))
+    suffix = ".ndjson.gz" if compress else ".ndjson"
+    # 单个分片无需归并，直接写入最终输出
+    direct = bool(output) and shards == 1
+    # 需要归并时分片文件只是中间结果，使用最快的压缩级别
+    shard_level = 1 if output and not direct else compress_level
+    output_dir = output_dir or (os.path.dirname(os.path.abspath(output)) if output else ".")
+    os.makedirs(output_dir, exist_ok=True)
+    per_shard = [total_events // shards + (1 if i < total_events % shards else 0) for i in range(shards)]
+    if direct:
+        paths = [output]
+    else:
+        paths = [os.path.join(output_dir, f"shard-{i:04d}{suffix}") for i in range(shards)]
+    started = time.perf_counter()
+    with multiprocessing.Pool(shards) as pool:
+        results = pool.starmap(
+            generate_shard,
+            [(i, master_seed, per_shard[i], paths[i], start, step_ms, shard_level, run_id) for i in range(shards)]
+        )
+    generated = time.perf_counter() - started
+    summary = {
+        "shards": shards,
+        "seed": master_seed,
+        "run_id": run_id,
+        "events": sum(count for _, _, count in results),
+        "generate_sec": round(generated, 3),
+        "events_per_sec": round(total_events / generated, 1) if generated > 0 else None
     }
-    return event
+    if output:
+        if not direct:
+            merge_shard_files(paths, output, compress_level)
+            for path in paths:
+                os.remove(path)
+        summary["output"] = output
+    else:
+        summary["shard_files"] = paths
+    return summary
 
-def send_to_logstash(event, max_retries=3, retry_delay=5):
-    """发送事件到 Logstash，带重试机制"""
+def send_to_logstash(event, max_retries=3, retry_delay=1.0):
+    """
+    发送事件到 Logstash
+    开启本地 spool 时只追加到磁盘后立即返回，由后台线程经持久连接批量发送，Logstash 不可用期间事件不丢失；
+    未开启时最多尝试 max_retries 次，重试之间按 retry_delay 为基数做带抖动的指数退避，失败返回 False
+    :param retry_delay: 第一次重试的退避上限（秒），之后每次翻倍
+    """
+    if spool is not None:
+        started = time.perf_counter()
+        spool.append_event(event)
+        if metrics is not None:
+            metrics.record("send_to_logstash", time.perf_counter() - started, "spooled")
+        return True
     for attempt in range(max_retries):
+        started = time.perf_counter()
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.settimeout(10)  # 设置超时时间
                 s.connect((LOGSTASH_HOST, LOGSTASH_PORT))
                 s.sendall(json.dumps(event).encode() + b'\n')
-                logger.info(f"已发送事件: {event['event_type']} 严重程度: {event['severity']}")
+                logger.debug(f"已发送事件: {event['event_type']} 严重程度: {event['severity']}")
+                if metrics is not None:
+                    metrics.record("send_to_logstash", time.perf_counter() - started)
                 return True
         except Exception as e:
             if attempt < max_retries - 1:
+                if metrics is not None:
+                    metrics.record("send_to_logstash", time.perf_counter() - started, "retry")
                 logger.warning(f"发送事件失败 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-                time.sleep(retry_delay)
+                time.sleep(backoff_delay(attempt, retry_delay, retry_delay * 2 ** max_retries))
             else:
+                if metrics is not None:
+                    metrics.record("send_to_logstash", time.perf_counter() - started, "failure")
                 logger.error(f"发送事件失败，已达到最大重试次数: {str(e)}")
                 return False
 
+class LogstashConnection:
+    """到 Logstash 的持久 TCP 连接，发送失败时重连一次后只重发未发送完的事件"""
+
+    def __init__(self, host=LOGSTASH_HOST, port=LOGSTASH_PORT, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+
+    def connect(self):
+        self.close()
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send(self, payload):
+        """
+        发送一段换行分隔的 JSON 数据
+        :param payload: 已编码的字节串
+        """
+        if self.sock is None:
+            self.connect()
+        view = memoryview(payload)
+        sent = 0
+        try:
+            while sent < len(view):
+                sent += self.sock.send(view[sent:])
+        except OSError:
+            # 已完整发出的事件不再重发；发送到一半的事件从行首重发（旧连接上的残行由 Logstash 丢弃）
+            sent = payload.rfind(b"\n", 0, sent) + 1
+            self.connect()
+            self.sock.sendall(view[sent:])
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+def encode_events(events):
+    """将事件列表编码为换行分隔的 JSON（json_lines）字节串，安装 orjson 时使用 orjson"""
+    if orjson is not None:
+        return b"".join([orjson.dumps(event) + b"\n" for event in events])
+    return "".join(json.dumps(event) + "\n" for event in events).encode()
+
+def _percentile(sorted_values, pct):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+def _benchmark_worker(index, rate, deadline, batch_size, results, run_id=None):
+    """
+    压测工作线程：持有一个持久连接和独立的快速模拟器，按速率批量发送预编码的事件
+    :param rate: 本线程目标事件速率（每秒），0 表示不限速
+    :param run_id: 本次压测的运行标识，所有工作线程相同
+    """
+    simulator = FastAttackSimulator(attack_sources=ATTACK_SOURCES, attack_id_base=index << 32, run_id=run_id)
+    for _ in range(2):
+        simulator.start_new_attack()
+    conn = LogstashConnection()
+    sent = 0
+    errors = 0
+    failures = 0  # 连续失败次数，决定退避时间
+    latencies = []
+    next_due = time.perf_counter()
+    try:
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if rate:
+                if now < next_due:
+                    time.sleep(next_due - now)
+                next_due += batch_size / rate
+            payload = simulator.generate_batch(batch_size)
+            started = time.perf_counter()
+            try:
+                conn.send(payload)
+            except OSError as e:
+                errors += 1
+                if metrics is not None:
+                    metrics.record("send_batch", time.perf_counter() - started, "failure")
+                logger.warning(f"工作线程 {index} 发送失败: {str(e)}")
+                # Logstash 不可用时带抖动退避，不在重连上空转（不限速时尤其如此）
+                time.sleep(min(backoff_delay(failures), max(0.0, deadline - time.perf_counter())))
+                failures += 1
+                next_due = time.perf_counter()
+                continue
+            failures = 0
+            latency = time.perf_counter() - started
+            latencies.append(latency)
+            sent += batch_size
+            if metrics is not None:
+                metrics.record("send_batch", latency)
+                metrics.record_batch("send_batch", batch_size)
+    finally:
+        conn.close()
+        results[index] = (sent, errors, latencies)
+
+def run_benchmark(eps=0, duration=10, workers=1, batch_size=500):
+    """
+    非交互压测模式：多个工作线程各自复用持久连接批量发送事件
+    :param eps: 目标总事件速率（每秒），0 表示不限速
+    :param duration: 压测时长（秒）
+    :param workers: 工作线程数（即连接数）
+    :param batch_size: 每次 sendall 写入的事件数
+    :return: 实际发送量、实际 EPS 和批次发送延迟百分位（毫秒）
+    """
+    results = [None] * workers
+    run_id = new_run_id()
+    started = time.perf_counter()
+    deadline = started + duration
+    threads = [
+        threading.Thread(
+            target=_benchmark_worker,
+            args=(i, eps / workers, deadline, batch_size, results, run_id),
+            name=f"benchmark-{i}"
+        )
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    sent = sum(result[0] for result in results)
+    errors = sum(result[1] for result in results)
+    latencies = sorted(round(latency * 1000, 3) for result in results for latency in result[2])
+    return {
+        "target_eps": eps or None,
+        "achieved_eps": round(sent / elapsed, 1),
+        "events_sent": sent,
+        "send_errors": errors,
+        "duration_sec": round(elapsed, 3),
+        "workers": workers,
+        "batch_size": batch_size,
+        "batch_latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None
+        }
+    }
+
 def wait_for_logstash(max_attempts=30, delay=2):
     """等待 Logstash 服务就绪"""
     logger.info(f"等待 Logstash 服务就绪 ({LOGSTASH_HOST}:{LOGSTASH_PORT})...")
@@ -263,16 +920,92 @@ def get_attack_interval():
         logger.warning("输入无效，使用默认值50毫秒")
         return 50
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="安全事件测试数据生成器")
+    parser.add_argument("--interval", type=int, default=None,
+                        help="攻击间隔（毫秒），指定后不再交互式询问")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="非交互压测模式：持久连接 + 批量发送，结束后输出 EPS 和延迟统计")
+    parser.add_argument("--eps", type=float, default=0,
+                        help="压测模式的目标总事件速率（每秒），0 表示不限速")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="压测时长（秒）")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="压测工作线程数（每个线程一个持久连接）")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="压测模式每次 sendall 写入的事件数")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="启用运行指标并在该端口暴露 Prometheus 文本格式的 /metrics")
+    parser.add_argument("--metrics-log-interval", type=float, default=0,
+                        help="启用运行指标并每隔若干秒输出一行结构化指标日志")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="分片生成模式：进程数，每个进程持有独立的攻击活动状态，结果写入文件")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="分片生成模式的主种子，相同种子生成完全相同的事件")
+    parser.add_argument("--events", type=int, default=100000,
+                        help="分片生成模式的总事件数")
+    parser.add_argument("--output", default=None,
+                        help="分片生成模式：按时间戳归并后的单个 NDJSON 文件")
+    parser.add_argument("--output-dir", default=None,
+                        help="分片生成模式：分片文件目录（未指定 --output 时保留每个分片的文件）")
+    parser.add_argument("--export", default=None,
+                        help="导出模式：将数据集写入单个文件（.gz 后缀为 gzip 压缩的 NDJSON），未指定 --shards 时使用单进程")
+    parser.add_argument("--compress", action="store_true",
+                        help="分片文件使用 gzip 压缩")
+    parser.add_argument("--compress-level", type=int, default=6,
+                        help="gzip 压缩级别（1-9）")
+    parser.add_argument("--start", default=SHARD_START_TIME,
+                        help="分片生成模式：模拟时钟起始时间（ISO 格式）")
+    parser.add_argument("--step-ms", type=float, default=50,
+                        help="分片生成模式：每个事件推进的模拟时间（毫秒）")
+    parser.add_argument("--run-id", default=None,
+                        help="分片生成模式：写入事件的运行标识，用于区分不同数据集的攻击活动（默认 seed-<主种子>）")
+    parser.add_argument("--spool-dir", default=GENERATOR_SPOOL_DIR,
+                        help="持续生成模式：开启本地 spool 并指定目录，事件先落盘再由后台线程批量发送（默认直接发送）")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """主函数：持续生成和发送事件"""
+    global metrics, spool
+    args = parse_args(argv)
+    if args.metrics_port or args.metrics_log_interval:
+        from tracer_metrics import Metrics
+        metrics = Metrics()
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+        if args.metrics_log_interval:
+            metrics.start_log_reporter(args.metrics_log_interval)
     logger.info(f"开始生成测试事件... (Logstash: {LOGSTASH_HOST}:{LOGSTASH_PORT})")
     
+    if args.shards or args.export:
+        summary = run_sharded(args.shards or 1, args.seed, args.events, args.export or args.output,
+                              args.output_dir, args.start, args.step_ms,
+                              compress=True if args.compress else None,
+                              compress_level=args.compress_level, run_id=args.run_id)
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        return
+    
+    if args.benchmark:
+        if not wait_for_logstash():
+            return
+        report = run_benchmark(args.eps, args.duration, args.workers, args.batch_size)
+        logger.info(f"压测结果: {json.dumps(report, ensure_ascii=False)}")
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+    
     # 获取攻击间隔
-    attack_interval_ms = get_attack_interval()
+    attack_interval_ms = args.interval if args.interval is not None else get_attack_interval()
     logger.info(f"攻击间隔设置为: {attack_interval_ms}±5毫秒")
     
-    # 等待 Logstash 服务就绪
-    if not wait_for_logstash():
+    drainer = None
+    if args.spool_dir:
+        # Logstash 尚未就绪时也可以开始生成，事件在 spool 中等待
+        spool = EventSpool(args.spool_dir)
+        connection = LogstashConnection()
+        drainer = SpoolDrainer(spool, lambda events: connection.send(encode_events(events)),
+                               name="spool-logstash").start()
+    elif not wait_for_logstash():
+        # 等待 Logstash 服务就绪
         return
     
     try:
@@ -284,9 +1017,7 @@ def main():
             # 生成并发送事件
             event = generate_event()
             if event and not send_to_logstash(event):
-                logger.error("发送事件失败，等待 5 秒后重试...")
-                time.sleep(5)
-                continue
+                logger.error("发送事件失败，已丢弃该事件（使用 --spool-dir 可在 Logstash 恢复后补发）")
             
             # 根据设置的间隔随机等待
             interval_sec = (attack_interval_ms + random.uniform(-5, 5)) / 1000.0
@@ -296,6 +1027,12 @@ def main():
         logger.info("停止生成测试事件")
     except Exception as e:
         logger.error(f"发生错误: {str(e)}")
+    finally:
+        if drainer is not None:
+            if not drainer.stop():
+                logger.warning(f"spool 中尚有未发送的事件，下次启动后继续发送: {args.spool_dir}")
+            spool.close()
+            connection.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+攻击图谱批量分析
+- 一次流式读取 Server/ATTACKED 边表（驱动按 fetch_size 分页拉取），在内存中构建稀疏邻接矩阵
+- 正向影响范围（blast radius）：从失陷主机出发沿攻击方向可达的主机及跳数
+- 跳板主机排名：PageRank（攻击汇聚程度）和采样 Brandes 介数中心性（位于攻击路径中间的程度，按起点分块做稀疏矩阵乘法）
+- 攻击活动聚类：按边上的活动标签（event 边的 campaign、aggregate 边的 campaigns）构建 活动-主机 二分图，取连通分量
+- 分数通过参数化 UNWIND 分批写回节点属性，不逐节点往返
+
+依赖说明：
+- 需要安装 numpy 和 scipy（pip install numpy scipy）
+"""
+
+from array import array
+import argparse
+import json
+import random
+
+try:
+    import numpy as np
+    from scipy import sparse
+    from scipy.sparse import csgraph
+except ImportError:  # 分析依赖为可选安装
+    np = None
+    sparse = None
+    csgraph = None
+
+# 边表读取：aggregate 模式的聚合边按 count 加权并带有活动标签列表，event 模式每条边权重为 1、至多一个活动标签
+EDGE_LIST_QUERY = """
+MATCH (source:Server)-[r:ATTACKED]->(target:Server)
+WHERE $since IS NULL OR r.timestamp >= $since
+RETURN source.ip AS source_ip, target.ip AS target_ip, coalesce(r.count, 1) AS weight,
+       CASE WHEN r.campaigns IS NOT NULL THEN r.campaigns
+            WHEN r.campaign IS NOT NULL THEN [r.campaign]
+            ELSE [] END AS campaigns
+"""
+
+# 分数写回：每个批次一次 UNWIND 写事务
+WRITE_SCORES_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Server {ip: row.ip})
+SET n += row.scores
+"""
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("图谱分析需要安装 numpy 和 scipy")
+
+class EdgeList:
+    """
+    整数编码的边表：节点 IP 与活动标签各自编码为连续整数
+    一条边可带多个活动标签（聚合边），标签以 (边编号, 活动编号) 对单独保存
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.campaigns = []
+        self._node_ids = {}
+        self._campaign_ids = {}
+        self._src = array("i")
+        self._dst = array("i")
+        self._weight = array("d")
+        self._link_edge = array("i")
+        self._link_campaign = array("i")
+
+    def __len__(self):
+        return len(self._src)
+
+    def _intern(self, value, ids, values):
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(values)
+            values.append(value)
+        return code
+
+    def add(self, source_ip, target_ip, weight=1, campaigns=()):
+        """
+        :param campaigns: 活动标签列表
+        """
+        edge = len(self._src)
+        self._src.append(self._intern(source_ip, self._node_ids, self.nodes))
+        self._dst.append(self._intern(target_ip, self._node_ids, self.nodes))
+        self._weight.append(weight)
+        for campaign in campaigns:
+            if campaign is not None:
+                self._link_edge.append(edge)
+                self._link_campaign.append(self._intern(campaign, self._campaign_ids, self.campaigns))
+
+    def node_id(self, ip):
+        return self._node_ids.get(ip)
+
+    def arrays(self):
+        """
+        :return: (src, dst, weight) 三个 NumPy 数组（与 array 共享内存，不复制）
+        """
+        _require_numpy()
+        return (np.frombuffer(self._src, dtype=np.int32), np.frombuffer(self._dst, dtype=np.int32),
+                np.frombuffer(self._weight, dtype=np.float64))
+
+    def campaign_links(self):
+        """
+        :return: (边编号, 活动编号) 两个 NumPy 数组
+        """
+        _require_numpy()
+        return np.frombuffer(self._link_edge, dtype=np.int32), np.frombuffer(self._link_campaign, dtype=np.int32)
+
+    def adjacency(self):
+        """
+        :return: n×n CSR 稀疏邻接矩阵，A[i, j] 为 i 攻击 j 的边权重之和（平行边合并）
+        """
+        src, dst, weight = self.arrays()
+        n = len(self.nodes)
+        return sparse.coo_matrix((weight, (src, dst)), shape=(n, n)).tocsr()
+
+def load_edge_list(driver, since=None, fetch_size=10000):
+    """
+    流式读取攻击边表，驱动每次拉取 fetch_size 条记录，内存中只保留编码后的数组
+    :param since: 只读取该时间（ISO 字符串）之后的边，None 表示全部
+    :return: EdgeList
+    """
+    edges = EdgeList()
+    with driver.session(fetch_size=fetch_size) as session:
+        for record in session.run(EDGE_LIST_QUERY, {"since": since}):
+            edges.add(record["source_ip"], record["target_ip"], record["weight"], record["campaigns"])
+    return edges
+
+def blast_radius(edges, ip, max_hops=None, adjacency=None):
+    """
+    正向影响范围：从 ip 出发沿攻击方向可达的主机
+    :param max_hops: 最大跳数，None 表示不限
+    :param adjacency: 可复用的邻接矩阵
+    :return: {IP: 最少跳数}，不含起点
+    """
+    _require_numpy()
+    source = edges.node_id(ip)
+    if source is None:
+        return {}
+    adjacency = edges.adjacency() if adjacency is None else adjacency
+    hops = csgraph.shortest_path(adjacency, unweighted=True, indices=source)
+    reachable = np.flatnonzero(np.isfinite(hops))
+    if max_hops is not None:
+        reachable = reachable[hops[reachable] <= max_hops]
+    return {edges.nodes[node]: int(hops[node]) for node in reachable if node != source}
+
+def pagerank(adjacency, damping=0.85, tol=1e-8, max_iter=100):
+    """
+    加权 PageRank（幂迭代，稀疏矩阵向量乘）
+    出度为 0 的节点的分数均匀分配给所有节点
+    :return: 分数数组，总和为 1
+    """
+    _require_numpy()
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inverse = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+    # 转置后按列归一化：rank_next = damping * M^T · rank
+    transition = (sparse.diags(inverse) @ adjacency).T.tocsr()
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        leaked = rank[dangling].sum()
+        updated = damping * (transition @ rank + leaked / n) + (1 - damping) / n
+        if np.abs(updated - rank).sum() < tol:
+            return updated
+        rank = updated
+    return rank
+
+def betweenness(adjacency, samples=64, seed=42, block_elements=1 << 22):
+    """
+    无权有向图的介数中心性（Brandes 算法的矩阵形式，从 samples 个随机起点估算，按 n/samples 缩放）
+    多个起点组成一个块同时计算：正向按层做 稀疏邻接矩阵 × 稠密前沿矩阵 求最短路径数，
+    反向按层用同一乘法回传依赖度，Python 循环次数只与块数和图的深度有关
+    :param samples: 采样起点数，大于等于节点数时为精确值
+    :param block_elements: 每块稠密矩阵（节点数 × 块内起点数）的元素上限，控制内存
+    :return: 分数数组
+    """
+    _require_numpy()
+    n = adjacency.shape[0]
+    scores = np.zeros(n)
+    if n == 0:
+        return scores
+    # 只看边是否存在：平行边合并后的权重不影响最短路径数
+    pattern = adjacency.tocsr(copy=True)
+    pattern.data = np.ones_like(pattern.data)
+    forward = pattern.T.tocsr()
+    sources = np.arange(n) if samples >= n else np.array(random.Random(seed).sample(range(n), samples))
+    block = max(1, min(len(sources), block_elements // n))
+    for start in range(0, len(sources), block):
+        chunk = sources[start:start + block]
+        columns = np.arange(len(chunk))
+        # 矩阵的第 j 列对应第 j 个起点：sigma 为最短路径数，depth 为跳数（-1 表示不可达）
+        sigma = np.zeros((n, len(chunk)))
+        sigma[chunk, columns] = 1
+        depth = np.full((n, len(chunk)), -1, dtype=np.int32)
+        depth[chunk, columns] = 0
+        frontier = sigma.copy()
+        level = 0
+        while True:
+            # paths[w, j] = 第 j 个起点经当前层到达 w 的最短路径数（只保留首次到达的节点）
+            paths = forward @ frontier
+            paths[depth >= 0] = 0
+            reached = paths > 0
+            if not reached.any():
+                break
+            level += 1
+            depth[reached] = level
+            sigma += paths
+            frontier = paths
+        delta = np.zeros((n, len(chunk)))
+        for current in range(level, 0, -1):
+            # delta[v] += sigma[v] / sigma[w] * (1 + delta[w])，w 为 v 在下一层的后继
+            at_level = depth == current
+            coefficient = np.divide(1 + delta, sigma, out=np.zeros_like(delta), where=at_level)
+            delta += np.where(depth == current - 1, sigma * (pattern @ coefficient), 0)
+        delta[chunk, columns] = 0
+        scores += delta.sum(axis=1)
+    if samples < n:
+        scores *= n / samples
+    return scores
+
+def campaign_clusters(edges):
+    """
+    攻击活动聚类：共享主机的活动标签归入同一簇（活动-主机 二分图的连通分量）
+    :return: (每个节点的簇编号数组，无活动标签的节点为 -1, [{"campaigns": [...], "hosts": [...]}, ...])
+    """
+    _require_numpy()
+    src, dst, _ = edges.arrays()
+    link_edge, campaign = edges.campaign_links()
+    n, c = len(edges.nodes), len(edges.campaigns)
+    if not len(link_edge):
+        return np.full(n, -1, dtype=np.int64), []
+    # 二分图：节点 0..n-1 为主机，n..n+c-1 为活动
+    hosts = np.concatenate([src[link_edge], dst[link_edge]])
+    labels = np.concatenate([campaign, campaign]) + n
+    graph = sparse.coo_matrix((np.ones(len(hosts)), (hosts, labels)), shape=(n + c, n + c))
+    _, component = csgraph.connected_components(graph, directed=False)
+    touched = np.zeros(n, dtype=bool)
+    touched[hosts] = True
+    # 只为包含活动标签的分量重新编号
+    campaign_components = component[n:]
+    numbering = {old: new for new, old in enumerate(dict.fromkeys(campaign_components.tolist()))}
+    node_cluster = np.array([numbering[component[node]] if touched[node] else -1 for node in range(n)],
+                            dtype=np.int64)
+    clusters = [{"campaigns": [], "hosts": []} for _ in numbering]
+    for label, old in enumerate(campaign_components.tolist()):
+        clusters[numbering[old]]["campaigns"].append(edges.campaigns[label])
+    for node in np.flatnonzero(touched):
+        clusters[node_cluster[node]]["hosts"].append(edges.nodes[node])
+    return node_cluster, clusters
+
+def write_scores(tracer, nodes, columns, batch_size=5000):
+    """
+    将分数批量写回 Server 节点属性，每个批次经 SecurityTracer.graph_write 执行（熔断和托管事务重试）
+    :param tracer: SecurityTracer（Neo4j 图存储）
+    :param nodes: 节点 IP 列表
+    :param columns: {属性名: 与 nodes 等长的分数数组}，值为 None 时删除该属性（清除上次的结果）
+    :return: 写入的节点数
+    """
+    names = list(columns)
+    written = 0
+    for start in range(0, len(nodes), batch_size):
+        rows = []
+        for node in range(start, min(start + batch_size, len(nodes))):
+            scores = {}
+            for name in names:
+                value = columns[name][node]
+                scores[name] = value.item() if hasattr(value, "item") else value
+            rows.append({"ip": nodes[node], "scores": scores})
+        tracer.graph_write(WRITE_SCORES_QUERY, {"rows": rows})
+        written += len(rows)
+    return written
+
+def _top(edges, scores, top):
+    order = np.argsort(-scores, kind="stable")[:top]
+    return [{"ip": edges.nodes[node], "score": round(float(scores[node]), 6)} for node in order if scores[node] > 0]
+
+def run_graph_analytics(tracer, since=None, betweenness_samples=64, top=10, write_back=True, fetch_size=10000):
+    """
+    读取边表并计算全部指标，可选写回节点属性 pagerank、betweenness、campaign_cluster
+    :param tracer: SecurityTracer（Neo4j 图存储），读取使用其驱动，写回经其熔断和重试策略
+    :return: 汇总（规模、Top 跳板主机、攻击活动簇）
+    """
+    _require_numpy()
+    edges = load_edge_list(tracer.neo4j_driver, since, fetch_size)
+    adjacency = edges.adjacency()
+    ranks = pagerank(adjacency)
+    pivots = betweenness(adjacency, betweenness_samples)
+    node_cluster, clusters = campaign_clusters(edges)
+    written = 0
+    if write_back and edges.nodes:
+        written = write_scores(tracer, edges.nodes, {
+            "pagerank": ranks,
+            "betweenness": pivots,
+            "campaign_cluster": [int(cluster) if cluster >= 0 else None for cluster in node_cluster]
+        })
+    return {
+        "nodes": len(edges.nodes),
+        "edges": len(edges),
+        "top_pagerank": _top(edges, ranks, top),
+        "top_betweenness": _top(edges, pivots, top),
+        "campaign_clusters": clusters,
+        "nodes_written": written
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="攻击图谱批量分析")
+    parser.add_argument("--since", default=None, help="只分析该时间（ISO 格式）之后的攻击边")
+    parser.add_argument("--blast-radius", default=None, help="输出该主机的正向影响范围")
+    parser.add_argument("--max-hops", type=int, default=None, help="影响范围的最大跳数")
+    parser.add_argument("--samples", type=int, default=64, help="介数中心性的采样起点数")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--no-write", action="store_true", help="不写回节点属性")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    from security_trace import SecurityTracer
+
+    args = parse_args(argv)
+    tracer = SecurityTracer()
+    try:
+        if args.blast_radius:
+            edges = load_edge_list(tracer.neo4j_driver, args.since)
+            result = blast_radius(edges, args.blast_radius, args.max_hops)
+        else:
+            result = run_graph_analytics(tracer, args.since, args.samples, args.top, not args.no_write)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    finally:
+        tracer.close()
+
+if __name__ == "__main__":
+    main()
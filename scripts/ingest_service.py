@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+"""
+攻击图谱旁路写入服务
+- 通过 TCP（换行分隔的 JSON）和 HTTP（POST JSON 数组或 NDJSON）接收事件
+- 按时间和数量对事件分批，经 SecurityTracer 以参数化 UNWIND 写入 Neo4j（复用驱动连接池）
+- HTTP 请求的事件全部入队或全部拒绝，所在批次写入成功（或写入 spool）后才返回 200
+- 写入遇到暂时性错误（Neo4j 不可用、熔断）时按指数退避重试同一批次，不丢弃事件
+- GET /metrics 返回队列深度、写入延迟等运行指标
+- 可选接入实时攻击链检测（KillChainDetector），事件入图前即检测多跳攻击链
+- 替代 Logstash 中逐事件拼接 Cypher 的 Neo4j http 输出
+
+本地测试可使用 --stub 启动，图谱写入只记录在内存中，无需 Neo4j
+"""
+
+import argparse
+from collections import deque
+import json
+import logging
+import os
+import queue
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+from event_spool import is_transient
+
+# 加载环境变量
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 服务配置
+INGEST_HOST = os.getenv("INGEST_HOST", "0.0.0.0")
+INGEST_TCP_PORT = int(os.getenv("INGEST_TCP_PORT", "5170"))  # NDJSON TCP 端口，0 表示不启用
+INGEST_HTTP_PORT = int(os.getenv("INGEST_HTTP_PORT", "8090"))  # HTTP 端口
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100000"))  # 内存队列上限
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))  # 每批最多事件数
+INGEST_BATCH_LINGER = float(os.getenv("INGEST_BATCH_LINGER", "0.5"))  # 批次最长等待时间（秒）
+INGEST_WRITERS = int(os.getenv("INGEST_WRITERS", "2"))  # 并发写入线程数
+INGEST_ACK_TIMEOUT = float(os.getenv("INGEST_ACK_TIMEOUT", "30"))  # HTTP 请求等待写入确认的最长时间（秒），需小于 Logstash 的请求超时
+INGEST_MAX_BACKOFF = float(os.getenv("INGEST_MAX_BACKOFF", "30"))  # 写入失败重试的最长退避时间（秒）
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR") or None  # 设置后图谱写入先落盘到该目录的 spool，Neo4j 故障期间仍可确认请求
+
+# 图谱写入必需的字段
+REQUIRED_FIELDS = ("source_ip", "target_ip")
+
+def _is_valid(event):
+    return (isinstance(event, dict) and all(event.get(field) for field in REQUIRED_FIELDS)
+            and bool(event.get("attack_type") or event.get("event_type")))
+
+class _BoundedQueue:
+    """有界队列，支持一次放入多个元素：容量不足时整体等待或整体放弃，不会只放入一部分"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
+    def put_many(self, items, timeout=None):
+        """
+        :param timeout: 容量不足时最长等待时间（秒），None 表示一直等待
+        :raises queue.Full: 超时仍无足够容量，此时没有任何元素入队
+        :raises ValueError: 元素数超过队列上限，永远无法一次放入
+        """
+        if len(items) > self.maxsize:
+            raise ValueError(f"一次放入 {len(items)} 个元素，超过队列上限 {self.maxsize}")
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.maxsize - len(self._items) >= len(items), timeout):
+                raise queue.Full
+            self._items.extend(items)
+            self._cond.notify_all()
+
+    def get(self, timeout):
+        """:raises queue.Empty: timeout 内没有元素"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+class _Ack:
+    """一次 HTTP 请求的写入确认：请求中的事件全部写入（或被永久拒绝）后完成"""
+
+    def __init__(self, count):
+        self.count = count
+        self.pending = count
+        self.rejected = 0
+        self.done = threading.Event()
+        if not count:
+            self.done.set()
+
+class StubGraphBackend:
+    """
+    图谱写入桩：接口与 SecurityTracer.create_attack_paths 相同，只在内存中记录边
+    用于在没有 Neo4j 的环境下测试服务
+    """
+
+    def __init__(self, write_delay=0.0):
+        """
+        :param write_delay: 每个批次模拟的写入耗时（秒）
+        """
+        self.write_delay = write_delay
+        self.edges = []
+        self._lock = threading.Lock()
+
+    def create_attack_paths(self, events, batch_size=None, max_linger=None):
+        rows = list(events)
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        with self._lock:
+            self.edges.extend(rows)
+        return [{"batch": 1, "count": len(rows), "elapsed_ms": self.write_delay * 1000}]
+
+class IngestService:
+    def __init__(self, graph_backend, queue_size=INGEST_QUEUE_SIZE, batch_size=INGEST_BATCH_SIZE,
+                 linger=INGEST_BATCH_LINGER, writers=INGEST_WRITERS, detector=None):
+        """
+        :param graph_backend: 图谱写入后端（SecurityTracer 或 StubGraphBackend）
+        :param queue_size: 内存队列上限，队列满时 TCP 连接停止读取、HTTP 请求返回 503（事件不入队）
+        :param batch_size: 每批最多事件数
+        :param linger: 批次最长等待时间（秒）
+        :param writers: 并发写入线程数，每个线程各自从驱动连接池取连接
+        :param detector: 可选的攻击链检测器（KillChainDetector），由单个分批线程按入队顺序检测，
+                         再把批次分发给写入线程，同一主机的事件不会乱序到达检测器
+        """
+        self.graph_backend = graph_backend
+        self.batch_size = batch_size
+        self.linger = linger
+        self._queue = _BoundedQueue(queue_size)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.detector = detector
+        # 分批线程 -> 写入线程的批次队列，写入线程都忙时分批线程等待，背压传导到输入队列
+        self._batches = queue.Queue(maxsize=writers)
+        self._batcher = threading.Thread(target=self._batch_loop, name="ingest-batcher", daemon=True)
+        self._writers = [
+            threading.Thread(target=self._write_loop, name=f"ingest-writer-{i}", daemon=True)
+            for i in range(writers)
+        ]
+        self.received = 0
+        self.invalid = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_lag = None
+        self.max_lag = 0.0
+        self.last_batch_ms = None
+        self.alerts = 0
+
+    def start(self):
+        self._batcher.start()
+        for writer in self._writers:
+            writer.start()
+
+    def submit(self, event, timeout=None):
+        """
+        事件入队；缺少必需字段的事件计入 invalid 后丢弃
+        :param timeout: 队列满时最长等待时间（秒），None 表示一直等待
+        :return: 是否入队
+        """
+        return bool(self.submit_many([event], timeout).count)
+
+    def submit_many(self, events, timeout=None):
+        """
+        一组事件全部入队或全部不入队；缺少必需字段的事件计入 invalid 后丢弃
+        :param timeout: 队列容量不足时最长等待时间（秒），None 表示一直等待
+        :return: _Ack，count 为入队的事件数，done 在这些事件全部写入后置位
+        :raises queue.Full: 超时仍无足够容量，没有任何事件入队
+        :raises ValueError: 有效事件数超过队列上限
+        """
+        valid = [event for event in events if _is_valid(event)]
+        ack = _Ack(len(valid))
+        if valid:
+            now = time.monotonic()
+            self._queue.put_many([(now, event, ack) for event in valid], timeout)
+        with self._lock:
+            self.invalid += len(events) - len(valid)
+            self.received += len(valid)
+        return ack
+
+    def _next_batch(self):
+        """按数量和等待时间从队列中取出一个批次"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=0.2))
+        except queue.Empty:
+            return batch
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        """唯一的读取线程：分批、检测攻击链，再交给写入线程；停止时为每个写入线程放入结束标记"""
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            if self.detector is not None:
+                self._detect([event for _, event, _ in batch])
+            self._batches.put(batch)
+        for _ in self._writers:
+            self._batches.put(None)
+
+    def _write_loop(self):
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            events = [event for _, event, _ in batch]
+            started = time.monotonic()
+            rejected = self._write(events)
+            finished = time.monotonic()
+            # 延迟：批次中最早入队的事件到写入完成的时间
+            lag = finished - batch[0][0]
+            with self._lock:
+                self.written += len(events) - len(rejected)
+                self.failed += len(rejected)
+                self.batches += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self.last_batch_ms = (finished - started) * 1000
+                for position, (_, _, ack) in enumerate(batch):
+                    ack.pending -= 1
+                    ack.rejected += position in rejected
+                    if not ack.pending:
+                        ack.done.set()
+
+    def _write(self, events):
+        """
+        写入一个批次：暂时性错误按带抖动的指数退避重试整批，直到成功；
+        其余错误逐条重写该批次，找出无法写入的事件
+        :return: 被永久拒绝的事件下标集合
+        """
+        failures = 0
+        while True:
+            try:
+                self.graph_backend.create_attack_paths(events, batch_size=len(events))
+                return set()
+            except Exception as e:
+                if not is_transient(e):
+                    if len(events) == 1:
+                        logger.error(f"事件无法写入，已丢弃: {str(e)}")
+                        return {0}
+                    logger.error(f"批次写入失败（{len(events)} 个事件），逐条重写: {str(e)}")
+                    return self._isolate(events)
+                failures += 1
+                with self._lock:
+                    self.retries += 1
+                delay = random.uniform(0, min(INGEST_MAX_BACKOFF, 0.5 * 2 ** failures))
+                logger.warning(f"批次写入失败（{len(events)} 个事件），{delay:.1f} 秒后重试: {str(e)}")
+                time.sleep(delay)
+
+    def _isolate(self, events):
+        return {position for position, event in enumerate(events) if self._write([event])}
+
+    def _detect(self, events):
+        # 检测器维护跨批次的主机状态，只在分批线程中调用
+        alerts = [alert for event in events for alert in self.detector.process(event)]
+        for alert in alerts:
+            logger.warning(f"检测到攻击链: {json.dumps(alert, ensure_ascii=False)}")
+        if alerts:
+            with self._lock:
+                self.alerts += len(alerts)
+
+    def stop(self, timeout=30):
+        """停止分批和写入线程，等待队列中剩余事件写完"""
+        self._stopping.set()
+        self._batcher.join(timeout)
+        for writer in self._writers:
+            writer.join(timeout)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "received": self.received,
+                "invalid": self.invalid,
+                "written": self.written,
+                "failed": self.failed,
+                "retries": self.retries,
+                "batches": self.batches,
+                "last_lag_sec": round(self.last_lag, 3) if self.last_lag is not None else None,
+                "max_lag_sec": round(self.max_lag, 3),
+                "last_batch_ms": round(self.last_batch_ms, 3) if self.last_batch_ms is not None else None,
+                "killchain_alerts": self.alerts
+            }
+
+def _parse_body(body):
+    """
+    解析 HTTP 请求体：JSON 数组（Logstash json_batch）、单个 JSON 对象（可跨多行）或 NDJSON
+    先整体解析，失败时再按行解析 NDJSON
+    """
+    text = body.decode("utf-8").strip()
+    if not text:
+        return []
+    try:
+        return json.loads(text)
+    except ValueError:
+        if text.startswith("["):
+            raise
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def make_tcp_handler(service):
+    class NdjsonTcpHandler(socketserver.StreamRequestHandler):
+        """每行一个 JSON 事件；队列满时阻塞读取，背压传导给发送方"""
+
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    with service._lock:
+                        service.invalid += 1
+                    continue
+                service.submit(event)
+
+    return NdjsonTcpHandler
+
+def make_http_handler(service, ack_timeout=INGEST_ACK_TIMEOUT):
+    class IngestHttpHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._reply(200, service.metrics())
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/events":
+                self._reply(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                events = _parse_body(self.rfile.read(length))
+            except ValueError as e:
+                self._reply(400, {"error": f"无效的 JSON: {str(e)}"})
+                return
+            if isinstance(events, dict):
+                events = [events]
+            elif not isinstance(events, list):
+                self._reply(400, {"error": "请求体须为 JSON 对象、数组或 NDJSON"})
+                return
+            try:
+                ack = service.submit_many(events, timeout=5)
+            except queue.Full:
+                # 没有事件入队，Logstash 的 http 输出重试整个请求不会产生重复
+                self._reply(503, {"accepted": 0, "error": "队列已满"})
+                return
+            except ValueError as e:
+                self._reply(413, {"accepted": 0, "error": str(e)})
+                return
+            # 事件写入后再确认；超时返回 503 时已入队的事件仍会写入，Logstash 重试可能产生重复边
+            if not ack.done.wait(ack_timeout):
+                self._reply(503, {"error": "写入确认超时"})
+                return
+            self._reply(200, {"accepted": ack.count - ack.rejected, "rejected": ack.rejected})
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return IngestHttpHandler
+
+def serve(service, host=INGEST_HOST, tcp_port=INGEST_TCP_PORT, http_port=INGEST_HTTP_PORT,
+          ack_timeout=INGEST_ACK_TIMEOUT):
+    """
+    启动 TCP/HTTP 监听
+    :param ack_timeout: HTTP 请求等待写入确认的最长时间（秒）
+    :return: 已启动的服务器列表，调用方负责 shutdown
+    """
+    servers = []
+    if tcp_port:
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        servers.append(socketserver.ThreadingTCPServer((host, tcp_port), make_tcp_handler(service)))
+    if http_port:
+        ThreadingHTTPServer.allow_reuse_address = True
+        servers.append(ThreadingHTTPServer((host, http_port), make_http_handler(service, ack_timeout)))
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"ingest-{server.server_address[1]}",
+                         daemon=True).start()
+    return servers
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="攻击图谱旁路写入服务")
+    parser.add_argument("--host", default=INGEST_HOST)
+    parser.add_argument("--tcp-port", type=int, default=INGEST_TCP_PORT, help="NDJSON TCP 端口，0 表示不启用")
+    parser.add_argument("--http-port", type=int, default=INGEST_HTTP_PORT, help="HTTP 端口，0 表示不启用")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--linger", type=float, default=INGEST_BATCH_LINGER)
+    parser.add_argument("--writers", type=int, default=INGEST_WRITERS)
+    parser.add_argument("--queue-size", type=int, default=INGEST_QUEUE_SIZE)
+    parser.add_argument("--ack-timeout", type=float, default=INGEST_ACK_TIMEOUT,
+                        help="HTTP 请求等待写入确认的最长时间（秒），超时返回 503")
+    parser.add_argument("--spool-dir", default=INGEST_SPOOL_DIR,
+                        help="开启 SecurityTracer 的本地 spool：事件落盘后即确认，Neo4j 故障期间由后台线程补写")
+    parser.add_argument("--edge-mode", choices=["event", "aggregate"], default=None,
+                        help="ATTACKED 关系写入模式，缺省使用 EDGE_MODE 环境变量")
+    parser.add_argument("--detect-killchains", action="store_true",
+                        help="启用实时攻击链检测，告警输出到日志（模式见 KILLCHAIN_PATTERNS）")
+    parser.add_argument("--stub", action="store_true", help="使用内存桩代替 Neo4j，用于本地测试")
+    parser.add_argument("--metrics-interval", type=float, default=30,
+                        help="定期输出运行指标的间隔（秒），0 表示不输出")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.stub:
+        backend = StubGraphBackend()
+    else:
+        from security_trace import SecurityTracer
+        backend = SecurityTracer(**({"edge_mode": args.edge_mode} if args.edge_mode else {}))
+        backend.ensure_schema()
+        if args.spool_dir:
+            backend.enable_spool(args.spool_dir)
+    detector = None
+    if args.detect_killchains:
+        from killchain_detector import KillChainDetector
+        detector = KillChainDetector()
+    service = IngestService(backend, args.queue_size, args.batch_size, args.linger, args.writers, detector)
+    service.start()
+    servers = serve(service, args.host, args.tcp_port, args.http_port, args.ack_timeout)
+    logger.info(f"写入服务已启动 (TCP: {args.tcp_port}, HTTP: {args.http_port}, 后端: "
+                f"{'stub' if args.stub else 'neo4j'})")
+    try:
+        while True:
+            time.sleep(args.metrics_interval or 3600)
+            if args.metrics_interval:
+                logger.info(f"运行指标: {json.dumps(service.metrics(), ensure_ascii=False)}")
+    except KeyboardInterrupt:
+        logger.info("正在停止写入服务...")
+    finally:
+        for server in servers:
+            server.shutdown()
+        service.stop()
+        if not args.stub:
+            backend.close()
+        logger.info(f"最终指标: {json.dumps(service.metrics(), ensure_ascii=False)}")
+
+if __name__ == "__main__":
+    main()
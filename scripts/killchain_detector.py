@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+实时攻击链检测
+- 逐个消费事件，维护每台主机上"已匹配到模式第几步"的部分攻击链
+- 事件 A→B 的攻击类型与 A 上某条部分链的下一步一致、且时间不早于上一跳时，链延伸到 B；
+  匹配到模式最后一步即产生告警，不再需要事后遍历整个图谱
+- 部分链按 (模式, 已匹配步数) 建立索引，每个事件只查看源主机上期待该攻击类型的链，
+  每个索引位置最多保留 max_partials 条，单个事件的处理代价为摊还 O(1)
+- 主机状态按最后活动时间排序，超出时间窗口或主机数上限时从最旧的一端淘汰，内存有界
+
+模式中以 "+" 结尾的步骤可以连续匹配多次（如 "LATERAL_MOVEMENT+" 表示一跳或多跳横向移动）
+"""
+
+from collections import OrderedDict, deque
+import argparse
+import datetime
+import json
+import os
+
+from attack_graph_cache import to_epoch
+
+# 默认检测模式，可通过 KILLCHAIN_PATTERNS 环境变量以 JSON 覆盖：{"名称": ["类型1", "类型2+", ...]}
+DEFAULT_PATTERNS = {
+    "phishing_to_exfiltration": ["PHISHING", "LATERAL_MOVEMENT+", "DATA_EXFILTRATION"],
+    "apt_to_exfiltration": ["APT", "LATERAL_MOVEMENT+", "DATA_EXFILTRATION"],
+    "lateral_to_ransomware": ["LATERAL_MOVEMENT+", "RANSOMWARE"]
+}
+KILLCHAIN_PATTERNS = json.loads(os.getenv("KILLCHAIN_PATTERNS", "null")) or DEFAULT_PATTERNS
+KILLCHAIN_WINDOW = float(os.getenv("KILLCHAIN_WINDOW", "86400"))  # 整条链从第一跳到最后一跳的最长时间（秒）
+KILLCHAIN_MAX_HOSTS = int(os.getenv("KILLCHAIN_MAX_HOSTS", "100000"))  # 同时跟踪的主机数上限
+KILLCHAIN_MAX_PARTIALS = int(os.getenv("KILLCHAIN_MAX_PARTIALS", "16"))  # 每台主机每个索引位置保留的部分链数
+KILLCHAIN_MAX_HOPS = int(os.getenv("KILLCHAIN_MAX_HOPS", "10"))  # 单条链的最大跳数（限制可重复步骤）
+
+class _Partial:
+    __slots__ = ("pattern", "matched", "start", "last", "hosts", "types", "timestamps")
+
+    def __init__(self, pattern, matched, start, last, hosts, types, timestamps):
+        self.pattern = pattern
+        self.matched = matched  # 已匹配的模式步骤数
+        self.start = start
+        self.last = last
+        self.hosts = hosts
+        self.types = types
+        self.timestamps = timestamps
+
+def _parse_pattern(steps):
+    """将模式步骤解析为 [(攻击类型, 是否可重复), ...]"""
+    parsed = []
+    for step in steps:
+        repeat = step.endswith("+")
+        parsed.append((step[:-1] if repeat else step, repeat))
+    return parsed
+
+class KillChainDetector:
+    def __init__(self, patterns=None, window_seconds=KILLCHAIN_WINDOW, max_hosts=KILLCHAIN_MAX_HOSTS,
+                 max_partials=KILLCHAIN_MAX_PARTIALS, max_hops=KILLCHAIN_MAX_HOPS, on_alert=None):
+        """
+        :param patterns: {名称: [攻击类型, ...]}，缺省使用 KILLCHAIN_PATTERNS
+        :param window_seconds: 整条链的最长时间跨度（秒），超出窗口的部分链被淘汰
+        :param max_hosts: 同时跟踪的主机数上限
+        :param max_partials: 每台主机每个 (模式, 步数) 位置保留的部分链数，超出时丢弃最旧的
+        :param max_hops: 单条链的最大跳数
+        :param on_alert: 告警回调，参数为告警字典
+        """
+        self.patterns = {name: _parse_pattern(steps) for name, steps in (patterns or KILLCHAIN_PATTERNS).items()}
+        self.window_seconds = window_seconds
+        self.max_hosts = max_hosts
+        self.max_partials = max_partials
+        self.max_hops = max_hops
+        self.on_alert = on_alert
+        # 主机 -> {(模式, 已匹配步数): deque[_Partial]}，按最后活动时间排序
+        self._hosts = OrderedDict()
+        self._host_seen = {}
+        # 攻击类型 -> 以该类型开始的模式；攻击类型 -> 期待该类型的 (模式, 已匹配步数)
+        self._starts = {}
+        self._expects = {}
+        for name, steps in self.patterns.items():
+            self._starts.setdefault(steps[0][0], []).append(name)
+            for matched in range(1, len(steps) + 1):
+                expected = {steps[matched][0]} if matched < len(steps) else set()
+                if steps[matched - 1][1]:
+                    expected.add(steps[matched - 1][0])
+                for attack_type in expected:
+                    self._expects.setdefault(attack_type, []).append((name, matched))
+        self._latest = float("-inf")
+        self._pending = []
+        self.events = 0
+        self.alerts = 0
+        self.evicted_hosts = 0
+
+    def _extend(self, name, partial, source_ip, target_ip, attack_type, ts):
+        """
+        部分链延伸一跳
+        :return: 新的部分链；匹配完整个模式时返回 None 并产生告警
+        """
+        steps = self.patterns[name]
+        if partial is None:
+            matched, hosts, types, timestamps, start = 1, (source_ip, target_ip), (attack_type,), (ts,), ts
+        else:
+            # 与下一步一致时推进；否则是可重复步骤的再次匹配，步数不变
+            advance = partial.matched < len(steps) and steps[partial.matched][0] == attack_type
+            matched = partial.matched + 1 if advance else partial.matched
+            hosts = partial.hosts + (target_ip,)
+            types = partial.types + (attack_type,)
+            timestamps = partial.timestamps + (ts,)
+            start = partial.start
+        if matched == len(steps) and not steps[-1][1]:
+            self._alert(name, hosts, types, timestamps)
+            return None
+        extended = _Partial(name, matched, start, ts, hosts, types, timestamps)
+        if matched == len(steps):
+            # 最后一步可重复时，每次匹配都告警，同时保留部分链以便继续延伸
+            self._alert(name, hosts, types, timestamps)
+        return extended
+
+    def _alert(self, name, hosts, types, timestamps):
+        self.alerts += 1
+        alert = {
+            "pattern": name,
+            "hosts": list(hosts),
+            "attack_types": list(types),
+            "first_seen": datetime.datetime.fromtimestamp(timestamps[0]).isoformat(),
+            "last_seen": datetime.datetime.fromtimestamp(timestamps[-1]).isoformat(),
+            "duration_sec": round(timestamps[-1] - timestamps[0], 3)
+        }
+        self._pending.append(alert)
+        if self.on_alert is not None:
+            self.on_alert(alert)
+
+    def _store(self, host, partial, ts):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {}
+        else:
+            self._hosts.move_to_end(host)
+        self._host_seen[host] = ts
+        key = (partial.pattern, partial.matched)
+        partials = state.get(key)
+        if partials is None:
+            partials = state[key] = deque(maxlen=self.max_partials)
+        partials.append(partial)
+
+    def _expire(self):
+        """从最久未活动的主机开始淘汰超出时间窗口或主机数上限的状态"""
+        cutoff = self._latest - self.window_seconds
+        while self._hosts:
+            host = next(iter(self._hosts))
+            if self._host_seen[host] >= cutoff and len(self._hosts) <= self.max_hosts:
+                break
+            del self._hosts[host]
+            del self._host_seen[host]
+            self.evicted_hosts += 1
+
+    def process(self, event):
+        """
+        处理一个事件，字段要求同 SecurityTracer.create_attack_paths
+        :return: 本事件触发的告警列表
+        """
+        self._pending = []
+        source_ip, target_ip = event.get("source_ip"), event.get("target_ip")
+        attack_type = event.get("attack_type") or event.get("event_type")
+        if not source_ip or not target_ip or not attack_type:
+            return []
+        ts = to_epoch(event.get("timestamp") or event.get("@timestamp"))
+        self.events += 1
+        self._latest = max(self._latest, ts)
+        cutoff = ts - self.window_seconds
+
+        extended = []
+        state = self._hosts.get(source_ip)
+        if state is not None:
+            for name, matched in self._expects.get(attack_type, ()):
+                for partial in state.get((name, matched), ()):
+                    # 只沿时间顺序延伸，且整条链不超出时间窗口和跳数上限
+                    if partial.last > ts or partial.start < cutoff or len(partial.types) >= self.max_hops:
+                        continue
+                    if target_ip in partial.hosts:
+                        continue
+                    extended.append(self._extend(name, partial, source_ip, target_ip, attack_type, ts))
+        for name in self._starts.get(attack_type, ()):
+            extended.append(self._extend(name, None, source_ip, target_ip, attack_type, ts))
+        for partial in extended:
+            if partial is not None:
+                self._store(target_ip, partial, ts)
+        self._expire()
+        return self._pending
+
+    def process_many(self, events):
+        """
+        :return: 生成器，逐个产出告警
+        """
+        for event in events:
+            yield from self.process(event)
+
+    def stats(self):
+        return {
+            "events": self.events,
+            "alerts": self.alerts,
+            "tracked_hosts": len(self._hosts),
+            "partial_chains": sum(len(partials) for state in self._hosts.values() for partials in state.values()),
+            "evicted_hosts": self.evicted_hosts
+        }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="实时攻击链检测")
+    parser.add_argument("path", help="事件文件（NDJSON 或 JSON 数组，可为 .gz），按时间顺序回放")
+    parser.add_argument("--patterns", default=None, help="JSON 格式的检测模式，缺省使用 KILLCHAIN_PATTERNS")
+    parser.add_argument("--window", type=float, default=KILLCHAIN_WINDOW, help="整条链的最长时间跨度（秒）")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    from security_trace import iter_event_file
+
+    args = parse_args(argv)
+    detector = KillChainDetector(json.loads(args.patterns) if args.patterns else None, args.window)
+    for alert in detector.process_many(iter_event_file(args.path)):
+        print(json.dumps(alert, ensure_ascii=False))
+    print(json.dumps(detector.stats(), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+查询结果缓存
+- LRU + TTL，条目数有上限
+- 每个条目按其涉及的 IP 建立反向索引，写入时只失效受影响 IP 的条目
+- 结果以紧凑的不可变元组保存，命中时再还原，调用方修改返回值不会污染缓存
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+# 通配索引：结果被截断（达到 limit）的条目无法确定涉及哪些 IP，任何写入都使其失效
+ANY_IP = "*"
+
+class QueryCache:
+    def __init__(self, max_entries=1024, ttl=60.0):
+        """
+        :param max_entries: 最大条目数，超过时淘汰最久未使用的条目
+        :param ttl: 条目有效期（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (过期时间, 紧凑结果, 涉及的 IP)
+        self._by_ip = {}  # IP -> {key}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        :return: (是否命中, 紧凑结果)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.expired += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key, value, ips):
+        """
+        :param value: 紧凑结果
+        :param ips: 结果涉及的 IP 集合，可包含 ANY_IP
+        """
+        ips = frozenset(ips)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, ips)
+            for ip in ips:
+                self._by_ip.setdefault(ip, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, ips = self._entries.pop(key)
+        for ip in ips:
+            keys = self._by_ip.get(ip)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_ip[ip]
+
+    def invalidate_ips(self, ips):
+        """
+        失效涉及任一给定 IP 的条目（以及结果被截断的条目）
+        :return: 失效的条目数
+        """
+        with self._lock:
+            keys = set(self._by_ip.get(ANY_IP, ()))
+            for ip in ips:
+                keys.update(self._by_ip.get(ip, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_ip.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+def compact_paths(paths):
+    """将追踪结果压缩为嵌套元组：每条路径为 (节点属性元组, 关系属性元组)"""
+    return tuple(
+        (
+            tuple(tuple(sorted(node.items())) for node in path["nodes"]),
+            tuple(tuple(sorted(rel.items())) for rel in path["relationships"])
+        )
+        for path in paths
+    )
+
+def expand_paths(compact):
+    """还原 compact_paths 的结果"""
+    return [
+        {"nodes": [dict(node) for node in nodes], "relationships": [dict(rel) for rel in rels]}
+        for nodes, rels in compact
+    ]
+
+def path_ips(paths):
+    """追踪结果涉及的所有节点 IP"""
+    return {node.get("ip") for path in paths for node in path["nodes"]}
+
+def compact_search(response):
+    """只保留 ES 响应中的命中总数和每个命中的 (_index, _id, _source)"""
+    hits = response["hits"]
+    total = hits.get("total")
+    if isinstance(total, dict):
+        total = (total.get("value"), total.get("relation"))
+    return total, tuple((hit.get("_index"), hit.get("_id"), hit.get("_source")) for hit in hits["hits"])
+
+def expand_search(compact):
+    """还原为精简的 ES 响应结构（hits.total / hits.hits）"""
+    total, hits = compact
+    if isinstance(total, tuple):
+        total = {"value": total[0], "relation": total[1]}
+    return {
+        "hits": {
+            "total": total,
+            "hits": [{"_index": index, "_id": doc_id, "_source": dict(source or {})}
+                     for index, doc_id, source in hits]
+        }
+    }
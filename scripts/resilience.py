@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+后端调用的容错工具
+- 带抖动的指数退避重试（full jitter：每次等待 0 到 min(上限, 基数 × 2^n) 之间的随机时间）
+- 熔断器：连续失败达到阈值后打开，在冷却期内直接拒绝调用，冷却后放行一个探测请求，
+  成功则恢复，失败则重新打开，避免在后端故障时堆积会话和请求
+"""
+
+import random
+import threading
+import time
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开期间拒绝调用"""
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, on_state_change=None):
+        """
+        :param name: 后端名称，用于错误信息
+        :param failure_threshold: 连续失败多少次后打开
+        :param reset_timeout: 打开后经过多久（秒）放行探测请求
+        :param on_state_change: 状态变化回调，参数为新状态（"open" 或 "closed"），用于记录指标；
+                                只在 关闭→打开 和 恢复关闭 时调用，已打开期间的失败和探测失败不重复触发
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_state_change = on_state_change
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """
+        :return: 是否放行本次调用；半开状态下同一时间只放行一个探测请求
+        """
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            recovered = self._opened_at is not None
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+        if recovered and self.on_state_change is not None:
+            self.on_state_change(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            was_closed = self._opened_at is None
+            # 探测失败时重新开始冷却；打开前已放行的调用在打开后失败，不延长冷却
+            if self._probing or (was_closed and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+            opened = was_closed and self._opened_at is not None
+            self._probing = False
+        if opened and self.on_state_change is not None:
+            self.on_state_change(self.OPEN)
+
+    def call(self, fn, is_failure=lambda e: True):
+        """
+        经熔断器执行调用
+        :param is_failure: 判断异常是否属于后端故障；其余异常（如查询语法错误）不计入失败
+        :raises CircuitOpenError: 熔断器打开时
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} 熔断中，{self.reset_timeout} 秒内拒绝请求")
+        try:
+            result = fn()
+        except Exception as e:
+            if is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+def backoff_delay(attempt, base_delay=0.1, max_delay=5.0, rng=random):
+    """
+    第 attempt 次（从 0 开始）重试前的 full jitter 等待时间
+    :return: 0 到 min(max_delay, base_delay × 2^attempt) 之间的随机秒数
+    """
+    return rng.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+def retry_call(fn, is_retryable, max_attempts=5, base_delay=0.1, max_delay=5.0, sleep=time.sleep, rng=random,
+               on_retry=None):
+    """
+    带抖动指数退避的重试
+    :param is_retryable: 判断异常是否可重试
+    :param max_attempts: 最多尝试次数（含第一次）
+    :param base_delay: 第一次重试的退避上限（秒），之后每次翻倍
+    :param max_delay: 单次退避的上限（秒）
+    :param on_retry: 每次重试前的回调，参数为刚失败的异常，用于记录指标
+    """
+    for attempt in range(max_attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_attempts - 1 or not is_retryable(e):
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            sleep(backoff_delay(attempt, base_delay, max_delay, rng))
@@ -3,6 +3,8 @@
 安全溯源与攻击路径追踪主脚本
 - 依赖 Neo4j 作为知识图谱数据库
 - 依赖 Elasticsearch 作为安全事件日志存储
+- 两者分别通过 GraphStore/EventStore 接口接入（Neo4jGraphStore、ElasticsearchEventStore），
+  也可以替换为 stores 模块中的内存实现
 
 主要功能：
 1. 记录攻击事件到 Elasticsearch
@@ -12,11 +14,28 @@
 """
 
 from neo4j import GraphDatabase  # 导入 Neo4j 驱动
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
 from elasticsearch import Elasticsearch  # 导入 Elasticsearch 驱动
+from elasticsearch.exceptions import ConflictError, ConnectionError as ESConnectionError, RequestError, TransportError
+from elasticsearch.helpers import bulk, streaming_bulk
+import argparse
 import datetime
+import gzip
+import hashlib
 import json
 import os
+import queue
+import threading
+import time
 from dotenv import load_dotenv
+from loguru import logger
+from attack_graph_cache import to_epoch
+from event_analytics import ANALYTICS_PAGE_SIZE, event_histogram, top_values
+from event_spool import EventSpool, SpoolDrainer
+from resilience import CircuitBreaker, retry_call
+from stores import EventStore, GraphStore, InMemoryEventStore, InMemoryGraphStore
+from query_cache import ANY_IP, compact_paths, compact_search, expand_paths, expand_search, path_ips
+from tracer_metrics import Metrics, instrumented
 
 # 加载环境变量
 load_dotenv()
@@ -31,112 +50,1415 @@ ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")  # ES 服务地址
 ES_USER = os.getenv("ES_USER", "elastic")  # 用户名
 ES_PASSWORD = os.getenv("ES_PASSWORD", "elastic123456")  # 密码
 
-class SecurityTracer:
-    def __init__(self):
-        # 初始化 Neo4j 连接
+# 连接池与超时配置
+NEO4J_POOL_SIZE = int(os.getenv("NEO4J_POOL_SIZE", "50"))  # Neo4j 连接池大小
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "15"))  # 建立连接超时（秒）
+NEO4J_ACQUIRE_TIMEOUT = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "30"))  # 从连接池获取连接的超时（秒）
+NEO4J_MAX_RETRY_TIME = float(os.getenv("NEO4J_MAX_RETRY_TIME", "15"))  # 托管事务遇到瞬时错误时的最长重试时间（秒）
+ES_POOL_SIZE = int(os.getenv("ES_POOL_SIZE", "25"))  # Elasticsearch 每个节点的连接池大小
+ES_TIMEOUT = float(os.getenv("ES_TIMEOUT", "30"))  # Elasticsearch 请求超时（秒）
+
+# 重试与熔断配置
+ES_RETRY_ATTEMPTS = int(os.getenv("ES_RETRY_ATTEMPTS", "5"))  # 429/5xx/连接错误的最多尝试次数
+ES_RETRY_BASE_DELAY = float(os.getenv("ES_RETRY_BASE_DELAY", "0.2"))  # 第一次重试的退避上限（秒），之后每次翻倍
+ES_RETRY_MAX_DELAY = float(os.getenv("ES_RETRY_MAX_DELAY", "10"))  # 单次退避上限（秒）
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # 连续失败多少次后熔断
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))  # 熔断后多久放行探测请求（秒）
+
+# 本地持久化队列配置（enable_spool 开启后写入先落盘，由后台线程回放到后端）
+SPOOL_DIR = os.getenv("SPOOL_DIR", "data/spool")  # spool 根目录，其下 events/ 和 graph/ 分别对应两个后端
+SPOOL_DRAIN_BATCH = int(os.getenv("SPOOL_DRAIN_BATCH", "1000"))  # 每次回放的最多事件数
+
+# 批量写入配置
+NEO4J_BATCH_SIZE = int(os.getenv("NEO4J_BATCH_SIZE", "500"))  # 每批最多事件数
+NEO4J_BATCH_LINGER = float(os.getenv("NEO4J_BATCH_LINGER", "1.0"))  # 批次最长等待时间（秒）
+
+# 攻击路径追踪配置
+TRACE_MAX_HOPS = int(os.getenv("TRACE_MAX_HOPS", "5"))  # 默认最大跳数
+TRACE_RESULT_LIMIT = int(os.getenv("TRACE_RESULT_LIMIT", "100"))  # 默认最多返回路径数
+
+# 图谱约束与索引（Neo4j 4.4+ 语法）
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT server_ip_unique IF NOT EXISTS FOR (s:Server) REQUIRE s.ip IS UNIQUE",
+    "CREATE INDEX attacked_timestamp IF NOT EXISTS FOR ()-[r:ATTACKED]-() ON (r.timestamp)",
+    "CREATE INDEX attacked_type_bucket IF NOT EXISTS FOR ()-[r:ATTACKED]-() ON (r.type, r.bucket)"
+]
+
+# 相关事件查询配置
+RELATED_EVENTS_PAGE_SIZE = int(os.getenv("RELATED_EVENTS_PAGE_SIZE", "1000"))  # 流式查询每页文档数
+
+# Elasticsearch 批量写入配置
+ES_BULK_CHUNK_SIZE = int(os.getenv("ES_BULK_CHUNK_SIZE", "500"))  # 每个 _bulk 请求的最大文档数
+ES_BULK_CHUNK_BYTES = int(os.getenv("ES_BULK_CHUNK_BYTES", str(5 * 1024 * 1024)))  # 每个 _bulk 请求的最大字节数
+ES_BULK_QUEUE_SIZE = int(os.getenv("ES_BULK_QUEUE_SIZE", "10000"))  # 内存队列上限，队列满时写入方阻塞
+ES_BULK_MAX_RETRIES = int(os.getenv("ES_BULK_MAX_RETRIES", "3"))  # 被拒绝（429）文档的最大重试次数
+
+# 事件索引配置（ensure_event_indices 创建索引模板、ILM 策略和滚动别名）
+ES_EVENTS_ALIAS = os.getenv("ES_EVENTS_ALIAS", "security-events")  # 滚动写入别名
+ES_EVENTS_WRITE_INDEX = os.getenv("ES_EVENTS_WRITE_INDEX", "")  # 写入目标，留空表示按天写入 security-events-YYYY.MM.dd
+ES_EVENTS_SHARDS = int(os.getenv("ES_EVENTS_SHARDS", "1"))  # 主分片数
+ES_EVENTS_REPLICAS = int(os.getenv("ES_EVENTS_REPLICAS", "0"))  # 副本数（单节点开发环境为 0）
+ES_EVENTS_REFRESH_INTERVAL = os.getenv("ES_EVENTS_REFRESH_INTERVAL", "30s")  # 刷新间隔，调大可提高写入吞吐
+ES_EVENTS_ROLLOVER_SIZE = os.getenv("ES_EVENTS_ROLLOVER_SIZE", "30gb")  # 主分片达到该大小时滚动
+ES_EVENTS_ROLLOVER_AGE = os.getenv("ES_EVENTS_ROLLOVER_AGE", "1d")  # 索引达到该时长时滚动
+ES_EVENTS_RETENTION = os.getenv("ES_EVENTS_RETENTION", "30d")  # 滚动后保留时长，之后删除
+ES_EVENT_ID_MODE = os.getenv("ES_EVENT_ID_MODE", "auto")  # auto：自动生成 ID；hash：按内容哈希去重
+
+# 事件索引映射：IP 字段使用 ip 类型，枚举字段使用 keyword，只有 details 做全文分词；
+# 其余未声明的字符串字段默认映射为 keyword，避免动态映射生成 text + keyword 两份索引
+EVENTS_INDEX_MAPPINGS = {
+    "dynamic_templates": [
+        {"strings_as_keyword": {
+            "match_mapping_type": "string",
+            "mapping": {"type": "keyword", "ignore_above": 1024}
+        }}
+    ],
+    "properties": {
+        "@timestamp": {"type": "date"},
+        "timestamp": {"type": "date"},
+        "source_ip": {"type": "ip", "ignore_malformed": True},
+        "target_ip": {"type": "ip", "ignore_malformed": True},
+        "event_type": {"type": "keyword"},
+        "attack_type": {"type": "keyword"},
+        "severity": {"type": "keyword"},
+        "request_method": {"type": "keyword"},
+        "response_code": {"type": "short"},
+        "attack_id": {"type": "long"},
+        "run_id": {"type": "keyword"},
+        "user_agent": {"type": "keyword", "ignore_above": 512},
+        "details": {"type": "text"}
+    }
+}
+
+# 批量创建攻击路径：一个批次只需一次参数化 UNWIND 事务
+BATCH_ATTACK_PATH_QUERY = """
+UNWIND $events AS event
+MERGE (source:Server {ip: event.source_ip})
+MERGE (target:Server {ip: event.target_ip})
+CREATE (source)-[r:ATTACKED {
+    type: event.attack_type,
+    timestamp: event.timestamp,
+    campaign: event.campaign
+}]->(target)
+"""
+
+# 边聚合模式：每个 (攻击源, 目标, 攻击类型, 时间桶) 只保留一条 ATTACKED 关系
+EDGE_MODE = os.getenv("EDGE_MODE", "event")  # event：每个事件一条边；aggregate：按时间桶聚合
+EDGE_BUCKET_SECONDS = int(os.getenv("EDGE_BUCKET_SECONDS", "3600"))  # 聚合时间桶大小（秒）
+
+# 严重程度排序，用于聚合边记录最高严重程度
+SEVERITY_RANKS = {"LOW": 1, "MEDIUM": 2, "HIGH": 3, "CRITICAL": 4}
+
+# 批量合并聚合边：批次内已在客户端预聚合，timestamp 保持为首次出现时间，兼容按时间过滤的追踪查询
+# SET 子句按顺序执行：timestamp 取已更新的 first_seen，乱序到达的批次也会把它向前移动
+# 合并键不含攻击活动，同一条边上的多个活动标签收集在 campaigns 列表中（去重）
+AGGREGATE_ATTACK_PATH_QUERY = """
+UNWIND $edges AS edge
+MERGE (source:Server {ip: edge.source_ip})
+MERGE (target:Server {ip: edge.target_ip})
+MERGE (source)-[r:ATTACKED {type: edge.attack_type, bucket: edge.bucket}]->(target)
+ON CREATE SET
+    r.timestamp = edge.first_seen,
+    r.first_seen = edge.first_seen,
+    r.last_seen = edge.last_seen,
+    r.count = edge.count,
+    r.max_severity = edge.max_severity,
+    r.severity_rank = edge.severity_rank,
+    r.campaigns = edge.campaigns
+ON MATCH SET
+    r.max_severity = CASE WHEN edge.severity_rank > r.severity_rank THEN edge.max_severity ELSE r.max_severity END,
+    r.severity_rank = CASE WHEN edge.severity_rank > r.severity_rank THEN edge.severity_rank ELSE r.severity_rank END,
+    r.first_seen = CASE WHEN edge.first_seen < r.first_seen THEN edge.first_seen ELSE r.first_seen END,
+    r.timestamp = r.first_seen,
+    r.last_seen = CASE WHEN edge.last_seen > r.last_seen THEN edge.last_seen ELSE r.last_seen END,
+    r.count = r.count + edge.count,
+    r.campaigns = coalesce(r.campaigns, []) + [c IN edge.campaigns WHERE NOT c IN coalesce(r.campaigns, [])]
+"""
+
+def _check_attack_event(event):
+    """
+    校验攻击事件的必需字段，缺失时抛出 ValueError
+    需包含 source_ip、target_ip 和 attack_type（或 event_type）
+    """
+    missing = [field for field in ("source_ip", "target_ip") if not event.get(field)]
+    if not (event.get("attack_type") or event.get("event_type")):
+        missing.append("attack_type")
+    if missing:
+        raise ValueError(f"攻击事件缺少字段: {', '.join(missing)}")
+
+def _check_security_event(event):
+    """
+    校验安全事件：须为字典，且至少包含 source_ip 或 target_ip（相关事件查询按 IP 关联），否则抛出 ValueError
+    """
+    if not isinstance(event, dict):
+        raise ValueError(f"安全事件必须是字典: {type(event).__name__}")
+    if not (event.get("source_ip") or event.get("target_ip")):
+        raise ValueError("安全事件缺少字段: source_ip 或 target_ip")
+
+def _attack_path_row(event):
+    """
+    将事件字典转换为 UNWIND 参数行，缺少必需字段时抛出 ValueError
+    兼容 attack_type（演示数据）与 event_type（生成器数据）两种字段名
+    campaign 取 attacker_identity（攻击链数据）或 attack_id（生成器数据），用于攻击活动聚类；
+    attack_id 是每次运行从 0 开始的计数器，带有 run_id 时加上运行前缀，避免不同运行的活动合并为同一个
+    """
+    _check_attack_event(event)
+    campaign = event.get("attacker_identity")
+    if campaign is None and event.get("attack_id") is not None:
+        campaign = f"attack-{event['attack_id']}"
+        if event.get("run_id"):
+            campaign = f"{event['run_id']}/{campaign}"
+    return {
+        "source_ip": event["source_ip"],
+        "target_ip": event["target_ip"],
+        "attack_type": event.get("attack_type") or event.get("event_type"),
+        "timestamp": (event.get("timestamp") or event.get("@timestamp")
+                      or datetime.datetime.now().isoformat()),
+        "severity": event.get("severity"),
+        "campaign": campaign
+    }
+
+def _aggregate_rows(rows, bucket_seconds):
+    """
+    在客户端按 (攻击源, 目标, 攻击类型, 时间桶) 预聚合一个批次
+    :param rows: _attack_path_row 生成的参数行
+    :param bucket_seconds: 时间桶大小（秒），桶以起始时间的秒级时间戳标识
+    :return: AGGREGATE_ATTACK_PATH_QUERY 的参数行，campaigns 为批次内出现过的活动标签（按首次出现排序）
+    """
+    edges = {}
+    for row in rows:
+        bucket = int(to_epoch(row["timestamp"]) // bucket_seconds * bucket_seconds)
+        key = (row["source_ip"], row["target_ip"], row["attack_type"], bucket)
+        rank = SEVERITY_RANKS.get(row["severity"], 0)
+        edge = edges.get(key)
+        if edge is None:
+            edges[key] = {
+                "source_ip": row["source_ip"],
+                "target_ip": row["target_ip"],
+                "attack_type": row["attack_type"],
+                "bucket": bucket,
+                "first_seen": row["timestamp"],
+                "last_seen": row["timestamp"],
+                "count": 1,
+                "max_severity": row["severity"],
+                "severity_rank": rank,
+                "campaigns": [] if row["campaign"] is None else [row["campaign"]]
+            }
+            continue
+        edge["count"] += 1
+        if row["campaign"] is not None and row["campaign"] not in edge["campaigns"]:
+            edge["campaigns"].append(row["campaign"])
+        edge["first_seen"] = min(edge["first_seen"], row["timestamp"])
+        edge["last_seen"] = max(edge["last_seen"], row["timestamp"])
+        if rank > edge["severity_rank"]:
+            edge["max_severity"] = row["severity"]
+            edge["severity_rank"] = rank
+    return list(edges.values())
+
+def _is_neo4j_unavailable(error):
+    """Neo4j 不可用或托管事务重试后仍失败的瞬时错误，计入熔断"""
+    return isinstance(error, (ServiceUnavailable, SessionExpired, TransientError))
+
+def _is_es_retryable(error):
+    """连接错误、超时、429 和网关类 5xx 可重试，也计入熔断"""
+    if isinstance(error, ESConnectionError):
+        return True
+    return isinstance(error, TransportError) and error.status_code in (429, 502, 503, 504)
+
+def _execute(session, access, work):
+    """
+    以托管事务执行 work(tx)，驱动对瞬时错误按带抖动的指数退避自动重试
+    neo4j>=5.0 使用 execute_write/execute_read，4.x 回退到 write_transaction/read_transaction
+    :param access: "write" 或 "read"
+    """
+    execute = getattr(session, f"execute_{access}", None) or getattr(session, f"{access}_transaction")
+    return execute(work)
+
+def _event_id(event_data):
+    """
+    按事件内容计算文档 ID（规范化 JSON 的 SHA-1），重复写入同一事件时得到相同 ID
+    """
+    canonical = json.dumps(event_data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+def _iter_batches(events, batch_size, max_linger):
+    """
+    按数量和等待时间对事件分批
+    :param events: 事件可迭代对象
+    :param batch_size: 每批最多事件数
+    :param max_linger: 批次自第一条事件起的最长等待时间（秒），在下一条事件到达时检查
+    """
+    batch = []
+    started = None
+    for event in events:
+        if not batch:
+            started = time.monotonic()
+        batch.append(event)
+        if len(batch) >= batch_size or time.monotonic() - started >= max_linger:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _build_trace_query(max_hops, mode, time_ordered, attack_types, since, until, distinct_hops):
+    """
+    构造有界攻击路径追踪查询
+    变长关系的跳数上限无法参数化，这里校验为正整数后拼接，其余条件均为参数
+    """
+    max_hops = int(max_hops)
+    if max_hops < 1:
+        raise ValueError("max_hops 必须大于等于 1")
+    if mode not in ("all", "shortest"):
+        raise ValueError(f"不支持的追踪模式: {mode}")
+
+    conditions = []
+    if attack_types:
+        conditions.append("ALL(r IN relationships(path) WHERE r.type IN $attack_types)")
+    if since is not None:
+        conditions.append("ALL(r IN relationships(path) WHERE r.timestamp >= $since)")
+    if until is not None:
+        conditions.append("ALL(r IN relationships(path) WHERE r.timestamp <= $until)")
+    if time_ordered:
+        conditions.append(
+            "ALL(i IN range(0, length(path) - 2) "
+            "WHERE relationships(path)[i].timestamp <= relationships(path)[i + 1].timestamp)"
+        )
+
+    if mode == "shortest":
+        # 先用剪枝的变长扩展找出可达攻击源，再对每个攻击源求一条最短路径
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return f"""
+        MATCH (target:Server {{ip: $target_ip}})
+        MATCH (source:Server)-[:ATTACKED*1..{max_hops}]->(target)
+        WHERE source <> target
+        WITH DISTINCT source, target
+        MATCH path = shortestPath((source)-[:ATTACKED*1..{max_hops}]->(target))
+        {where}
+        RETURN path
+        LIMIT $limit
+        """
+
+    # 简单路径：路径上的节点不重复，避免横向移动主机之间的环路
+    conditions.insert(0, "ALL(n IN nodes(path) WHERE single(m IN nodes(path) WHERE m = n))")
+    query = f"""
+        MATCH (target:Server {{ip: $target_ip}})
+        MATCH path = (source:Server)-[:ATTACKED*1..{max_hops}]->(target)
+        WHERE {' AND '.join(conditions)}
+        """
+    if distinct_hops:
+        # 同一对主机间的平行边会产生节点序列相同的路径，每个节点序列只保留一条
+        # collect 是聚合操作，LIMIT 之前会物化全部路径（包括平行边的所有组合）；
+        # 高扇入目标（如 DDoS）应使用 aggregate 边模式，平行边在写入时已合并
+        query += """
+        WITH [n IN nodes(path) | n.ip] AS hops, head(collect(path)) AS path
+        """
+    return query + """
+        RETURN path
+        LIMIT $limit
+        """
+
+def _related_events_query(ip_address, time_range, include_target=False):
+    """
+    构造相关事件查询条件
+    IP 和时间范围都放在 filter 子句中：不参与评分，且可被节点查询缓存复用
+    """
+    if include_target:
+        ip_clause = {"bool": {
+            "should": [
+                {"match": {"source_ip": ip_address}},
+                {"match": {"target_ip": ip_address}}
+            ],
+            "minimum_should_match": 1
+        }}
+    else:
+        ip_clause = {"match": {"source_ip": ip_address}}
+    return {
+        "bool": {
+            "filter": [
+                ip_clause,
+                {"range": {
+                    "@timestamp": {
+                        "gte": f"now-{time_range}",
+                        "lte": "now"
+                    }
+                }}
+            ]
+        }
+    }
+
+def _open_event_file(path):
+    """按后缀打开事件文件，.gz 后缀按 gzip 解压"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+def _iter_json_array(f, chunk_size=1 << 16):
+    """
+    增量解析 JSON 数组文件，逐个产出数组元素
+    每次只读入 chunk_size 个字符，已解析部分随即丢弃
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("事件文件既不是 NDJSON 也不是 JSON 数组")
+    pos = 1
+    eof = False
+    while True:
+        # 跳过元素之间的空白和逗号
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("JSON 数组不完整")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield item
+        pos = end
+
+class _prepend:
+    """将已读出的开头字符放回文件流之前"""
+
+    def __init__(self, head, f):
+        self.head = head
+        self.f = f
+
+    def read(self, size=-1):
+        head, self.head = self.head, ""
+        return head + self.f.read(size)
+
+def iter_event_file(path):
+    """
+    流式读取事件文件，不会一次性载入内存
+    支持 NDJSON（每行一个事件）和 JSON 数组两种格式，.gz 后缀自动解压
+    :param path: 文件路径
+    :return: 生成器，逐个产出事件字典
+    """
+    with _open_event_file(path) as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head == "[":
+            yield from _iter_json_array(_prepend(head, f))
+            return
+        first = head + f.readline()
+        if first.strip():
+            yield json.loads(first)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _throttle(events, rate):
+    """
+    按固定速率产出事件
+    :param rate: 每秒事件数，0 表示不限速
+    """
+    if not rate or rate <= 0:
+        yield from events
+        return
+    started = time.monotonic()
+    for count, event in enumerate(events):
+        delay = started + count / rate - time.monotonic()
+        if delay > 0.001:
+            time.sleep(delay)
+        yield event
+
+class BulkEventWriter:
+    """
+    Elasticsearch 批量写入器
+    - 事件先进入有界内存队列，队列满时 add() 阻塞，对上游形成背压
+    - 后台线程通过 _bulk 接口按文档数和字节数分块写入
+    - 只重试被拒绝（429）的文档，其余失败文档计入 rejected
+    - hash 模式下以内容哈希为 ID、op_type=create 写入，已存在的文档计入 duplicates
+    """
+
+    _SENTINEL = object()
+
+    def __init__(self, es_client, index_prefix="security-events",
+                 chunk_size=ES_BULK_CHUNK_SIZE, max_chunk_bytes=ES_BULK_CHUNK_BYTES,
+                 queue_size=ES_BULK_QUEUE_SIZE, max_retries=ES_BULK_MAX_RETRIES,
+                 initial_backoff=1, max_errors=100, metrics=None, index=None, id_mode=ES_EVENT_ID_MODE):
+        """
+        :param es_client: Elasticsearch 客户端
+        :param index_prefix: 索引前缀，未指定 index 时实际索引为 {prefix}-YYYY.MM.dd
+        :param chunk_size: 每个 _bulk 请求的最大文档数
+        :param max_chunk_bytes: 每个 _bulk 请求的最大字节数
+        :param queue_size: 内存队列上限
+        :param max_retries: 被拒绝文档的最大重试次数（指数退避）
+        :param initial_backoff: 首次重试等待时间（秒）
+        :param max_errors: 汇总中保留的错误样本数
+        :param metrics: 可选的 Metrics 实例，记录写入结果和队列深度
+        :param index: 固定的写入目标（如滚动别名），None 表示按天写入
+        :param id_mode: "auto" 由 Elasticsearch 自动生成 ID；"hash" 使用内容哈希，重复事件只写入一次
+        """
+        if id_mode not in ("auto", "hash"):
+            raise ValueError(f"不支持的 ID 模式: {id_mode}")
+        self.es_client = es_client
+        self.index_prefix = index_prefix
+        self.index = index
+        self.id_mode = id_mode
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_errors = max_errors
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._index_day = None
+        self._index_name = None
+        self._indexed = 0
+        self._rejected = 0
+        self._duplicates = 0
+        self._errors = []
+        self._failure = None
+        self._started = time.monotonic()
+        self._finished = None
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.register_gauge("queue_depth", self.queue_depth, queue="es_bulk")
+        self._worker = threading.Thread(target=self._run, name="es-bulk-writer", daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _index_for_today(self):
+        """按天缓存索引名，只在日期变化时重新计算"""
+        if self.index is not None:
+            return self.index
+        today = datetime.date.today()
+        if today != self._index_day:
+            self._index_day = today
+            self._index_name = f"{self.index_prefix}-{today.strftime('%Y.%m.%d')}"
+        return self._index_name
+
+    def add(self, event_data, timeout=None):
+        """
+        将事件加入写入队列
+        :param event_data: 事件字典，缺少 @timestamp 时补充当前时间
+        :param timeout: 队列满时的最长等待时间（秒），None 表示一直等待
+        """
+        if self._failure is not None:
+            raise RuntimeError(f"批量写入线程已退出: {self._failure}")
+        if self._finished is not None:
+            raise RuntimeError("批量写入器已关闭")
+        event_data.setdefault("@timestamp", datetime.datetime.now().isoformat())
+        action = {"_index": self._index_for_today(), "_source": event_data}
+        if self.id_mode == "hash":
+            action["_op_type"] = "create"
+            action["_id"] = _event_id(event_data)
+        self._queue.put(action, timeout=timeout)
+
+    def queue_depth(self):
+        """当前排队中的事件数"""
+        return self._queue.qsize()
+
+    def _actions(self):
+        while True:
+            action = self._queue.get()
+            if action is self._SENTINEL:
+                return
+            yield action
+
+    def _run(self):
+        try:
+            for ok, item in streaming_bulk(
+                self.es_client,
+                self._actions(),
+                chunk_size=self.chunk_size,
+                max_chunk_bytes=self.max_chunk_bytes,
+                max_retries=self.max_retries,
+                initial_backoff=self.initial_backoff,
+                raise_on_error=False,
+                raise_on_exception=False
+            ):
+                if ok:
+                    self._indexed += 1
+                elif item.get("create", {}).get("status") == 409:
+                    self._duplicates += 1
+                else:
+                    self._rejected += 1
+                    if len(self._errors) < self.max_errors:
+                        self._errors.append(item)
+                if self.metrics is not None:
+                    self.metrics.inc("bulk_documents_total", status="success" if ok else "failure")
+        except Exception as e:
+            self._failure = e
+            # 丢弃剩余队列，避免写入方在背压下永久阻塞
+            while True:
+                try:
+                    if self._queue.get_nowait() is self._SENTINEL:
+                        break
+                    self._rejected += 1
+                except queue.Empty:
+                    break
+
+    def close(self):
+        """
+        刷新剩余事件并停止后台线程
+        :return: 吞吐和拒绝文档汇总
+        """
+        if self._finished is None:
+            if self._failure is None:
+                self._queue.put(self._SENTINEL)
+            self._worker.join()
+            self._finished = time.monotonic()
+            if self.metrics is not None:
+                self.metrics.unregister_gauge("queue_depth", queue="es_bulk")
+        return self.summary()
+
+    def summary(self):
+        """
+        :return: 已写入数、拒绝数、耗时、吞吐、错误样本
+        """
+        elapsed = (self._finished or time.monotonic()) - self._started
+        return {
+            "indexed": self._indexed,
+            "rejected": self._rejected,
+            "duplicates": self._duplicates,
+            "elapsed_sec": round(elapsed, 3),
+            "docs_per_sec": round(self._indexed / elapsed, 1) if elapsed > 0 else None,
+            "errors": list(self._errors),
+            "failure": str(self._failure) if self._failure is not None else None
+        }
+
+class Neo4jGraphStore(GraphStore):
+    """
+    GraphStore 的 Neo4j 适配器：读写均为托管事务，每次调用使用连接池中的一个会话
+    """
+
+    name = "neo4j"
+
+    def __init__(self, pool_size=NEO4J_POOL_SIZE):
+        """
+        :param pool_size: Neo4j 连接池大小
+        """
         # 通过 bolt 协议连接 Neo4j 图数据库
-        self.neo4j_driver = GraphDatabase.driver(
+        self.driver = GraphDatabase.driver(
             NEO4J_URI,
-            auth=(NEO4J_USER, NEO4J_PASSWORD)
+            auth=(NEO4J_USER, NEO4J_PASSWORD),
+            max_connection_pool_size=pool_size,
+            connection_timeout=NEO4J_CONNECTION_TIMEOUT,
+            connection_acquisition_timeout=NEO4J_ACQUIRE_TIMEOUT,
+            max_transaction_retry_time=NEO4J_MAX_RETRY_TIME
         )
-        # 初始化 Elasticsearch 连接
+
+    def _execute(self, access, work):
+        attempts = 0
+
+        def counted(tx):
+            # 托管事务遇到瞬时错误时会再次调用 work，第二次起即为重试
+            nonlocal attempts
+            attempts += 1
+            if attempts > 1 and self.on_retry is not None:
+                self.on_retry()
+            return work(tx)
+
+        with self.driver.session() as session:
+            return _execute(session, access, counted)
+
+    def ensure_schema(self):
+        with self.driver.session() as session:
+            for statement in SCHEMA_STATEMENTS:
+                session.run(statement).consume()
+
+    def add_edges(self, rows):
+        self._execute("write", lambda tx: tx.run(BATCH_ATTACK_PATH_QUERY, events=rows).consume())
+
+    def merge_edges(self, edges):
+        self._execute("write", lambda tx: tx.run(AGGREGATE_ATTACK_PATH_QUERY, edges=edges).consume())
+
+    def run_write(self, query, params):
+        """在托管写事务中执行一条 Cypher 语句（瞬时错误由驱动重试，重试计入 on_retry）"""
+        self._execute("write", lambda tx: tx.run(query, params).consume())
+
+    def trace_paths(self, target_ip, max_hops, mode, time_ordered, attack_types, since, until, limit,
+                    distinct_hops):
+        query = _build_trace_query(max_hops, mode, time_ordered, attack_types, since, until, distinct_hops)
+        params = {
+            "target_ip": target_ip,
+            "attack_types": list(attack_types) if attack_types else None,
+            "since": since,
+            "until": until,
+            "limit": int(limit)
+        }
+
+        def work(tx):
+            # 将 Path 对象转换为可序列化结构（须在事务内读完结果）
+            paths = []
+            for record in tx.run(query, params):
+                path = record["path"]
+                nodes = [dict(node) for node in path.nodes]
+                rels = [dict(rel) for rel in path.relationships]
+                paths.append({"nodes": nodes, "relationships": rels})
+            return paths
+
+        return self._execute("read", work)
+
+    def iter_edges(self, since):
+        query = """
+        MATCH (source:Server)-[r:ATTACKED]->(target:Server)
+        WHERE r.timestamp >= $since
+        RETURN source.ip AS source_ip, target.ip AS target_ip, r.type AS attack_type, r.timestamp AS timestamp
+        """
+        with self.driver.session() as session:
+            for record in session.run(query, {"since": since}):
+                yield record.data()
+
+    def is_unavailable(self, error):
+        return _is_neo4j_unavailable(error)
+
+    def close(self):
+        self.driver.close()
+
+class ElasticsearchEventStore(EventStore):
+    """
+    EventStore 的 Elasticsearch 适配器
+    写入目标为 index（滚动别名）或按天索引 security-events-YYYY.MM.dd，查询覆盖 security-events-*
+    """
+
+    name = "elasticsearch"
+
+    def __init__(self, index=None, pool_size=ES_POOL_SIZE, id_mode=ES_EVENT_ID_MODE):
+        """
+        :param index: 写入目标（如滚动别名），None 表示按天写入
+        :param pool_size: 每个节点的连接池大小
+        :param id_mode: "auto" 自动生成 ID；"hash" 按内容哈希去重
+        """
         # 通过 http_auth 认证连接 Elasticsearch
-        self.es_client = Elasticsearch(
+        self.client = Elasticsearch(
             ES_HOST,
             http_auth=(ES_USER, ES_PASSWORD),
-            verify_certs=False  # 开发环境下关闭证书校验
+            verify_certs=False,  # 开发环境下关闭证书校验
+            maxsize=pool_size,
+            timeout=ES_TIMEOUT,
+            max_retries=0  # 由 SecurityTracer._event_call 统一做带抖动的退避重试
+        )
+        self.index = index
+        self.id_mode = id_mode
+
+    def ensure_indices(self, alias):
+        self.client.ilm.put_lifecycle(policy=alias, body={
+            "policy": {"phases": {
+                "hot": {"actions": {"rollover": {
+                    "max_primary_shard_size": ES_EVENTS_ROLLOVER_SIZE,
+                    "max_age": ES_EVENTS_ROLLOVER_AGE
+                }}},
+                "delete": {"min_age": ES_EVENTS_RETENTION, "actions": {"delete": {}}}
+            }}
+        })
+        self.client.indices.put_index_template(name=alias, body={
+            # 滚动索引使用单独的前缀：按天索引 security-events-YYYY.MM.dd 不能匹配带 rollover_alias 的模板，
+            # 否则未经别名写入的按天索引会持续报 ILM 滚动错误
+            "index_patterns": [f"{alias}-rollover-*"],
+            "priority": 100,
+            "template": {
+                "settings": {
+                    "number_of_shards": ES_EVENTS_SHARDS,
+                    "number_of_replicas": ES_EVENTS_REPLICAS,
+                    "refresh_interval": ES_EVENTS_REFRESH_INTERVAL,
+                    "index.lifecycle.name": alias,
+                    "index.lifecycle.rollover_alias": alias
+                },
+                "mappings": EVENTS_INDEX_MAPPINGS
+            }
+        })
+        if not self.client.indices.exists_alias(name=alias):
+            try:
+                self.client.indices.create(index=f"{alias}-rollover-000001", body={
+                    "aliases": {alias: {"is_write_index": True}}
+                })
+            except RequestError as e:
+                # 并发初始化时索引可能已由其他进程创建
+                if e.error != "resource_already_exists_exception":
+                    raise
+        self.index = alias
+        return alias
+
+    def index_event(self, event):
+        index_name = self.index or f"security-events-{datetime.datetime.now().strftime('%Y.%m.%d')}"
+        try:
+            if self.id_mode == "hash":
+                response = self.client.index(index=index_name, document=event, id=_event_id(event),
+                                             op_type="create")
+            else:
+                response = self.client.index(index=index_name, document=event)
+        except ConflictError:
+            return "duplicate"
+        return response["result"]
+
+    def index_batch(self, events):
+        """
+        通过 _bulk 接口写入一批事件
+        被拒绝（429）或服务端错误的文档使整批抛出异常，由回放线程退避后重放；
+        已存在（409）的文档视为成功，其余失败（如映射错误）重放也不会成功，返回给调用方转入 dead letter
+        :return: 被永久拒绝的 (事件, 原因) 列表
+        """
+        actions = []
+        for event in events:
+            # 按事件入队时间选择按天索引，回放延迟不会把事件写入错误的日期
+            day = event["@timestamp"][:10].replace("-", ".")
+            action = {"_index": self.index or f"security-events-{day}", "_source": event}
+            if self.id_mode == "hash":
+                action["_op_type"] = "create"
+                action["_id"] = _event_id(event)
+            actions.append(action)
+        _, errors = bulk(
+            self.client, actions,
+            chunk_size=ES_BULK_CHUNK_SIZE,
+            max_chunk_bytes=ES_BULK_CHUNK_BYTES,
+            max_retries=ES_BULK_MAX_RETRIES,
+            raise_on_error=False
+        )
+        retryable = 0
+        rejected = []
+        for item in errors:
+            info = next(iter(item.values()))
+            status = info.get("status", 0)
+            if status == 429 or status >= 500:
+                retryable += 1
+            elif status != 409:
+                rejected.append((info.get("data"), f"{status}: {info.get('error')}"))
+        if retryable:
+            raise RuntimeError(f"{retryable} 个 spool 事件被 Elasticsearch 拒绝，稍后重放")
+        return rejected
+
+    def bulk_writer(self, **kwargs):
+        kwargs.setdefault("index", self.index)
+        kwargs.setdefault("id_mode", self.id_mode)
+        return BulkEventWriter(self.client, **kwargs)
+
+    def refresh(self):
+        self.client.indices.refresh(index="security-events-*")
+
+    def search_related(self, ip_address, time_range):
+        query = {"query": _related_events_query(ip_address, time_range)}
+        return self.client.search(index="security-events-*", body=query)
+
+    def iter_related(self, ip_address, time_range, fields=None, include_target=False, page_size=1000,
+                     keep_alive="1m", call=None):
+        """point-in-time + search_after 分页，内存占用恒定"""
+        call = call or (lambda fn: fn())
+        pit_id = call(lambda: self.client.open_point_in_time(index="security-events-*", keep_alive=keep_alive))["id"]
+        body = {
+            "size": page_size,
+            "query": _related_events_query(ip_address, time_range, include_target),
+            "sort": [{"@timestamp": "asc"}, {"_shard_doc": "asc"}],
+            "track_total_hits": False
+        }
+        if fields is not None:
+            body["_source"] = list(fields)
+        try:
+            while True:
+                body["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+                response = call(lambda: self.client.search(body=body))
+                # 每次响应都可能返回新的 pit_id
+                pit_id = response.get("pit_id", pit_id)
+                hits = response["hits"]["hits"]
+                if not hits:
+                    return
+                yield from hits
+                if len(hits) < page_size:
+                    return
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            self.client.close_point_in_time(body={"id": pit_id})
+
+    def histogram(self, interval, group_by, time_range, filters, page_size, as_numpy):
+        return event_histogram(self.client, interval, group_by, time_range, filters, page_size, as_numpy)
+
+    def top_values(self, field, size, time_range, filters, as_numpy):
+        return top_values(self.client, field, size, time_range, filters, as_numpy)
+
+    def is_retryable(self, error):
+        return _is_es_retryable(error)
+
+    def close(self):
+        self.client.close()
+
+class SecurityTracer:
+    def __init__(self, graph_cache=None, edge_mode=EDGE_MODE, edge_bucket_seconds=EDGE_BUCKET_SECONDS,
+                 metrics=None, result_cache=None, events_index=ES_EVENTS_WRITE_INDEX or None,
+                 neo4j_pool_size=NEO4J_POOL_SIZE, es_pool_size=ES_POOL_SIZE, graph_store=None, event_store=None):
+        """
+        :param graph_cache: 可选的进程内攻击图缓存（AttackGraphCache），
+                            写入时同步更新，覆盖时间范围内的追踪查询直接本地回答；
+                            聚合边模式下按 edge_bucket_seconds 合并平行边
+        :param edge_mode: "event" 每个事件创建一条 ATTACKED 关系；
+                          "aggregate" 每个 (攻击源, 目标, 攻击类型, 时间桶) 合并为一条关系，
+                          记录 first_seen/last_seen/count/max_severity，原始事件明细保留在 Elasticsearch
+        :param edge_bucket_seconds: 聚合模式的时间桶大小（秒）
+        :param metrics: 可选的 Metrics 实例，记录每个操作的耗时、结果、批次大小和队列深度
+        :param result_cache: 可选的查询结果缓存（QueryCache），缓存 trace_attack_path 和 get_related_events，
+                             写入攻击路径时失效涉及目标 IP 的条目，记录事件时失效涉及源 IP 的条目
+        :param events_index: 事件写入目标（如滚动别名），None 表示按天写入；ensure_event_indices 会将其设为别名
+        :param neo4j_pool_size: Neo4j 连接池大小
+        :param es_pool_size: Elasticsearch 每个节点的连接池大小
+        :param graph_store: 攻击图存储（GraphStore），None 表示连接 Neo4j
+        :param event_store: 安全事件存储（EventStore），None 表示连接 Elasticsearch
+        """
+        if edge_mode not in ("event", "aggregate"):
+            raise ValueError(f"不支持的边模式: {edge_mode}")
+        self.edge_mode = edge_mode
+        self.edge_bucket_seconds = edge_bucket_seconds
+        self.metrics = metrics
+        self.graph_store = graph_store if graph_store is not None else Neo4jGraphStore(neo4j_pool_size)
+        self.event_store = event_store if event_store is not None else ElasticsearchEventStore(events_index,
+                                                                                                es_pool_size)
+        # 适配器的原生客户端，供需要直接访问后端的脚本使用（内存实现为 None）
+        self.neo4j_driver = getattr(self.graph_store, "driver", None)
+        self.es_client = getattr(self.event_store, "client", None)
+        # 每个存储一个熔断器：后端故障期间快速失败，不再堆积会话和请求
+        self.graph_breaker = CircuitBreaker(self.graph_store.name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT,
+                                            self._breaker_listener(self.graph_store.name))
+        self.event_breaker = CircuitBreaker(self.event_store.name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT,
+                                            self._breaker_listener(self.event_store.name))
+        if metrics is not None:
+            self.graph_store.on_retry = lambda: metrics.inc("backend_retries_total", backend=self.graph_store.name)
+            for breaker in (self.graph_breaker, self.event_breaker):
+                metrics.register_gauge("circuit_open", lambda b=breaker: int(b.state != "closed"), backend=breaker.name)
+                metrics.register_gauge("circuit_rejected", lambda b=breaker: b.rejected, backend=breaker.name)
+        # 批量写入模式下的写入器（None 表示逐条写入）
+        self.bulk_writer = None
+        self.graph_cache = graph_cache
+        if graph_cache is not None and edge_mode == "aggregate":
+            graph_cache.bucket_seconds = edge_bucket_seconds
+        self.result_cache = result_cache
+        # 本地持久化队列（None 表示直接写入后端）
+        self.event_spool = None
+        self.graph_spool = None
+        self._spool_drainers = []
+
+    @classmethod
+    def in_memory(cls, **kwargs):
+        """
+        创建使用内存存储的追踪器，不连接任何外部服务，适用于本地测试、基准测试和小规模事件分析
+        :param kwargs: 其余构造参数
+        """
+        return cls(graph_store=InMemoryGraphStore(), event_store=InMemoryEventStore(), **kwargs)
+
+    @property
+    def events_index(self):
+        """事件写入目标，由事件存储维护"""
+        return self.event_store.index
+
+    @events_index.setter
+    def events_index(self, value):
+        self.event_store.index = value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """回放 spool、刷新批量写入队列并关闭图存储和事件存储的连接"""
+        try:
+            self.disable_spool()
+            self.disable_bulk_mode()
+        finally:
+            try:
+                self.graph_store.close()
+            finally:
+                self.event_store.close()
+
+    def _breaker_listener(self, backend):
+        """熔断器状态变化时计数，未启用指标时返回 None"""
+        if self.metrics is None:
+            return None
+        return lambda state: self.metrics.inc("circuit_state_changes_total", backend=backend, state=state)
+
+    def _graph_call(self, fn):
+        """经熔断器执行图存储操作（Neo4j 的瞬时错误已由托管事务重试）"""
+        return self.graph_breaker.call(fn, self.graph_store.is_unavailable)
+
+    def graph_write(self, query, params):
+        """
+        经熔断器和托管事务重试执行一条写入语句，供图谱分析等直接使用 Cypher 的脚本复用同一套容错策略
+        仅 Neo4j 图存储支持
+        """
+        return self._graph_call(lambda: self.graph_store.run_write(query, params))
+
+    def _event_call(self, fn):
+        """经熔断器执行事件存储操作，可重试的错误（如 ES 的 429/5xx/连接错误）按带抖动的指数退避重试"""
+        retryable = self.event_store.is_retryable
+        on_retry = None
+        if self.metrics is not None:
+            on_retry = lambda error: self.metrics.inc("backend_retries_total", backend=self.event_store.name)
+        return self.event_breaker.call(
+            lambda: retry_call(fn, retryable, ES_RETRY_ATTEMPTS, ES_RETRY_BASE_DELAY, ES_RETRY_MAX_DELAY,
+                               on_retry=on_retry),
+            retryable
         )
 
-    def create_attack_path(self, source_ip, target_ip, attack_type, timestamp):
+    def health(self):
         """
-        在 Neo4j 中创建攻击路径关系
+        :return: 每个存储的熔断器状态和被拒绝的请求数
+        """
+        return {
+            breaker.name: {"state": breaker.state, "rejected": breaker.rejected}
+            for breaker in (self.graph_breaker, self.event_breaker)
+        }
+
+    def _cached_query(self, name, key, compute, compact, expand, ips):
+        """
+        经结果缓存执行查询；未配置缓存时直接执行
+        :param name: 查询名，用于指标标签
+        :param key: 包含全部查询参数的缓存键
+        :param compute: 实际执行查询的函数
+        :param compact: 将查询结果压缩为缓存形式的函数
+        :param expand: 将缓存形式还原为返回结果的函数
+        :param ips: 返回结果涉及的 IP 集合的函数，写入这些 IP 时条目失效
+        """
+        if self.result_cache is None:
+            return compute()
+        hit, value = self.result_cache.get(key)
+        if self.metrics is not None:
+            self.metrics.inc("query_cache_total", query=name, result="hit" if hit else "miss")
+        if not hit:
+            result = compute()
+            value = compact(result)
+            self.result_cache.put(key, value, ips(result))
+        return expand(value)
+
+    def _invalidate_results(self, ips):
+        if self.result_cache is not None:
+            self.result_cache.invalidate_ips(ips)
+
+    def create_attack_path(self, source_ip, target_ip, attack_type, timestamp, severity=None):
+        """
+        在图存储中创建攻击路径关系（单条事件的 create_attack_paths，耗时计入 create_attack_paths 指标）
         :param source_ip: 攻击源 IP
         :param target_ip: 受害者 IP
         :param attack_type: 攻击类型
         :param timestamp: 时间戳
+        :param severity: 严重程度（聚合模式下用于记录最高严重程度）
+        """
+        self.create_attack_paths([{
+            "source_ip": source_ip,
+            "target_ip": target_ip,
+            "attack_type": attack_type,
+            "timestamp": timestamp,
+            "severity": severity
+        }])
+
+    @instrumented("create_attack_paths")
+    def create_attack_paths(self, events, batch_size=NEO4J_BATCH_SIZE, max_linger=NEO4J_BATCH_LINGER):
+        """
+        批量在图存储中创建攻击路径关系
+        Neo4j 中每个批次使用一次参数化 UNWIND 写事务
+        :param events: 事件可迭代对象，需包含 source_ip、target_ip、attack_type（或 event_type），
+                       可选 timestamp（缺省为当前时间）
+        :param batch_size: 每批最多事件数
+        :param max_linger: 批次最长等待时间（秒）
+        :return: 每个批次的统计列表，包含批次序号、事件数、耗时（毫秒）和写入速率；
+                 聚合模式下还包含合并后的边数 edges；开启 spool 时只落盘，返回 [{"batch": 1, "count": n, "spooled": True}]
+        :raises ValueError: 事件缺少必需字段（开启 spool 时在入队前校验，不会写入 spool）
         """
-        with self.neo4j_driver.session() as session:
-            query = """
-            MERGE (source:Server {ip: $source_ip})
-            MERGE (target:Server {ip: $target_ip})
-            CREATE (source)-[r:ATTACKED {
-                type: $attack_type,
-                timestamp: $timestamp
-            }]->(target)
-            """
-            session.run(query, {
-                "source_ip": source_ip,
-                "target_ip": target_ip,
-                "attack_type": attack_type,
-                "timestamp": timestamp
-            })
+        if self.graph_spool is not None:
+            count = 0
+            for event in events:
+                _check_attack_event(event)
+                # 入队时补齐时间戳，回放延迟不影响事件时间
+                if not (event.get("timestamp") or event.get("@timestamp")):
+                    event = dict(event, timestamp=datetime.datetime.now().isoformat())
+                self.graph_spool.append_event(event)
+                count += 1
+            return [{"batch": 1, "count": count, "spooled": True}]
+        return self._write_attack_paths(events, batch_size, max_linger)
+
+    def _write_attack_paths(self, events, batch_size=NEO4J_BATCH_SIZE, max_linger=NEO4J_BATCH_LINGER):
+        """按批次写入图存储，参数和返回值同 create_attack_paths（不经过 spool）"""
+        stats = []
+        for number, batch in enumerate(_iter_batches(events, batch_size, max_linger), 1):
+            rows = [_attack_path_row(event) for event in batch]
+            started = time.perf_counter()
+            if self.edge_mode == "aggregate":
+                edges = _aggregate_rows(rows, self.edge_bucket_seconds)
+                self._graph_call(lambda: self.graph_store.merge_edges(edges))
+            else:
+                self._graph_call(lambda: self.graph_store.add_edges(rows))
+            elapsed = time.perf_counter() - started
+            if self.metrics is not None:
+                self.metrics.record("neo4j_write_batch", elapsed)
+                self.metrics.record_batch("neo4j_write_batch", len(rows))
+            if self.graph_cache is not None:
+                # 聚合模式下缓存与图存储一样按时间桶合并平行边，追踪结果的路径数和时间戳与图存储一致
+                self.graph_cache.add_events(edges if self.edge_mode == "aggregate" else rows)
+            self._invalidate_results({row["target_ip"] for row in rows})
+            batch_stats = {
+                "batch": number,
+                "count": len(rows),
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "edges_per_sec": round(len(rows) / elapsed, 1) if elapsed > 0 else None
+            }
+            if self.edge_mode == "aggregate":
+                batch_stats["edges"] = len(edges)
+            stats.append(batch_stats)
+        return stats
 
     def log_security_event(self, event_data):
         """
-        记录安全事件到 Elasticsearch
+        记录安全事件到事件存储
+        可重试的错误（如 ES 的 429/5xx/连接错误）按带抖动的指数退避重试，重试耗尽或熔断时抛出异常，由调用方决定如何处理该事件
         :param event_data: 事件字典
+        :raises ValueError: 开启 spool 时事件在入队前校验，不是字典或缺少 source_ip/target_ip 时不会写入 spool
         """
+        if self.event_spool is not None:
+            _check_security_event(event_data)
+        if event_data.get("source_ip"):
+            self._invalidate_results((event_data["source_ip"],))
+        if self.event_spool is not None:
+            event_data["@timestamp"] = datetime.datetime.now().isoformat()
+            self.event_spool.append_event(event_data)
+            return
+        if self.bulk_writer is not None:
+            event_data["@timestamp"] = datetime.datetime.now().isoformat()
+            self.bulk_writer.add(event_data)
+            return
+        started = time.perf_counter()
         try:
-            index_name = f"security-events-{datetime.datetime.now().strftime('%Y.%m.%d')}"
             event_data["@timestamp"] = datetime.datetime.now().isoformat()
-            response = self.es_client.index(
-                index=index_name,
-                document=event_data
-            )
-            print(f"事件已记录到 Elasticsearch: {response['result']}")
+            result = self._event_call(lambda: self.event_store.index_event(event_data))
+            # 每个事件都会经过这里，成功只记 debug 日志，不逐事件输出
+            if result == "duplicate":
+                logger.debug("事件已存在，跳过重复写入")
+            else:
+                logger.debug(f"事件已记录到 {self.event_store.name}: {result}")
         except Exception as e:
-            print(f"记录事件时出错: {str(e)}")
+            if self.metrics is not None:
+                self.metrics.record("log_security_event", time.perf_counter() - started, "failure")
+            logger.warning(f"记录事件时出错: {str(e)}")
+            raise
+        if self.metrics is not None:
+            self.metrics.record("log_security_event", time.perf_counter() - started)
+
+    def enable_bulk_mode(self, **kwargs):
+        """
+        开启批量写入模式，之后 log_security_event 只入队，不再逐条请求和打印
+        :param kwargs: 传给事件存储批量写入器的参数（如 BulkEventWriter 的 chunk_size、queue_size）
+        :return: 批量写入器
+        """
+        if self.bulk_writer is None:
+            kwargs.setdefault("metrics", self.metrics)
+            self.bulk_writer = self.event_store.bulk_writer(**kwargs)
+        return self.bulk_writer
+
+    def disable_bulk_mode(self):
+        """
+        关闭批量写入模式，刷新剩余事件
+        :return: 吞吐和拒绝文档汇总；未开启时返回 None
+        """
+        writer, self.bulk_writer = self.bulk_writer, None
+        return writer.close() if writer is not None else None
+
+    def enable_spool(self, directory=SPOOL_DIR, batch_size=SPOOL_DRAIN_BATCH, **kwargs):
+        """
+        开启本地持久化队列：log_security_event 和 create_attack_path(s) 只追加到磁盘上的 spool 后立即返回，
+        后台线程按批回放到事件存储和图存储；后端故障或熔断期间事件留在磁盘上，恢复后继续回放，
+        进程重启后从 checkpoint 继续
+        回放为至少一次投递，ES_EVENT_ID_MODE=hash 时重复回放的事件按内容哈希去重；
+        缺少字段或被后端拒绝（4xx）的记录写入各 spool 目录下的 dead_letter.ndjson，不阻塞后续事件
+        :param directory: spool 根目录
+        :param batch_size: 每次回放的最多事件数
+        :param kwargs: 传给 EventSpool 的参数（segment_bytes、flush_interval）
+        """
+        if self.event_spool is not None:
+            return
+        self.event_spool = EventSpool(os.path.join(directory, "events"), **kwargs)
+        self.graph_spool = EventSpool(os.path.join(directory, "graph"), **kwargs)
+        self._spool_drainers = [
+            SpoolDrainer(self.event_spool, lambda events: self._event_call(lambda: self.event_store.index_batch(events)),
+                         batch_size, name="spool-events").start(),
+            SpoolDrainer(self.graph_spool, lambda events: self._drain_attack_paths(events, batch_size),
+                         batch_size, name="spool-graph").start()
+        ]
+        if self.metrics is not None:
+            self.metrics.register_gauge("spool_backlog_bytes", self.event_spool.backlog_bytes, spool="events")
+            self.metrics.register_gauge("spool_backlog_bytes", self.graph_spool.backlog_bytes, spool="graph")
+
+    def _drain_attack_paths(self, events, batch_size):
+        # 回放线程的写入函数：图存储不返回逐条拒绝，出错的记录由回放线程逐条重放隔离
+        self._write_attack_paths(events, batch_size)
+
+    def disable_spool(self, timeout=10):
+        """
+        关闭本地持久化队列，在 timeout 内尽量回放剩余事件，未回放的事件保留在磁盘上
+        :return: 每个 spool 的回放统计；未开启时返回 None
+        """
+        if self.event_spool is None:
+            return None
+        summary = {}
+        for name, drainer in zip(("events", "graph"), self._spool_drainers):
+            drainer.stop(timeout)
+            summary[name] = drainer.stats()
+            drainer.spool.close()
+            if self.metrics is not None:
+                self.metrics.unregister_gauge("spool_backlog_bytes", spool=name)
+        self.event_spool = self.graph_spool = None
+        self._spool_drainers = []
+        return summary
 
-    def trace_attack_path(self, target_ip):
+    @instrumented("log_security_events")
+    def log_security_events(self, events, **kwargs):
         """
-        追踪某个目标 IP 的攻击路径
+        通过 _bulk 接口批量记录事件（适用于事件回放）
+        :param events: 事件可迭代对象
+        :param kwargs: 传给事件存储批量写入器的参数
+        :return: 吞吐和拒绝文档汇总
+        """
+        kwargs.setdefault("metrics", self.metrics)
+        ips = set()
+        try:
+            with self.event_store.bulk_writer(**kwargs) as writer:
+                for event in events:
+                    if event.get("source_ip"):
+                        ips.add(event["source_ip"])
+                    writer.add(event)
+        finally:
+            # 写入器关闭（剩余事件已刷新）后再失效，避免并发查询把写入前的结果重新缓存
+            self._invalidate_results(ips)
+        return writer.summary()
+
+    def ensure_schema(self):
+        """
+        创建图谱所需的约束和索引（幂等）
+        - Server.ip 唯一约束：MERGE 和追踪锚点查找走索引
+        - ATTACKED.timestamp 关系索引：支持按时间窗口过滤
+        """
+        self.graph_store.ensure_schema()
+
+    def ensure_event_indices(self, alias=ES_EVENTS_ALIAS):
+        """
+        创建事件索引的 ILM 策略、索引模板和滚动别名（幂等），之后事件写入别名
+        - 模板只匹配滚动索引 {alias}-rollover-*，不影响按天索引；查询仍可使用 security-events-* 同时覆盖旧的按天索引
+        - 首个索引为 {alias}-rollover-000001，达到大小或时长上限后由 ILM 滚动，过了保留期后删除
+        :param alias: 滚动写入别名
+        :return: 写入别名
+        """
+        return self.event_store.ensure_indices(alias)
+
+    @instrumented("replay_events")
+    def replay_events(self, path, rate=0, write_graph=True, write_events=True,
+                      batch_size=NEO4J_BATCH_SIZE, **bulk_kwargs):
+        """
+        从文件流式回放事件到图谱和日志写入路径
+        图谱按批次 UNWIND 写入，日志通过批量写入器写入，保留文件中的 @timestamp
+        :param path: NDJSON 或 JSON 数组文件（可为 .gz）
+        :param rate: 回放速率（每秒事件数），0 表示不限速
+        :param write_graph: 是否写入图存储
+        :param write_events: 是否写入事件存储
+        :param batch_size: 图谱写入的批次大小
+        :param bulk_kwargs: 传给事件存储批量写入器的参数
+        :return: 回放汇总
+        """
+        started = time.monotonic()
+        events = _throttle(iter_event_file(path), rate)
+        bulk_kwargs.setdefault("metrics", self.metrics)
+        writer = self.event_store.bulk_writer(**bulk_kwargs) if write_events else None
+        replayed = 0
+        ips = set()
+
+        def tee():
+            nonlocal replayed
+            for event in events:
+                replayed += 1
+                if writer is not None:
+                    if event.get("source_ip"):
+                        ips.add(event["source_ip"])
+                    writer.add(dict(event))
+                yield event
+
+        try:
+            if write_graph:
+                batches = self.create_attack_paths(tee(), batch_size=batch_size)
+            else:
+                batches = []
+                for _ in tee():
+                    pass
+        finally:
+            es_summary = writer.close() if writer is not None else None
+            self._invalidate_results(ips)
+        elapsed = time.monotonic() - started
+        return {
+            "events": replayed,
+            "elapsed_sec": round(elapsed, 3),
+            "events_per_sec": round(replayed / elapsed, 1) if elapsed > 0 else None,
+            "graph_batches": len(batches),
+            "graph_edges": sum(batch["count"] for batch in batches),
+            "elasticsearch": es_summary
+        }
+
+    def warm_graph_cache(self, since):
+        """
+        从图存储加载 since 之后的攻击边到进程内缓存，之后该时间范围内的追踪查询可本地回答
+        :param since: ISO 时间字符串
+        :return: 加载的边数
+        """
+        loaded = 0
+        for edge in self.graph_store.iter_edges(since):
+            self.graph_cache.add_edge(edge["source_ip"], edge["target_ip"], edge["attack_type"], edge["timestamp"])
+            loaded += 1
+        self.graph_cache.authoritative_since = min(self.graph_cache.authoritative_since, to_epoch(since))
+        return loaded
+
+    @instrumented("trace_attack_path")
+    def trace_attack_path(self, target_ip, max_hops=TRACE_MAX_HOPS, mode="all", time_ordered=False,
+                          attack_types=None, since=None, until=None, limit=TRACE_RESULT_LIMIT,
+                          distinct_hops=False):
+        """
+        追踪某个目标 IP 的攻击路径（有界扩展）
         :param target_ip: 目标 IP
+        :param max_hops: 最大跳数
+        :param mode: "all" 返回所有简单路径（节点不重复），"shortest" 每个攻击源只返回一条最短路径
+        :param time_ordered: 为 True 时要求每一跳的时间戳不早于上一跳
+        :param attack_types: 攻击类型列表，只沿这些类型的关系扩展；None 表示不过滤
+        :param since: 关系时间戳下限（ISO 格式字符串）
+        :param until: 关系时间戳上限（ISO 格式字符串）
+        :param limit: 最多返回的路径数
+        :param distinct_hops: 为 True 时相同节点序列的平行路径只保留一条；
+                              去重需要在 LIMIT 之前物化全部路径，默认关闭以便结果按 LIMIT 流式截断
         :return: 路径列表（节点和关系）
         """
-        with self.neo4j_driver.session() as session:
-            query = """
-            MATCH path = (source:Server)-[r:ATTACKED*]->(target:Server {ip: $target_ip})
-            RETURN path
-            """
-            result = session.run(query, {"target_ip": target_ip})
-            # 将 Path 对象转换为可序列化结构
-            paths = []
-            for record in result:
-                path = record["path"]
-                nodes = [dict(node) for node in path.nodes]
-                rels = [dict(rel) for rel in path.relationships]
-                paths.append({"nodes": nodes, "relationships": rels})
-            return paths
+        key = ("trace", target_ip, int(max_hops), mode, bool(time_ordered),
+               tuple(sorted(attack_types)) if attack_types else None, since, until, int(limit), bool(distinct_hops))
+
+        def ips(paths):
+            # 结果被 limit 截断时无法确定全部相关节点，任何写入都使其失效
+            return path_ips(paths) | {target_ip} | ({ANY_IP} if len(paths) >= limit else set())
+
+        return self._cached_query(
+            "trace_attack_path", key,
+            lambda: self._trace_attack_path(target_ip, max_hops, mode, time_ordered, attack_types,
+                                            since, until, limit, distinct_hops),
+            compact_paths, expand_paths, ips
+        )
+
+    def _trace_attack_path(self, target_ip, max_hops, mode, time_ordered, attack_types, since, until, limit,
+                           distinct_hops):
+        if self.graph_cache is not None and self.graph_cache.covers(since):
+            return self.graph_cache.trace_paths(target_ip, max_hops, mode, time_ordered, attack_types,
+                                                since, until, limit, distinct_hops)
+        return self._graph_call(lambda: self.graph_store.trace_paths(
+            target_ip, max_hops, mode, time_ordered, attack_types, since, until, limit, distinct_hops))
 
+    @instrumented("get_related_events")
     def get_related_events(self, ip_address, time_range="1d"):
         """
-        查询某 IP 在指定时间范围内的安全事件（Elasticsearch）
+        查询某 IP 在指定时间范围内的安全事件
         :param ip_address: IP 地址
         :param time_range: 时间范围（如 '1d'）
-        :return: 查询结果
-        """
-        query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {"match": {"source_ip": ip_address}},
-                        {"range": {
-                            "@timestamp": {
-                                "gte": f"now-{time_range}",
-                                "lte": "now"
-                            }
-                        }}
-                    ]
-                }
-            }
-        }
-        return self.es_client.search(
-            index="security-events-*",
-            body=query
+        :return: Elasticsearch search 响应结构；配置结果缓存时只包含 hits.total 和每个命中的 _index/_id/_source
+        """
+        return self._cached_query(
+            "get_related_events", ("related", ip_address, time_range),
+            lambda: self._event_call(lambda: self.event_store.search_related(ip_address, time_range)),
+            compact_search, expand_search, lambda response: {ip_address}
         )
 
-def main():
-    tracer = SecurityTracer()
+    @instrumented("aggregate_events")
+    def aggregate_events(self, interval="1m", group_by=("event_type",), time_range="1h", filters=None,
+                         page_size=ANALYTICS_PAGE_SIZE, as_numpy=False):
+        """
+        在事件存储端按时间桶和分组字段统计事件数（如每分钟各攻击类型的事件数）
+        :param interval: 时间桶大小（如 '1m'），None 表示只按分组字段统计
+        :param group_by: 分组字段序列，取自 event_type/severity/source_ip/target_ip
+        :param time_range: 时间范围（如 '1h'）
+        :param filters: {字段: 值或值列表} 过滤条件，如 {"severity": ["HIGH", "CRITICAL"]}
+        :param page_size: composite 聚合每页桶数
+        :param as_numpy: 为 True 时返回 NumPy 数组
+        :return: 列式结果 {"timestamp": [...], 分组字段: [...], "count": [...]}
+        """
+        return self.event_store.histogram(interval, group_by, time_range, filters, page_size, as_numpy)
+
+    @instrumented("top_values")
+    def top_values(self, field="source_ip", size=10, time_range="1h", filters=None, as_numpy=False):
+        """
+        统计事件数最多的字段值（如 Top 攻击源、Top 目标）
+        :return: 列式结果 {字段: [...], "count": [...]}
+        """
+        return self.event_store.top_values(field, size, time_range, filters, as_numpy)
+
+    def iter_related_events(self, ip_address, time_range="1d", fields=None, include_target=False,
+                            page_size=RELATED_EVENTS_PAGE_SIZE, keep_alive="1m"):
+        """
+        流式查询某 IP 的相关安全事件（Elasticsearch 使用 point-in-time + search_after 分页，内存占用恒定）
+        :param ip_address: IP 地址
+        :param time_range: 时间范围（如 '1d'）
+        :param fields: 需要返回的 _source 字段列表，None 表示返回完整文档
+        :param include_target: 为 True 时同时匹配 target_ip
+        :param page_size: 每页文档数
+        :param keep_alive: point-in-time 保持时间
+        :return: 可迭代对象，按 @timestamp 升序逐条产出命中文档（hit）
+        """
+        def call(fn):
+            # 每次请求单独计时（包括打开 point-in-time）
+            started = time.perf_counter()
+            response = self._event_call(fn)
+            if self.metrics is not None:
+                self.metrics.record("iter_related_events_page", time.perf_counter() - started)
+            return response
+
+        return self.event_store.iter_related(ip_address, time_range, fields, include_target, page_size,
+                                             keep_alive, call)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="安全溯源与攻击路径追踪")
+    parser.add_argument("--replay", default=None,
+                        help="从 NDJSON/JSON 数组文件（可为 .gz）流式回放事件，不运行演示")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="回放速率（每秒事件数），0 表示不限速")
+    parser.add_argument("--no-graph", action="store_true", help="回放时不写入 Neo4j")
+    parser.add_argument("--no-events", action="store_true", help="回放时不写入 Elasticsearch")
+    parser.add_argument("--edge-mode", choices=["event", "aggregate"], default=EDGE_MODE,
+                        help="event：每个事件一条 ATTACKED 关系；aggregate：按 (源, 目标, 类型, 时间桶) 聚合")
+    parser.add_argument("--bootstrap-indices", action="store_true",
+                        help="只创建事件索引模板、ILM 策略和滚动别名后退出")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="启用运行指标并在该端口暴露 Prometheus 文本格式的 /metrics")
+    parser.add_argument("--metrics-log-interval", type=float, default=0,
+                        help="启用运行指标并每隔若干秒输出一行结构化指标日志")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="使用内存图存储和事件存储，不连接 Neo4j/Elasticsearch（适合本地分析小规模事件文件）")
+    parser.add_argument("--trace", default=None, metavar="IP",
+                        help="回放后追踪该目标 IP 的攻击路径，并列出以其为源或目标的相关事件")
+    parser.add_argument("--time-range", default="1d", help="--trace 查询相关事件的时间范围（如 '1d'、'30d'）")
+    return parser.parse_args(argv)
+
+def _log_demo_events(tracer, events):
+    """
+    逐个记录演示事件：log_security_event 在重试耗尽后抛出异常，只跳过失败的事件，演示继续
+    :return: 失败的事件数
+    """
+    failed = 0
+    for event in events:
+        try:
+            tracer.log_security_event(event)
+        except Exception as e:
+            failed += 1
+            print(f"记录事件时出错，已跳过: {str(e)}")
+    return failed
+
+def run_demo(tracer):
+    """写入演示数据并查询攻击路径和相关事件"""
+    tracer.ensure_schema()
+    tracer.ensure_event_indices()
+    tracer.enable_bulk_mode()
     
     # 简单演示数据
     simple_attack_event = {
@@ -211,43 +1533,35 @@ def main():
             simple_attack_event["source_ip"],
             simple_attack_event["target_ip"],
             simple_attack_event["attack_type"],
-            datetime.datetime.now().isoformat()
+            datetime.datetime.now().isoformat(),
+            simple_attack_event["severity"]
         )
-        tracer.log_security_event(simple_attack_event)
+        _log_demo_events(tracer, [simple_attack_event])
         print("简单攻击事件已记录")
         
-        # 2. 处理复杂演示数据
-        for event in complex_attack_events:
-            tracer.create_attack_path(
-                event["source_ip"],
-                event["target_ip"],
-                event["attack_type"],
-                datetime.datetime.now().isoformat()
-            )
-            tracer.log_security_event(event)
+        # 2. 处理复杂演示数据（批量写入图谱）
+        now = datetime.datetime.now().isoformat()
+        tracer.create_attack_paths(dict(event, timestamp=now) for event in complex_attack_events)
+        _log_demo_events(tracer, complex_attack_events)
         print("复杂攻击事件已记录")
         
         # 3. 处理多跳攻击示例
-        for event in multi_hop_attack_events:
-            tracer.create_attack_path(
-                event["source_ip"],
-                event["target_ip"],
-                event["attack_type"],
-                datetime.datetime.now().isoformat()
-            )
-            tracer.log_security_event(event)
+        now = datetime.datetime.now().isoformat()
+        tracer.create_attack_paths(dict(event, timestamp=now) for event in multi_hop_attack_events)
+        _log_demo_events(tracer, multi_hop_attack_events)
         print("多跳攻击事件已记录")
         
         # 4. 处理高级攻击链路示例
-        for event in advanced_attack_events:
-            tracer.create_attack_path(
-                event["source_ip"],
-                event["target_ip"],
-                event["attack_type"],
-                datetime.datetime.now().isoformat()
-            )
-            tracer.log_security_event(event)
-        print("高级攻击事件已记录")
+        now = datetime.datetime.now().isoformat()
+        batch_stats = tracer.create_attack_paths(
+            dict(event, timestamp=now) for event in advanced_attack_events
+        )
+        _log_demo_events(tracer, advanced_attack_events)
+        print("高级攻击事件已记录，批次统计:", batch_stats)
+        
+        # 刷新批量写入的事件，之后的查询才能看到它们
+        print("事件批量写入汇总:", tracer.disable_bulk_mode())
+        tracer.event_store.refresh()
         
         # 5. 追踪攻击路径示例
         attack_paths = tracer.trace_attack_path("192.168.1.200")
@@ -259,5 +1573,42 @@ def main():
     except Exception as e:
         print(f"执行过程中出错: {str(e)}")
 
+def main(argv=None):
+    args = parse_args(argv)
+    metrics = None
+    if args.metrics_port or args.metrics_log_interval:
+        metrics = Metrics()
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+        if args.metrics_log_interval:
+            metrics.start_log_reporter(args.metrics_log_interval)
+    if args.in_memory:
+        tracer = SecurityTracer.in_memory(edge_mode=args.edge_mode, metrics=metrics)
+    else:
+        tracer = SecurityTracer(edge_mode=args.edge_mode, metrics=metrics)
+    with tracer:
+        if args.bootstrap_indices:
+            print("事件写入别名:", tracer.ensure_event_indices())
+            return
+        if args.replay:
+            tracer.ensure_schema()
+            if not args.no_events:
+                tracer.ensure_event_indices()
+            summary = tracer.replay_events(args.replay, rate=args.rate,
+                                           write_graph=not args.no_graph, write_events=not args.no_events)
+            print("回放汇总:", json.dumps(summary, indent=2, ensure_ascii=False))
+            if args.trace:
+                tracer.event_store.refresh()
+                paths = tracer.trace_attack_path(args.trace)
+                print(f"{args.trace} 的攻击路径:", json.dumps(paths, indent=2, ensure_ascii=False))
+                related = [hit["_source"] for hit in tracer.iter_related_events(
+                    args.trace, args.time_range, include_target=True)]
+                print(f"{args.trace} 的相关事件（{len(related)} 条）:",
+                      json.dumps(related, indent=2, ensure_ascii=False))
+            if metrics is not None:
+                print("运行指标:", json.dumps(metrics.snapshot(), indent=2, ensure_ascii=False))
+            return
+        run_demo(tracer)
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
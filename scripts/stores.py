@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+SecurityTracer 的存储接口与内存实现
+- GraphStore：攻击图的写入、有界路径追踪和边遍历（Neo4j 适配器见 security_trace.Neo4jGraphStore）
+- EventStore：安全事件的写入、相关事件查询和聚合统计（Elasticsearch 适配器见 security_trace.ElasticsearchEventStore）
+- InMemoryGraphStore：基于 AttackGraphCache 的入边邻接索引，追踪时按时间范围和攻击类型过滤
+- InMemoryEventStore：按 IP、事件类型和严重程度建立倒排索引，每个倒排表按时间排序，时间范围用二分查找截取
+
+内存实现不依赖任何外部服务，用于本地测试、基准测试和小规模事件集的快速分析
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+import datetime
+import heapq
+import re
+import time
+
+from attack_graph_cache import AttackGraphCache, to_epoch
+from event_analytics import aggregation_field, columns_to_numpy, new_columns
+
+# ES 日期运算和 fixed_interval 的时间单位（秒）
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "H": 3600, "d": 86400, "w": 604800,
+                   "M": 30 * 86400, "y": 365 * 86400}
+_DURATION_PATTERN = re.compile(r"^(\d+)(ms|[smhHdwMy])$")
+
+def duration_seconds(value):
+    """
+    将 '15m'、'1h'、'7d' 形式的时间长度转换为秒
+    """
+    match = _DURATION_PATTERN.match(str(value))
+    if match is None:
+        raise ValueError(f"无法解析的时间长度: {value}")
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+class GraphStore:
+    """
+    攻击图存储接口
+    写入和查询方法可能抛出后端异常，is_unavailable 判断异常是否计入熔断
+    """
+
+    name = "graph"
+    # 后端内部重试（如 Neo4j 托管事务）时调用的无参回调，由 SecurityTracer 设置用于记录指标
+    on_retry = None
+
+    def ensure_schema(self):
+        """创建约束和索引（幂等）"""
+
+    def add_edges(self, rows):
+        """
+        每行创建一条攻击边
+        :param rows: _attack_path_row 生成的参数行
+        """
+        raise NotImplementedError
+
+    def merge_edges(self, edges):
+        """
+        合并聚合边：每个 (攻击源, 目标, 攻击类型, 时间桶) 只保留一条
+        :param edges: _aggregate_rows 生成的参数行
+        """
+        raise NotImplementedError
+
+    def run_write(self, query, params):
+        """
+        执行一条后端原生写入语句（如图谱分析写回节点分数），不支持的后端抛出 NotImplementedError
+        :param query: 查询语句
+        :param params: 查询参数
+        """
+        raise NotImplementedError(f"{self.name} 图存储不支持原生写入语句")
+
+    def trace_paths(self, target_ip, max_hops, mode, time_ordered, attack_types, since, until, limit,
+                    distinct_hops):
+        """
+        有界攻击路径追踪，参数和返回结构同 SecurityTracer.trace_attack_path
+        """
+        raise NotImplementedError
+
+    def iter_edges(self, since):
+        """
+        遍历 since 之后的攻击边
+        :return: 可迭代对象，产出 {"source_ip", "target_ip", "attack_type", "timestamp"}
+        """
+        raise NotImplementedError
+
+    def is_unavailable(self, error):
+        """异常是否表示后端不可用"""
+        return False
+
+    def close(self):
+        """释放连接"""
+
+class EventStore:
+    """
+    安全事件存储接口
+    is_retryable 判断异常是否可以退避重试（同时计入熔断）
+    """
+
+    name = "events"
+    # 写入目标（如滚动别名），None 表示由实现决定
+    index = None
+
+    def ensure_indices(self, alias):
+        """
+        创建事件索引（幂等）
+        :return: 之后的写入目标
+        """
+        return alias
+
+    def index_event(self, event):
+        """
+        写入一个事件
+        :return: "created" 或 "duplicate"
+        """
+        raise NotImplementedError
+
+    def index_batch(self, events):
+        """
+        写入一批事件（spool 回放），可重试的部分失败须抛出异常，由调用方整批重放
+        :return: 被永久拒绝的 (事件, 原因) 列表，调用方转入 dead letter；没有时可返回 None
+        """
+        raise NotImplementedError
+
+    def bulk_writer(self, **kwargs):
+        """
+        :return: 批量写入器，提供 add/close/summary，支持 with 语句
+        """
+        raise NotImplementedError
+
+    def refresh(self):
+        """使已写入的事件对查询可见"""
+
+    def search_related(self, ip_address, time_range):
+        """
+        查询某 IP 作为攻击源的事件
+        :return: Elasticsearch search 响应结构（hits.total / hits.hits）
+        """
+        raise NotImplementedError
+
+    def iter_related(self, ip_address, time_range, fields=None, include_target=False, page_size=1000,
+                     keep_alive="1m", call=None):
+        """
+        按 @timestamp 升序流式产出相关事件的命中文档
+        :param call: 包装每次后端请求的函数（如退避重试），None 表示直接执行
+        """
+        raise NotImplementedError
+
+    def histogram(self, interval, group_by, time_range, filters, page_size, as_numpy):
+        """按时间桶和分组字段统计事件数，返回结构同 event_analytics.event_histogram"""
+        raise NotImplementedError
+
+    def top_values(self, field, size, time_range, filters, as_numpy):
+        """统计事件数最多的字段值，返回结构同 event_analytics.top_values"""
+        raise NotImplementedError
+
+    def is_retryable(self, error):
+        """异常是否可以退避重试"""
+        return False
+
+    def close(self):
+        """释放连接"""
+
+class InMemoryGraphStore(GraphStore):
+    """
+    内存攻击图：IP 和攻击类型编码为整数，边保存在数组中，按目标节点建立入边索引
+    追踪从目标反向逐层扩展，逐边检查时间范围和攻击类型；不淘汰旧边
+    聚合边与 AGGREGATE_ATTACK_PATH_QUERY 的 MERGE 语义相同：每个 (攻击源, 目标, 攻击类型, 时间桶) 一条边，
+    时间戳取 first_seen，count、first_seen、last_seen、max_severity 和 campaigns 在 aggregates 中累计
+    """
+
+    name = "memory-graph"
+
+    def __init__(self):
+        self.graph = AttackGraphCache(window_seconds=float("inf"), max_edges=float("inf"), authoritative_since=0)
+        # (攻击源, 目标, 攻击类型, 时间桶) -> 聚合边属性
+        self.aggregates = {}
+
+    def add_edges(self, rows):
+        self.graph.add_events(rows)
+
+    def merge_edges(self, edges):
+        for edge in edges:
+            key = (edge["source_ip"], edge["target_ip"], edge["attack_type"], edge["bucket"])
+            merged = self.aggregates.get(key)
+            if merged is None:
+                self.aggregates[key] = {
+                    "first_seen": edge["first_seen"],
+                    "last_seen": edge["last_seen"],
+                    "count": edge["count"],
+                    "max_severity": edge["max_severity"],
+                    "severity_rank": edge["severity_rank"],
+                    "campaigns": list(edge["campaigns"])
+                }
+            else:
+                if edge["severity_rank"] > merged["severity_rank"]:
+                    merged["max_severity"] = edge["max_severity"]
+                    merged["severity_rank"] = edge["severity_rank"]
+                merged["first_seen"] = min(merged["first_seen"], edge["first_seen"])
+                merged["last_seen"] = max(merged["last_seen"], edge["last_seen"])
+                merged["count"] += edge["count"]
+                merged["campaigns"] += [c for c in edge["campaigns"] if c not in merged["campaigns"]]
+            # 同一时间桶的边在图中合并为一条，时间戳取最早的 first_seen
+            self.graph.add_edge(edge["source_ip"], edge["target_ip"], edge["attack_type"], edge["first_seen"],
+                                bucket=edge["bucket"])
+
+    def trace_paths(self, target_ip, max_hops, mode, time_ordered, attack_types, since, until, limit,
+                    distinct_hops):
+        if int(max_hops) < 1:
+            raise ValueError("max_hops 必须大于等于 1")
+        return self.graph.trace_paths(target_ip, int(max_hops), mode, time_ordered, attack_types,
+                                      since, until, int(limit), distinct_hops)
+
+    def iter_edges(self, since):
+        return self.graph.iter_edges(since)
+
+    def stats(self):
+        return self.graph.stats()
+
+class _Posting:
+    """按时间排序的倒排表：时间戳数组与文档编号数组一一对应"""
+
+    __slots__ = ("times", "docs")
+
+    def __init__(self):
+        self.times = array("d")
+        self.docs = array("l")
+
+    def add(self, ts, doc):
+        # 事件基本按时间到达，绝大多数情况下直接追加
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.docs.append(doc)
+        else:
+            position = bisect_right(self.times, ts)
+            self.times.insert(position, ts)
+            self.docs.insert(position, doc)
+
+    def range(self, since, until):
+        """时间范围内的 (时间戳, 文档编号)，按时间升序"""
+        lo = bisect_left(self.times, since)
+        hi = bisect_right(self.times, until)
+        return zip(self.times[lo:hi], self.docs[lo:hi])
+
+    def count(self, since, until):
+        return bisect_right(self.times, until) - bisect_left(self.times, since)
+
+class _MemoryBulkWriter:
+    """内存事件存储的批量写入器，接口同 BulkEventWriter（同步写入）"""
+
+    def __init__(self, store):
+        self.store = store
+        self._indexed = 0
+        self._duplicates = 0
+        self._started = time.monotonic()
+        self._finished = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, event_data, timeout=None):
+        event_data.setdefault("@timestamp", datetime.datetime.now().isoformat())
+        if self.store.index_event(event_data) == "created":
+            self._indexed += 1
+        else:
+            self._duplicates += 1
+
+    def queue_depth(self):
+        return 0
+
+    def close(self):
+        if self._finished is None:
+            self._finished = time.monotonic()
+        return self.summary()
+
+    def summary(self):
+        elapsed = (self._finished or time.monotonic()) - self._started
+        return {
+            "indexed": self._indexed,
+            "rejected": 0,
+            "duplicates": self._duplicates,
+            "elapsed_sec": round(elapsed, 3),
+            "docs_per_sec": round(self._indexed / elapsed, 1) if elapsed > 0 else None,
+            "errors": [],
+            "failure": None
+        }
+
+class InMemoryEventStore(EventStore):
+    """
+    内存事件存储
+    - 每个事件分配递增的文档编号，原始字典保存在列表中
+    - INDEXED_FIELDS 中的每个字段值对应一个按时间排序的倒排表，另有一个覆盖全部事件的时间索引
+    - 查询先选出过滤条件中时间范围内最短的倒排表，再逐个检查其余条件
+    - 时间范围与 Elasticsearch 一样相对当前时间计算（now-{time_range} 到 now）
+    """
+
+    name = "memory-events"
+    index = "memory"
+    INDEXED_FIELDS = ("source_ip", "target_ip", "event_type", "severity")
+
+    def __init__(self, clock=time.time):
+        """
+        :param clock: 当前时间函数（秒级时间戳），用于计算相对时间范围
+        """
+        self.clock = clock
+        self._docs = []
+        self._all = _Posting()
+        self._postings = {field: {} for field in self.INDEXED_FIELDS}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def index_event(self, event):
+        doc = len(self._docs)
+        self._docs.append(event)
+        ts = to_epoch(event.get("@timestamp") or event.get("timestamp"))
+        self._all.add(ts, doc)
+        for field, postings in self._postings.items():
+            value = event.get(field)
+            if value is not None:
+                posting = postings.get(value)
+                if posting is None:
+                    posting = postings[value] = _Posting()
+                posting.add(ts, doc)
+        return "created"
+
+    def index_batch(self, events):
+        for event in events:
+            self.index_event(event)
+
+    def bulk_writer(self, **kwargs):
+        return _MemoryBulkWriter(self)
+
+    def _window(self, time_range):
+        now = self.clock()
+        return now - duration_seconds(time_range), now
+
+    def _postings_for(self, field, values):
+        postings = self._postings[field]
+        return [postings[value] for value in values if value in postings]
+
+    def _matching(self, conditions, since, until):
+        """
+        :param conditions: [[(字段, 取值集合), ...], ...]，外层为且，内层为或
+        :return: 生成器，按时间升序产出 (时间戳, 文档编号)
+        """
+        if not conditions:
+            yield from self._all.range(since, until)
+            return
+        # 从时间范围内命中数最少的条件出发，其余条件逐个文档检查
+        candidates = [[(field, values, self._postings_for(field, values)) for field, values in clause]
+                      for clause in conditions]
+        driver = min(candidates,
+                     key=lambda clause: sum(p.count(since, until) for _, _, postings in clause for p in postings))
+        others = [[(field, values) for field, values, _ in clause] for clause in candidates if clause is not driver]
+        merged = heapq.merge(*[p.range(since, until) for _, _, postings in driver for p in postings])
+        previous = None
+        for ts, doc in merged:
+            # 同一文档可能出现在多个倒排表中（如源和目标是同一 IP）
+            if doc == previous:
+                continue
+            previous = doc
+            event = self._docs[doc]
+            if all(any(event.get(field) in values for field, values in clause) for clause in others):
+                yield ts, doc
+
+    def _filter_conditions(self, filters):
+        conditions = []
+        for name, value in (filters or {}).items():
+            field = aggregation_field(name)
+            values = set(value) if isinstance(value, (list, tuple, set)) else {value}
+            conditions.append([(field, values)])
+        return conditions
+
+    def _hit(self, ts, doc, fields=None):
+        event = self._docs[doc]
+        source = event if fields is None else {field: event[field] for field in fields if field in event}
+        return {"_index": self.index, "_id": str(doc), "_score": None, "_source": source,
+                "sort": [int(ts * 1000), doc]}
+
+    def search_related(self, ip_address, time_range, size=10):
+        """与 Elasticsearch 默认行为一致：total 为全部命中数，hits 最多返回 size 条"""
+        since, until = self._window(time_range)
+        matches = list(self._matching([[("source_ip", {ip_address})]], since, until))
+        return {"hits": {
+            "total": {"value": len(matches), "relation": "eq"},
+            "max_score": None,
+            "hits": [self._hit(ts, doc) for ts, doc in matches[:size]]
+        }}
+
+    def iter_related(self, ip_address, time_range, fields=None, include_target=False, page_size=1000,
+                     keep_alive="1m", call=None):
+        since, until = self._window(time_range)
+        clause = [("source_ip", {ip_address})]
+        if include_target:
+            clause.append(("target_ip", {ip_address}))
+        for ts, doc in self._matching([clause], since, until):
+            yield self._hit(ts, doc, fields)
+
+    def histogram(self, interval, group_by, time_range, filters, page_size, as_numpy):
+        group_by = [aggregation_field(name) for name in (group_by or ())]
+        if interval is None and not group_by:
+            raise ValueError("interval 和 group_by 不能同时为空")
+        step = None if interval is None else int(duration_seconds(interval) * 1000)
+        since, until = self._window(time_range)
+        counts = Counter()
+        for ts, doc in self._matching(self._filter_conditions(filters), since, until):
+            event = self._docs[doc]
+            groups = tuple(event.get(field) for field in group_by)
+            # 与 composite 聚合一致：缺少分组字段的事件不计入任何桶
+            if None in groups:
+                continue
+            key = groups if step is None else (int(ts * 1000) // step * step,) + groups
+            counts[key] += 1
+        names = ([] if step is None else ["timestamp"]) + group_by
+        columns = new_columns(names + ["count"], as_numpy)
+        for key in sorted(counts):
+            for name, value in zip(names, key):
+                columns[name].append(value)
+            columns["count"].append(counts[key])
+        return columns_to_numpy(columns) if as_numpy else columns
+
+    def top_values(self, field, size, time_range, filters, as_numpy):
+        field = aggregation_field(field)
+        since, until = self._window(time_range)
+        counts = Counter()
+        for _, doc in self._matching(self._filter_conditions(filters), since, until):
+            value = self._docs[doc].get(field)
+            if value is not None:
+                counts[value] += 1
+        columns = new_columns([field, "count"], as_numpy)
+        # 与 terms 聚合一致：按事件数降序，相同时按值升序
+        for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:size]:
+            columns[field].append(value)
+            columns["count"].append(count)
+        return columns_to_numpy(columns) if as_numpy else columns
+
+    def stats(self):
+        return {
+            "events": len(self._docs),
+            "postings": {field: len(postings) for field, postings in self._postings.items()}
+        }
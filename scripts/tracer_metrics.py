@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标采集
+- 延迟直方图、按结果（success/retry/failure）区分的计数、批次大小直方图、队列深度等仪表
+- 以 Prometheus 文本格式通过 HTTP /metrics 暴露，或通过 loguru 定期输出一行结构化日志
+- 默认不启用：SecurityTracer 和生成器只在传入 Metrics 实例时记录
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import functools
+import json
+import threading
+import time
+
+from loguru import logger
+
+# 延迟直方图桶（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 批次大小直方图桶（事件数）
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """按桶上界估算分位数"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels)) + "}"
+
+class Metrics:
+    def __init__(self, prefix="sec_graph"):
+        """
+        :param prefix: 指标名前缀
+        """
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._gauge_fns = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def register_gauge(self, name, fn, **labels):
+        """注册在采集时才求值的仪表（如队列深度）"""
+        with self._lock:
+            self._gauge_fns[(name, tuple(sorted(labels.items())))] = fn
+
+    def unregister_gauge(self, name, **labels):
+        with self._lock:
+            self._gauge_fns.pop((name, tuple(sorted(labels.items()))), None)
+
+    def record(self, operation, seconds, status="success"):
+        """记录一次操作的耗时和结果"""
+        self.observe("operation_seconds", seconds, operation=operation)
+        self.inc("operations_total", operation=operation, status=status)
+
+    def record_batch(self, operation, size):
+        self.observe("batch_size", size, buckets=BATCH_SIZE_BUCKETS, operation=operation)
+
+    @contextmanager
+    def timer(self, operation):
+        """计时上下文：正常退出记为 success，抛出异常记为 failure"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(operation, time.perf_counter() - started, "failure")
+            raise
+        self.record(operation, time.perf_counter() - started)
+
+    def _gauge_values(self):
+        values = dict(self._gauges)
+        for key, fn in self._gauge_fns.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        return values
+
+    def render_prometheus(self):
+        """输出 Prometheus 文本格式"""
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                declare(name, "counter")
+                lines.append(f"{self.prefix}_{name}{_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                declare(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{self.prefix}_{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.prefix}_{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{self.prefix}_{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{self.prefix}_{name}_count{_labels(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self._gauge_values().items()):
+                declare(name, "gauge")
+                lines.append(f"{self.prefix}_{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """汇总为便于日志输出的字典：每个操作的次数、平均值和 p50/p99 估算（毫秒）"""
+        with self._lock:
+            operations = {}
+            for (name, labels), histogram in self._histograms.items():
+                label = ",".join(str(value) for _, value in labels)
+                scale = 1000 if name == "operation_seconds" else 1
+                operations[f"{name}:{label}"] = {
+                    "count": histogram.count,
+                    "mean": round(histogram.sum / histogram.count * scale, 3) if histogram.count else None,
+                    "p50": _scaled(histogram.quantile(0.5), scale),
+                    "p99": _scaled(histogram.quantile(0.99), scale)
+                }
+            counters = {
+                f"{name}:{','.join(str(value) for _, value in labels)}": value
+                for (name, labels), value in self._counters.items()
+            }
+            gauges = {
+                f"{name}:{','.join(str(value) for _, value in labels)}": value
+                for (name, labels), value in self._gauge_values().items()
+            }
+        return {"histograms": operations, "counters": counters, "gauges": gauges}
+
+    def serve(self, port, host="0.0.0.0"):
+        """
+        在后台线程中启动 Prometheus 文本格式的 /metrics 端点
+        :return: HTTP 服务器，调用方负责 shutdown
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def start_log_reporter(self, interval=30):
+        """
+        每隔 interval 秒通过 loguru 输出一行结构化指标日志
+        :return: 停止事件，set() 后停止输出
+        """
+        stop = threading.Event()
+
+        def report():
+            while not stop.wait(interval):
+                snapshot = self.snapshot()
+                logger.bind(metrics=snapshot).info("metrics {}", json.dumps(snapshot, ensure_ascii=False))
+
+        threading.Thread(target=report, name="metrics-log", daemon=True).start()
+        return stop
+
+def _scaled(value, scale):
+    if value is None or value == float("inf"):
+        return value
+    return round(value * scale, 3)
+
+def instrumented(operation):
+    """
+    方法装饰器：实例的 metrics 属性不为 None 时记录耗时和结果
+    :param operation: 操作名
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            with self.metrics.timer(operation):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+测试配置：scripts/ 下的脚本以同级模块互相导入，测试时将其加入 sys.path
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""AttackGraphCache：增量写入、窗口淘汰和本地路径查询"""
+
+import datetime
+import threading
+
+from attack_graph_cache import AttackGraphCache
+
+def _chain_cache(**kwargs):
+    cache = AttackGraphCache(authoritative_since=0, **kwargs)
+    cache.add_edge("1.1.1.1", "10.0.0.1", "PHISHING", 100)
+    cache.add_edge("10.0.0.1", "10.0.0.2", "LATERAL_MOVEMENT", 200)
+    cache.add_edge("10.0.0.2", "10.0.0.3", "DATA_EXFILTRATION", 300)
+    return cache
+
+def test_reverse_reachable():
+    cache = _chain_cache()
+    assert cache.reverse_reachable("10.0.0.3") == {"10.0.0.2": 1, "10.0.0.1": 2, "1.1.1.1": 3}
+    assert cache.reverse_reachable("10.0.0.3", max_hops=1) == {"10.0.0.2": 1}
+    assert cache.reverse_reachable("10.0.0.3", attack_types=["DATA_EXFILTRATION"]) == {"10.0.0.2": 1}
+    assert cache.reverse_reachable("unknown") == {}
+
+def test_trace_paths():
+    cache = _chain_cache()
+    paths = cache.trace_paths("10.0.0.3", max_hops=5)
+    assert [[node["ip"] for node in path["nodes"]] for path in paths] == [
+        ["10.0.0.2", "10.0.0.3"],
+        ["10.0.0.1", "10.0.0.2", "10.0.0.3"],
+        ["1.1.1.1", "10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    ]
+    assert len(cache.trace_paths("10.0.0.3", limit=2)) == 2
+
+def test_trace_paths_time_ordered():
+    cache = _chain_cache()
+    # 比下一跳更晚的边不能构成时间有序的路径
+    cache.add_edge("9.9.9.9", "10.0.0.2", "XSS", 400)
+    cache.add_edge("8.8.8.8", "9.9.9.9", "XSS", 350)
+    sources = {path["nodes"][0]["ip"] for path in cache.trace_paths("10.0.0.3", time_ordered=True)}
+    assert "8.8.8.8" not in sources
+    assert "9.9.9.9" not in sources
+
+def test_window_eviction_and_late_edges():
+    cache = AttackGraphCache(window_seconds=100, authoritative_since=0)
+    for i in range(20):
+        assert cache.add_edge(f"1.1.1.{i}", "10.0.0.1", "XSS", i * 10)
+    assert cache._latest - cache._earliest <= 110
+    # 早于窗口起点的迟到边不加入缓存，也不触发重建
+    assert not cache.add_edge("2.2.2.2", "10.0.0.1", "XSS", 0)
+    assert cache.stats()["late_edges"] == 1
+    assert not cache.covers(0)
+    assert cache.covers(cache.authoritative_since)
+
+def test_max_edges_bound():
+    cache = AttackGraphCache(window_seconds=10 ** 9, max_edges=100, authoritative_since=0)
+    for i in range(1000):
+        cache.add_edge(f"1.1.{i // 250}.{i % 250}", "10.0.0.1", "XSS", i)
+    assert len(cache) <= 100
+    assert all(edge["source_ip"] != "1.1.0.0" for edge in cache.iter_edges())
+
+def test_bucket_mode_merges_parallel_edges():
+    cache = AttackGraphCache(authoritative_since=0, bucket_seconds=3600)
+    cache.add_edge("1.1.1.1", "10.0.0.1", "XSS", 1800)
+    cache.add_edge("1.1.1.1", "10.0.0.1", "XSS", 600)
+    cache.add_edge("1.1.1.1", "10.0.0.1", "XSS", 4000)
+    timestamps = sorted(edge["timestamp"] for edge in cache.iter_edges())
+    # 同一时间桶的边合并为一条，时间取最早
+    assert timestamps == [datetime.datetime.fromtimestamp(600).isoformat(),
+                          datetime.datetime.fromtimestamp(4000).isoformat()]
+
+def test_concurrent_writes_and_queries():
+    cache = AttackGraphCache(window_seconds=50, max_edges=500, authoritative_since=0)
+    errors = []
+
+    def write(offset):
+        try:
+            for i in range(2000):
+                cache.add_edge(f"1.1.{offset}.{i % 200}", f"10.0.0.{i % 5}", "XSS", i)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            for _ in range(500):
+                cache.trace_paths("10.0.0.1", max_hops=3, limit=20)
+                cache.reverse_reachable("10.0.0.2")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(3)] + [threading.Thread(target=read)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
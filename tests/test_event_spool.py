@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""EventSpool 的崩溃恢复与 SpoolDrainer 的回放、dead letter"""
+
+import json
+import os
+
+import pytest
+
+from event_spool import DEAD_LETTER_FILE, EventSpool, SpoolDrainer, is_transient
+
+def test_read_commit_and_reopen(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=4096)
+    for i in range(5):
+        spool.append_event({"seq": i})
+    events, position = spool.read_batch(3)
+    assert [event["seq"] for event in events] == [0, 1, 2]
+    spool.commit(position)
+    spool.append_event({"seq": 5})
+    spool.close()
+
+    # 重新打开后从 checkpoint 继续，写入位置在最后一条完整记录之后
+    reopened = EventSpool(str(tmp_path), segment_bytes=4096)
+    reopened.append_event({"seq": 6})
+    events, _ = reopened.read_batch(100)
+    assert [event["seq"] for event in events] == [3, 4, 5, 6]
+    reopened.close()
+
+def test_uncommitted_records_are_replayed_after_restart(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=4096)
+    spool.append_event({"seq": 0})
+    spool.read_batch(10)
+    spool.close()
+    reopened = EventSpool(str(tmp_path), segment_bytes=4096)
+    events, _ = reopened.read_batch(10)
+    assert events == [{"seq": 0}]
+    reopened.close()
+
+def test_segments_roll_and_are_deleted_after_commit(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=256)
+    for i in range(40):
+        spool.append_event({"seq": i, "pad": "x" * 20})
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".seg")]) > 1
+    seen = []
+    while True:
+        events, position = spool.read_batch(7)
+        if not events:
+            break
+        seen.extend(event["seq"] for event in events)
+        spool.commit(position)
+    assert seen == list(range(40))
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".seg")]) == 1
+    spool.close()
+
+def test_oversized_record_is_rejected(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=64)
+    with pytest.raises(ValueError):
+        spool.append_event({"pad": "x" * 100})
+    spool.close()
+
+def test_is_transient():
+    assert is_transient(ConnectionError("down"))
+    assert not is_transient(ValueError("bad"))
+    assert not is_transient(KeyError("source_ip"))
+
+def test_drainer_dead_letters_bad_records(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=4096)
+    for i in range(4):
+        spool.append_event({"seq": i, "bad": i == 2})
+    written = []
+
+    def sink(events):
+        if any(event["bad"] for event in events):
+            raise ValueError("映射冲突")
+        written.extend(event["seq"] for event in events)
+
+    drainer = SpoolDrainer(spool, sink, batch_size=10)
+    assert drainer._drain_once() == 4
+    assert written == [0, 1, 3]
+    assert drainer.stats()["dead_lettered"] == 1
+    with open(tmp_path / DEAD_LETTER_FILE, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["event"]["seq"] for record in records] == [2]
+    assert spool.read_batch(10)[0] == []
+    spool.close()
+
+def test_drainer_keeps_records_on_transient_errors(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=4096)
+    spool.append_event({"seq": 0})
+
+    def sink(events):
+        raise ConnectionError("down")
+
+    drainer = SpoolDrainer(spool, sink)
+    with pytest.raises(ConnectionError):
+        drainer._drain_once()
+    assert spool.read_batch(10)[0] == [{"seq": 0}]
+    spool.close()
+
+def test_drainer_thread_drains_and_stops(tmp_path):
+    spool = EventSpool(str(tmp_path), segment_bytes=4096)
+    written = []
+    drainer = SpoolDrainer(spool, written.extend, idle_interval=0.01).start()
+    for i in range(10):
+        spool.append_event({"seq": i})
+    assert drainer.stop(timeout=5)
+    assert [event["seq"] for event in written] == list(range(10))
+    spool.close()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""IngestService：使用 StubGraphBackend，不需要 Neo4j"""
+
+from http.server import ThreadingHTTPServer
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import ingest_service
+from ingest_service import IngestService, StubGraphBackend, make_http_handler
+from killchain_detector import KillChainDetector
+
+def _event(i, source_ip="10.0.0.1", target_ip="10.0.0.2", attack_type="SQL_INJECTION"):
+    return {"source_ip": source_ip, "target_ip": target_ip, "attack_type": attack_type,
+            "timestamp": f"2024-01-01T00:00:{i % 60:02d}", "seq": i}
+
+class FlakyBackend(StubGraphBackend):
+    """前 failures 次写入抛出暂时性错误；含 poison 字段的事件永久失败"""
+
+    def __init__(self, failures=0, write_delay=0.0):
+        super().__init__(write_delay)
+        self.failures = failures
+        self.calls = 0
+
+    def create_attack_paths(self, events, batch_size=None, max_linger=None):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("neo4j 暂时不可用")
+        if any(event.get("poison") for event in events):
+            raise ValueError("无效的事件")
+        return super().create_attack_paths(events, batch_size, max_linger)
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ingest_service, "INGEST_MAX_BACKOFF", 0)
+
+@pytest.fixture
+def http_service():
+    """启动服务和 HTTP 监听，产出 (服务, 后端, POST 函数)"""
+    started = []
+
+    def start(backend, ack_timeout=5.0, **kwargs):
+        service = IngestService(backend, **kwargs)
+        service.start()
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_http_handler(service, ack_timeout))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        started.append((service, server))
+        url = f"http://127.0.0.1:{server.server_address[1]}/events"
+
+        def post(body):
+            data = body if isinstance(body, bytes) else json.dumps(body).encode()
+            request = urllib.request.Request(url, data=data, method="POST")
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    return response.status, json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                return e.code, json.loads(e.read())
+
+        return service, post
+
+    yield start
+    for service, server in started:
+        server.shutdown()
+        server.server_close()
+        service.stop(timeout=5)
+
+def test_batches_by_size_and_flushes_on_stop():
+    backend = StubGraphBackend()
+    service = IngestService(backend, batch_size=10, linger=0.05, writers=1)
+    for i in range(25):
+        assert service.submit(_event(i))
+    service.start()
+    service.stop(timeout=5)
+    metrics = service.metrics()
+    assert metrics["written"] == 25
+    assert metrics["batches"] == 3
+    assert metrics["queue_depth"] == 0
+    assert [event["seq"] for event in backend.edges] == list(range(25))
+
+def test_linger_flushes_partial_batch():
+    backend = StubGraphBackend()
+    service = IngestService(backend, batch_size=1000, linger=0.05, writers=1)
+    service.start()
+    try:
+        ack = service.submit_many([_event(i) for i in range(3)])
+        assert ack.done.wait(5)
+        assert len(backend.edges) == 3
+    finally:
+        service.stop(timeout=5)
+
+def test_invalid_events_are_counted_and_dropped():
+    backend = StubGraphBackend()
+    service = IngestService(backend, batch_size=10, linger=0.01, writers=1)
+    service.start()
+    try:
+        ack = service.submit_many([_event(0), {"source_ip": "10.0.0.1"}, "not an event",
+                                   dict(_event(1), attack_type=None, event_type="XSS")])
+        assert ack.count == 2
+        assert ack.done.wait(5)
+    finally:
+        service.stop(timeout=5)
+    assert service.metrics()["invalid"] == 2
+    assert len(backend.edges) == 2
+
+def test_transient_errors_retry_the_same_batch():
+    backend = FlakyBackend(failures=3)
+    service = IngestService(backend, batch_size=10, linger=0.01, writers=1)
+    service.start()
+    try:
+        ack = service.submit_many([_event(i) for i in range(5)])
+        assert ack.done.wait(5)
+    finally:
+        service.stop(timeout=5)
+    metrics = service.metrics()
+    assert metrics["retries"] == 3
+    assert metrics["written"] == 5
+    assert metrics["failed"] == 0
+    assert ack.rejected == 0
+    assert len(backend.edges) == 5
+
+def test_permanent_errors_reject_only_the_bad_events():
+    backend = FlakyBackend()
+    service = IngestService(backend, batch_size=10, linger=0.01, writers=1)
+    service.start()
+    try:
+        events = [_event(i) for i in range(4)]
+        events[2]["poison"] = True
+        ack = service.submit_many(events)
+        assert ack.done.wait(5)
+    finally:
+        service.stop(timeout=5)
+    assert ack.rejected == 1
+    assert service.metrics()["failed"] == 1
+    assert sorted(event["seq"] for event in backend.edges) == [0, 1, 3]
+
+def test_http_acks_only_after_the_batch_is_written(http_service):
+    backend = StubGraphBackend(write_delay=0.2)
+    service, post = http_service(backend, batch_size=100, linger=0.01)
+    status, body = post([_event(i) for i in range(3)])
+    assert status == 200
+    assert body == {"accepted": 3, "rejected": 0}
+    # 返回时事件已经写入后端
+    assert len(backend.edges) == 3
+
+def test_http_reports_rejected_events(http_service):
+    backend = FlakyBackend()
+    service, post = http_service(backend, batch_size=100, linger=0.01)
+    status, body = post([_event(0), dict(_event(1), poison=True)])
+    assert status == 200
+    assert body == {"accepted": 1, "rejected": 1}
+
+def test_http_ack_timeout_returns_503(http_service):
+    backend = StubGraphBackend(write_delay=1.0)
+    service, post = http_service(backend, ack_timeout=0.1, batch_size=100, linger=0.01)
+    status, body = post([_event(0)])
+    assert status == 503
+
+def test_http_body_formats(http_service):
+    backend = StubGraphBackend()
+    service, post = http_service(backend, batch_size=100, linger=0.01)
+    ndjson = "\n".join(json.dumps(_event(i)) for i in range(2)).encode()
+    assert post(ndjson) == (200, {"accepted": 2, "rejected": 0})
+    # 跨多行的单个 JSON 对象
+    assert post(json.dumps(_event(5), indent=2).encode()) == (200, {"accepted": 1, "rejected": 0})
+    status, _ = post(b"{not json")
+    assert status == 400
+    status, _ = post(b"42")
+    assert status == 400
+
+def test_http_rejects_requests_larger_than_the_queue(http_service):
+    backend = StubGraphBackend()
+    service, post = http_service(backend, queue_size=2, batch_size=100, linger=0.01)
+    status, body = post([_event(i) for i in range(3)])
+    assert status == 413
+    assert body["accepted"] == 0
+
+def test_detector_sees_events_in_submission_order():
+    detector = KillChainDetector(patterns={"chain": ["PHISHING", "LATERAL_MOVEMENT", "DATA_EXFILTRATION"]})
+    backend = StubGraphBackend(write_delay=0.01)
+    service = IngestService(backend, batch_size=1, linger=0, writers=4, detector=detector)
+    service.start()
+    events = [
+        _event(0, "1.1.1.1", "10.0.0.1", "PHISHING"),
+        _event(1, "10.0.0.1", "10.0.0.2", "LATERAL_MOVEMENT"),
+        _event(2, "10.0.0.2", "10.0.0.3", "DATA_EXFILTRATION")
+    ]
+    for event in events:
+        service.submit(event)
+    service.stop(timeout=5)
+    assert service.metrics()["killchain_alerts"] == 1
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""KillChainDetector：按时间顺序的多跳模式匹配"""
+
+from killchain_detector import KillChainDetector
+
+PATTERNS = {
+    "phishing_to_exfiltration": ["PHISHING", "LATERAL_MOVEMENT+", "DATA_EXFILTRATION"],
+    "lateral_to_ransomware": ["LATERAL_MOVEMENT+", "RANSOMWARE"]
+}
+
+def _event(source_ip, target_ip, attack_type, second):
+    return {"source_ip": source_ip, "target_ip": target_ip, "attack_type": attack_type,
+            "timestamp": f"2024-01-01T00:{second // 60:02d}:{second % 60:02d}"}
+
+def _chain():
+    return [
+        _event("1.1.1.1", "10.0.0.1", "PHISHING", 0),
+        _event("10.0.0.1", "10.0.0.2", "LATERAL_MOVEMENT", 10),
+        _event("10.0.0.2", "10.0.0.3", "LATERAL_MOVEMENT", 20),
+        _event("10.0.0.3", "10.0.0.4", "DATA_EXFILTRATION", 30)
+    ]
+
+def test_detects_multi_hop_chain():
+    detector = KillChainDetector(patterns=PATTERNS)
+    alerts = list(detector.process_many(_chain()))
+    matched = [alert for alert in alerts if alert["pattern"] == "phishing_to_exfiltration"]
+    assert len(matched) == 1
+    alert = matched[0]
+    assert alert["hosts"] == ["1.1.1.1", "10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"]
+    assert alert["attack_types"] == ["PHISHING", "LATERAL_MOVEMENT", "LATERAL_MOVEMENT", "DATA_EXFILTRATION"]
+    assert alert["duration_sec"] == 30
+
+def test_out_of_order_hops_do_not_match():
+    detector = KillChainDetector(patterns=PATTERNS)
+    events = _chain()
+    events[1]["timestamp"] = "2024-01-01T00:00:40"
+    events[2]["timestamp"] = "2024-01-01T00:00:50"
+    alerts = list(detector.process_many(events))
+    assert not [alert for alert in alerts if alert["pattern"] == "phishing_to_exfiltration"]
+
+def test_chain_must_fit_in_window():
+    detector = KillChainDetector(patterns=PATTERNS, window_seconds=15)
+    alerts = list(detector.process_many(_chain()))
+    assert not [alert for alert in alerts if alert["pattern"] == "phishing_to_exfiltration"]
+
+def test_repeatable_last_step_alerts_on_each_match():
+    detector = KillChainDetector(patterns={"lateral": ["PHISHING", "LATERAL_MOVEMENT+"]})
+    alerts = list(detector.process_many(_chain()[:3]))
+    assert len(alerts) == 2
+
+def test_incomplete_events_are_ignored():
+    detector = KillChainDetector(patterns=PATTERNS)
+    assert detector.process({"source_ip": "1.1.1.1"}) == []
+    assert detector.stats()["events"] == 0
+
+def test_host_state_is_bounded():
+    detector = KillChainDetector(patterns=PATTERNS, max_hosts=3)
+    for i in range(10):
+        detector.process(_event("1.1.1.1", f"10.0.1.{i}", "PHISHING", i))
+    stats = detector.stats()
+    assert stats["tracked_hosts"] == 3
+    assert stats["evicted_hosts"] == 7
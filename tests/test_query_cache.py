@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""QueryCache：LRU、TTL 和按 IP 失效"""
+
+from query_cache import ANY_IP, QueryCache, compact_paths, expand_paths
+
+def test_hit_and_miss():
+    cache = QueryCache()
+    assert cache.get("k") == (False, None)
+    cache.put("k", ("value",), {"10.0.0.1"})
+    assert cache.get("k") == (True, ("value",))
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+def test_lru_eviction():
+    cache = QueryCache(max_entries=2)
+    cache.put("a", 1, ())
+    cache.put("b", 2, ())
+    cache.get("a")
+    cache.put("c", 3, ())
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.stats()["evictions"] == 1
+
+def test_ttl_expiry():
+    cache = QueryCache(ttl=-1)
+    cache.put("k", 1, ())
+    assert cache.get("k") == (False, None)
+    assert cache.stats()["expired"] == 1
+    assert len(cache) == 0
+
+def test_invalidate_only_affected_ips():
+    cache = QueryCache()
+    cache.put("a", 1, {"10.0.0.1", "10.0.0.2"})
+    cache.put("b", 2, {"10.0.0.3"})
+    assert cache.invalidate_ips(["10.0.0.2"]) == 1
+    assert cache.get("a") == (False, None)
+    assert cache.get("b") == (True, 2)
+
+def test_truncated_entries_invalidated_by_any_write():
+    cache = QueryCache()
+    cache.put("truncated", 1, {ANY_IP})
+    assert cache.invalidate_ips(["192.168.0.1"]) == 1
+    assert len(cache) == 0
+
+def test_compact_paths_round_trip_is_isolated():
+    paths = [{"nodes": [{"ip": "a"}, {"ip": "b"}], "relationships": [{"type": "XSS", "timestamp": "t"}]}]
+    compact = compact_paths(paths)
+    expanded = expand_paths(compact)
+    assert expanded == paths
+    expanded[0]["nodes"][0]["ip"] = "changed"
+    assert expand_paths(compact) == paths
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""CircuitBreaker 与 retry_call"""
+
+import random
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, backoff_delay, retry_call
+
+def _fail():
+    raise ConnectionError("down")
+
+def test_breaker_opens_after_threshold_and_rejects():
+    breaker = CircuitBreaker("graph", failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+    assert breaker.rejected == 1
+
+def test_breaker_half_open_probe_recovers():
+    breaker = CircuitBreaker("graph", failure_threshold=1, reset_timeout=0.01)
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    time.sleep(0.02)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_breaker_allows_one_probe_at_a_time():
+    breaker = CircuitBreaker("graph", failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+def test_breaker_ignores_non_backend_errors():
+    breaker = CircuitBreaker("graph", failure_threshold=1)
+    with pytest.raises(ValueError):
+        breaker.call(lambda: int("x"), is_failure=lambda e: not isinstance(e, ValueError))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_state_change_callback_fires_once_per_transition():
+    changes = []
+    breaker = CircuitBreaker("graph", failure_threshold=2, reset_timeout=0.01, on_state_change=changes.append)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_success()
+    breaker.record_success()
+    assert changes == [CircuitBreaker.OPEN, CircuitBreaker.CLOSED]
+
+def test_retry_call_retries_retryable_errors():
+    attempts = []
+    retried = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("down")
+        return "ok"
+
+    result = retry_call(flaky, lambda e: isinstance(e, ConnectionError), max_attempts=5,
+                        sleep=lambda delay: None, on_retry=retried.append)
+    assert result == "ok"
+    assert len(attempts) == 3
+    assert len(retried) == 2
+
+def test_retry_call_gives_up():
+    with pytest.raises(ConnectionError):
+        retry_call(_fail, lambda e: True, max_attempts=3, sleep=lambda delay: None)
+
+def test_retry_call_does_not_retry_other_errors():
+    attempts = []
+
+    def bad():
+        attempts.append(1)
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        retry_call(bad, lambda e: isinstance(e, ConnectionError), sleep=lambda delay: None)
+    assert len(attempts) == 1
+
+def test_backoff_delay_is_capped_full_jitter():
+    rng = random.Random(1)
+    delays = [backoff_delay(attempt, 0.1, 1.0, rng) for attempt in range(20)]
+    assert all(0 <= delay <= min(1.0, 0.1 * 2 ** attempt) for attempt, delay in enumerate(delays))
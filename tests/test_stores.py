@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""内存图存储与内存事件存储"""
+
+import datetime
+
+import pytest
+
+from stores import InMemoryEventStore, InMemoryGraphStore, duration_seconds
+
+NOW = datetime.datetime(2024, 1, 2).timestamp()
+
+def _iso(seconds_ago):
+    return datetime.datetime.fromtimestamp(NOW - seconds_ago).isoformat()
+
+def _aggregate(first_seen, last_seen, count, severity, rank, campaigns, bucket=0):
+    return {"source_ip": "1.1.1.1", "target_ip": "10.0.0.1", "attack_type": "XSS", "bucket": bucket,
+            "first_seen": first_seen, "last_seen": last_seen, "count": count, "max_severity": severity,
+            "severity_rank": rank, "campaigns": campaigns}
+
+def test_duration_seconds():
+    assert duration_seconds("15m") == 900
+    assert duration_seconds("7d") == 7 * 86400
+    with pytest.raises(ValueError):
+        duration_seconds("soon")
+
+def test_graph_store_event_edges_and_trace():
+    store = InMemoryGraphStore()
+    store.add_edges([
+        {"source_ip": "1.1.1.1", "target_ip": "10.0.0.1", "attack_type": "PHISHING", "timestamp": _iso(20)},
+        {"source_ip": "10.0.0.1", "target_ip": "10.0.0.2", "attack_type": "LATERAL_MOVEMENT", "timestamp": _iso(10)}
+    ])
+    paths = store.trace_paths("10.0.0.2", 3, "all", True, None, None, None, 10, False)
+    assert [[node["ip"] for node in path["nodes"]] for path in paths] == [
+        ["10.0.0.1", "10.0.0.2"], ["1.1.1.1", "10.0.0.1", "10.0.0.2"]
+    ]
+    with pytest.raises(ValueError):
+        store.trace_paths("10.0.0.2", 0, "all", False, None, None, None, 10, False)
+    with pytest.raises(NotImplementedError):
+        store.run_write("MATCH (n) RETURN n", {})
+
+def test_graph_store_merge_accumulates_like_neo4j():
+    store = InMemoryGraphStore()
+    store.merge_edges([_aggregate(_iso(30), _iso(20), 2, "LOW", 1, ["run/attack-0"])])
+    store.merge_edges([_aggregate(_iso(40), _iso(10), 3, "HIGH", 3, ["run/attack-1", "run/attack-0"])])
+    store.merge_edges([_aggregate(_iso(35), _iso(35), 1, "MEDIUM", 2, [])])
+    edges = list(store.iter_edges(None))
+    assert len(edges) == 1
+    # 边的时间戳随 first_seen 前移
+    assert edges[0]["timestamp"] == _iso(40)
+    assert store.aggregates[("1.1.1.1", "10.0.0.1", "XSS", 0)] == {
+        "first_seen": _iso(40), "last_seen": _iso(10), "count": 6, "max_severity": "HIGH", "severity_rank": 3,
+        "campaigns": ["run/attack-0", "run/attack-1"]
+    }
+
+def test_graph_store_merge_keeps_buckets_apart():
+    store = InMemoryGraphStore()
+    store.merge_edges([_aggregate(_iso(30), _iso(30), 1, "LOW", 1, [], bucket=0),
+                       _aggregate(_iso(20), _iso(20), 1, "LOW", 1, [], bucket=3600)])
+    assert len(list(store.iter_edges(None))) == 2
+
+def _event_store():
+    store = InMemoryEventStore(clock=lambda: NOW)
+    events = [
+        ("1.1.1.1", "10.0.0.1", "XSS", "LOW", 30),
+        ("1.1.1.1", "10.0.0.2", "XSS", "HIGH", 3600 + 30),
+        ("2.2.2.2", "1.1.1.1", "DDoS", "HIGH", 60),
+        ("3.3.3.3", "10.0.0.1", "DDoS", "CRITICAL", 2 * 86400)
+    ]
+    for source_ip, target_ip, event_type, severity, seconds_ago in events:
+        store.index_event({"source_ip": source_ip, "target_ip": target_ip, "event_type": event_type,
+                           "severity": severity, "@timestamp": _iso(seconds_ago)})
+    return store
+
+def test_event_store_related_events():
+    store = _event_store()
+    response = store.search_related("1.1.1.1", "1d")
+    assert response["hits"]["total"]["value"] == 2
+    assert store.search_related("1.1.1.1", "1h")["hits"]["total"]["value"] == 1
+    assert store.search_related("3.3.3.3", "1d")["hits"]["total"]["value"] == 0
+    hits = list(store.iter_related("1.1.1.1", "1d", fields=["target_ip"], include_target=True))
+    # 按时间升序，包含作为目标的事件
+    assert [hit["_source"] for hit in hits] == [{"target_ip": "10.0.0.2"}, {"target_ip": "1.1.1.1"},
+                                                {"target_ip": "10.0.0.1"}]
+
+def test_event_store_aggregations():
+    store = _event_store()
+    top = store.top_values("event_type", 10, "7d", None, False)
+    assert top == {"event_type": ["DDoS", "XSS"], "count": [2, 2]}
+    filtered = store.top_values("source_ip", 10, "1d", {"severity": ["HIGH", "CRITICAL"]}, False)
+    assert filtered == {"source_ip": ["1.1.1.1", "2.2.2.2"], "count": [1, 1]}
+    histogram = store.histogram("1h", ["event_type"], "1d", None, 1000, False)
+    assert sum(histogram["count"]) == 3
+    assert set(histogram["event_type"]) == {"XSS", "DDoS"}
+    with pytest.raises(ValueError):
+        store.histogram(None, None, "1d", None, 1000, False)
+    with pytest.raises(ValueError):
+        store.top_values("details", 10, "1d", None, False)
+
+def test_event_store_bulk_writer():
+    store = InMemoryEventStore(clock=lambda: NOW)
+    with store.bulk_writer() as writer:
+        writer.add({"source_ip": "1.1.1.1", "@timestamp": _iso(1)})
+    assert writer.summary()["indexed"] == 1
+    assert len(store) == 1